@@ -1,2 +1,4 @@
 from .dispatch_container_register_admin import DispatchContainerRegisterAdmin
 from .dispatch_item_register_admin import DispatchItemRegisterAdmin
+from .dispatch_register_archive_admin import (DispatchContainerRegisterArchiveAdmin,
+                                              DispatchItemRegisterArchiveAdmin)
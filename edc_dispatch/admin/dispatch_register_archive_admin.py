@@ -0,0 +1,63 @@
+from django.contrib import admin
+
+from ..models import DispatchContainerRegisterArchive, DispatchItemRegisterArchive
+
+
+class BaseDispatchArchiveAdmin(admin.ModelAdmin):
+    """Read-only admin for archived dispatch registers."""
+
+    date_hierarchy = 'return_datetime'
+    ordering = ['-return_datetime', ]
+    actions = None
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class DispatchContainerRegisterArchiveAdmin(BaseDispatchArchiveAdmin):
+    list_display = (
+        'producer',
+        'container_model_name',
+        'container_identifier',
+        'dispatch_datetime',
+        'return_datetime',
+        'archive_datetime'
+    )
+
+    list_filter = (
+        'producer',
+        'container_model_name',
+        'dispatch_datetime',
+        'return_datetime'
+    )
+
+    search_fields = ('id', 'container_identifier', )
+admin.site.register(DispatchContainerRegisterArchive, DispatchContainerRegisterArchiveAdmin)
+
+
+class DispatchItemRegisterArchiveAdmin(BaseDispatchArchiveAdmin):
+    list_display = (
+        'dispatch_container_register_pk',
+        'producer',
+        'item_model_name',
+        'item_identifier',
+        'dispatch_datetime',
+        'return_datetime',
+        'archive_datetime'
+    )
+
+    list_filter = (
+        'producer',
+        'item_model_name',
+        'dispatch_datetime',
+        'return_datetime'
+    )
+
+    search_fields = ('dispatch_container_register_pk', 'item_identifier')
+admin.site.register(DispatchItemRegisterArchive, DispatchItemRegisterArchiveAdmin)
@@ -4,3 +4,17 @@ from .base_dispatch_controller import BaseDispatchController
 from .controller_register import registered_controllers
 from .dispatch_controller import DispatchController
 from .return_controller import ReturnController
+from .register_archiver import RegisterArchiver
+from .reconciler import Reconciler
+from .model_digest import ModelDigest
+from .repair_controller import RepairController
+from .dispatch_bundle import DispatchBundleWriter, DispatchBundleReader
+from .payload_compressor import PayloadCompressor
+from .row_codec import JsonRowCodec, PackedRowCodec
+from .fan_out_writer import FanOutWriter
+from .reference_data import ReferenceData
+from .dispatch_scheduler import ContainerPayload, DispatchScheduler
+from .dispatch_job_runner import DispatchJobRunner
+from .process_pool_encoder import ProcessPoolEncoder
+from .pipeline import Pipeline
+from .upsert_writer import UpsertWriter
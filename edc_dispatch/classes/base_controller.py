@@ -1,13 +1,17 @@
+import json
 import logging
 import socket
 
+from collections import OrderedDict
+
 from datetime import datetime
 
 from django.conf import settings
 from django.core import serializers
 from django.core.exceptions import ImproperlyConfigured
 from django.core.serializers.base import DeserializationError
-from django.db import IntegrityError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, IntegrityError, transaction
 from django.db.models import ForeignKey, OneToOneField
 from django.db.models import Q, Count, Max
 from django.apps import apps
@@ -27,8 +31,12 @@ from edc_entry.models import BaseEntryMetaData
 from edc_subject.visit_schedule.models import VisitDefinition, ScheduleGroup
 
 from ..exceptions import ControllerBaseModelError
+from ..models import DispatchBatch, DispatchCheckpoint
 
 from .controller_register import registered_controllers
+from .pipeline import Pipeline
+from .reference_data import ReferenceData
+from .upsert_writer import UpsertWriter
 
 
 logger = logging.getLogger(__name__)
@@ -71,6 +79,37 @@ class BaseController(BaseProducer):
 
         Keywords:
             ``server_device_id``: settings.DEVICE_ID for server (default='99')
+            ``bundle``: a :class:`DispatchBundleWriter`. If set, instances are written
+                        to the bundle file instead of to ``using_destination``.
+            ``payload``: a :class:`ContainerPayload`. If set, the serialized chunks are
+                        collected in the payload instead of saved on ``using_destination``,
+                        to be saved later by :func:`write_payload`. Unlike a ``bundle``,
+                        the destination is live so reference data, checkpoints and
+                        foreign keys already on the destination are checked as usual.
+            ``pipeline_depth``: if set, a queryset sent to :func:`_to_json` is read and
+                        serialized in pages in a reader thread while the previous pages
+                        are written, with at most this many pages waiting
+                        (default=settings.DISPATCH_PIPELINE_DEPTH or 0, off). Not used
+                        inside a transaction, see :func:`use_pipeline`.
+            ``process_pool_threshold``: if set, a queryset sent to :func:`_to_json` with at least
+                        this many instances is fetched, with its crypts, and encoded by a
+                        :class:`ProcessPoolEncoder` (default=settings.DISPATCH_PROCESS_POOL_THRESHOLD
+                        or None, off).
+            ``writer``: 'save' to save each instance, retrying those that fail on integrity,
+                        or 'upsert' to save each chunk with the destination's native upsert,
+                        see :class:`UpsertWriter` (default=settings.DISPATCH_WRITER or 'save').
+            ``skip_present``: if True, foreign key instances already on the destination are
+                        not sent again. Off by default, as before, so an instance edited
+                        on the source is still re-sent (default=settings.DISPATCH_SKIP_PRESENT
+                        or False). See also ``compare_modified``.
+            ``compare_modified``: if True, an instance on the destination is only taken as
+                        present if not modified on the source since
+                        (default=settings.DISPATCH_COMPARE_MODIFIED or True).
+            ``lock_holder``: holder of the producer lock, see :class:`ControllerRegister`.
+                        Controllers with the same holder may work on the producer together
+                        (default=this host, process and thread).
+            ``lock_wait``: seconds to wait for the producer lock before raising
+                        AlreadyRegisteredController (default=settings.DISPATCH_LOCK_WAIT or 0).
 
         Settings:
             DISPATCH_APP_LABELS = a list of app_labels for apps that contain models
@@ -91,6 +130,19 @@ class BaseController(BaseProducer):
         super(BaseController, self).__init__(using_source, using_destination, **kwargs)
         self.fk_instances = []
         self.preparing_status = kwargs.get('preparing_netbook', None)
+        self.bundle = kwargs.get('bundle', None)
+        self.payload = kwargs.get('payload', None)
+        self.reference_data = ReferenceData(self.get_using_source())
+        self.pipeline_depth = kwargs.get('pipeline_depth', getattr(settings, 'DISPATCH_PIPELINE_DEPTH', 0))
+        self.pipeline_chunk_size = getattr(settings, 'DISPATCH_PIPELINE_CHUNK_SIZE', 500)
+        self.process_pool_threshold = kwargs.get(
+            'process_pool_threshold', getattr(settings, 'DISPATCH_PROCESS_POOL_THRESHOLD', None))
+        self.writer = kwargs.get('writer', getattr(settings, 'DISPATCH_WRITER', 'save'))
+        self.skip_present = kwargs.get('skip_present', getattr(settings, 'DISPATCH_SKIP_PRESENT', False))
+        self.compare_modified = kwargs.get('compare_modified', getattr(settings, 'DISPATCH_COMPARE_MODIFIED', True))
+        self.presence_chunk_size = getattr(settings, 'DISPATCH_PRESENCE_CHUNK_SIZE', 500)
+        self.lock_holder = kwargs.get('lock_holder', None)
+        self.lock_wait = kwargs.get('lock_wait', getattr(settings, 'DISPATCH_LOCK_WAIT', 0))
         if 'DISPATCH_APP_LABELS' not in dir(settings):
             raise ImproperlyConfigured('Attribute DISPATCH_APP_LABELS not found. '
                                        'Add to settings. e.g. DISPATCH_APP_LABELS '
@@ -110,6 +162,11 @@ class BaseController(BaseProducer):
             self.set_controller_state('ready')
         return self._controller_state
 
+    def producer_lock(self):
+        """Returns a context manager holding the lock on this controller's producer."""
+        return registered_controllers.producer_lock(
+            self.get_producer_name(), holder=self.lock_holder, wait=self.lock_wait, using=self.get_using_source())
+
     def has_pending_transactions(self, models):
         return self.has_incoming_transactions(models) or self.has_outgoing_transactions()
 
@@ -180,8 +237,48 @@ class BaseController(BaseProducer):
         return options
 
     def model_to_json(self, model_cls, additional_base_model_class=None, fk_to_skip=None):
-        """Sends all instances of the model class to :func:`_to_json`."""
+        """Sends all instances of the model class to :func:`_to_json`.
+
+        A reference model is skipped if the destination holds its current
+        version and, once sent, its version is recorded on the destination."""
+        if self.is_current_reference_model(model_cls):
+            logger.info('Skipping {0}. Reference data is current on {1}.'.format(
+                model_cls._meta.object_name, self.get_using_destination()))
+            return
+        version = None
+        if not self.bundle and self.reference_data.is_reference_model(model_cls):
+            version = self.reference_data.version(model_cls)
         self._to_json(model_cls.objects.all(), additional_base_model_class, fk_to_skip=fk_to_skip)
+        if version and self.payload is not None:
+            # recorded once the payload is saved
+            self.payload.on_write(self.reference_data.record, model_cls, self.get_using_destination(), version)
+        elif version:
+            self.reference_data.record(model_cls, self.get_using_destination(), version)
+
+    def is_current_reference_model(self, model_cls):
+        """Returns True if model_cls is a reference model whose current version is on the destination."""
+        return not self.bundle and self.reference_data.is_current(model_cls, self.get_using_destination())
+
+    def get_checkpoint_register(self):
+        """Returns the DispatchContainerRegister that checkpoints are recorded for or None.
+
+        See :class:`BaseDispatch`."""
+        return None
+
+    def get_batch_scope(self):
+        """Returns a tuple of (scope, run) of the :class:`DispatchBatch` ledger, or None
+        to not use the ledger, e.g. when repairing.
+
+        See :class:`BaseDispatch`."""
+        return None
+
+    def get_checkpoint(self, queryset):
+        """Returns the :class:`DispatchCheckpoint` of a queryset sent for the container or None."""
+        dispatch_container_register = self.get_checkpoint_register()
+        if not dispatch_container_register or self.bundle:
+            return None
+        return DispatchCheckpoint.objects.for_queryset(
+            dispatch_container_register, queryset, using=self.get_using_source())
 
     def is_allowed_base_model_cls(self, cls, additional_base_model_class=None):
         """Returns True or raises an exception if the class is a subclass
@@ -246,34 +343,82 @@ class BaseController(BaseProducer):
         or not."""
         return []
 
-    def get_fk_dependencies(self, instances, fk_to_skip=None):
+    def get_fk_dependencies(self, instances, fk_to_skip=None, fk_instances=None, fk_dependencies=None):
         """Updates the list of foreign key instances required for serialization of the provided instances.
 
             Args:
                 instances: an iterable of model instances
                 fk_to_skip: the field attname of a foreignkey that is assumed to be on the
                             destination device and may be skipped. To be used carefully.
+                fk_instances: the list to add the foreign key instances to (default=self.fk_instances).
+                fk_dependencies: the dictionary of (model class, pk) already added
+                            (default=the session container's 'fk_dependencies').
+
+            Foreign keys to reference models current on the destination are skipped
+            and, if ``skip_present``, so are those already on the destination (see
+            :func:`get_present_on_destination`). The instances are fetched in bulk per
+            model and added after their own foreign key instances.
         """
         if fk_to_skip:
             if not isinstance(fk_to_skip, list):
                 raise TypeError('Expected a list in \'get_fk_dependencies\'')
         else:
             fk_to_skip = []
+        fk_instances = self.fk_instances if fk_instances is None else fk_instances
+        if fk_dependencies is None:
+            fk_dependencies = self.get_session_container('fk_dependencies')
+        for cls, pks in self._get_fk_candidates(instances, fk_to_skip, fk_dependencies).items():
+            if self.skip_present and not self.bundle:
+                present = self.get_present_on_destination(cls, pks)
+                pks = [pk for pk in pks if pk not in present]
+            for index in range(0, len(pks), self.presence_chunk_size):
+                instances = list(cls.objects.filter(pk__in=pks[index:index + self.presence_chunk_size]))
+                self.get_fk_dependencies(instances, fk_instances=fk_instances, fk_dependencies=fk_dependencies)
+                fk_instances.extend(instances)
+        return fk_instances
+
+    def _get_fk_candidates(self, instances, fk_to_skip, fk_dependencies):
+        """Returns a dictionary of {model class: [pk, ...]} of the foreign keys of the
+        instances not yet in ``fk_dependencies``, adding them to it."""
+        candidates = {}
         for obj in instances:
             for field in obj._meta.fields:
-                if isinstance(field, (ForeignKey, OneToOneField)) and field.attname not in fk_to_skip:
+                if (isinstance(field, (ForeignKey, OneToOneField)) and field.attname not in fk_to_skip and
+                        not self.is_current_reference_model(field.rel.to)):
                     pk = getattr(obj, field.attname)
                     cls = field.rel.to
-                    if (cls, pk) not in self.get_session_container('fk_dependencies'):
-                        if cls.objects.filter(pk=pk).exists():
-                            this_fk = cls.objects.get(pk=pk)
-                            self.fk_instances.append(this_fk)
-                            self.get_fk_dependencies([this_fk])
-                        self.add_to_session_container((cls, pk), 'fk_dependencies')
+                    if pk is not None and (cls, pk) not in fk_dependencies:
+                        fk_dependencies[(cls, pk)] = None
+                        candidates.setdefault(cls, []).append(pk)
+        return candidates
+
+    def get_present_on_destination(self, model_cls, pks):
+        """Returns the set of pks, from ``pks``, of model_cls instances already on the destination.
+
+        The destination is queried in chunks. If ``compare_modified`` and the model
+        has a ``modified`` field, an instance modified on the source since it was
+        sent is not taken as present."""
+        present = set()
+        compare_modified = self.compare_modified and 'modified' in [field.name for field in model_cls._meta.fields]
+        pks = list(pks)
+        for index in range(0, len(pks), self.presence_chunk_size):
+            chunk = pks[index:index + self.presence_chunk_size]
+            queryset = model_cls.objects.using(self.get_using_destination()).filter(pk__in=chunk)
+            if not compare_modified:
+                present.update(queryset.values_list('pk', flat=True))
+                continue
+            modified_on_destination = dict(queryset.values_list('pk', 'modified'))
+            if modified_on_destination:
+                for pk, modified in model_cls.objects.filter(
+                        pk__in=list(modified_on_destination.keys())).values_list('pk', 'modified'):
+                    destination_modified = modified_on_destination.get(pk)
+                    if modified is None or (destination_modified is not None and destination_modified >= modified):
+                        present.add(pk)
+        return present
 
     def add_to_session_container(self, instance, key):
-        if instance not in self._session_container[key]:
-            self._session_container[key].append(instance)
+        # ordered dictionaries keyed by instance, so lookups are O(1)
+        self._session_container[key][instance] = None
 
     def load_session_container_class_counter(self, app_label):
         _models = []
@@ -284,7 +429,8 @@ class BaseController(BaseProducer):
             self._session_container['class_counter'].update({model_cls._meta.object_name, 0})
 
     def initialize_session_container(self):
-        self._session_container = {'serialized': [], 'dispatched': [], 'fk_dependencies': [], 'class_counter': {}}
+        self._session_container = {'serialized': OrderedDict(), 'dispatched': OrderedDict(),
+                                   'fk_dependencies': OrderedDict(), 'class_counter': {}}
 
     def get_session_container(self, key):
         return self._session_container[key]
@@ -319,8 +465,11 @@ class BaseController(BaseProducer):
             model_cls = model_or_app_model_tuple
         self.model_to_json(model_cls, additional_base_model_class, fk_to_skip=fk_to_skip)
 
-    def update_model_crypts(self, mld_cls_instances):
-        """Grabs all crypt objects of models being dispatched. """
+    @staticmethod
+    def update_model_crypts(mld_cls_instances):
+        """Grabs all crypt objects of models being dispatched.
+
+        Static so it can also run in a worker process, see :class:`ProcessPoolEncoder`."""
         crypt_objs_instances = []
         crypt_objs_instance = []
         if not isinstance(mld_cls_instances, (list, QuerySet)):
@@ -389,7 +538,23 @@ class BaseController(BaseProducer):
         ..warning:: This method assumes you have confirmed that the
                     model_instances are "already dispatched" or not.
 
+        A QuerySet sent for a container is checkpointed (see :class:`DispatchCheckpoint`):
+        if sent before for the container it is skipped, or resumed after the last pk
+        saved, and the checkpoint is advanced as it is saved.
         """
+        checkpoint = None
+        if isinstance(model_instance, QuerySet):
+            checkpoint = self.get_checkpoint(model_instance)
+            if checkpoint:
+                if checkpoint.is_complete:
+                    logger.info('Skipping {0}. Already sent for the container ({1} rows).'.format(
+                        checkpoint.model_name, checkpoint.row_count))
+                    return
+                model_instance = checkpoint.resume(model_instance)
+        if isinstance(model_instance, QuerySet) and self.use_process_pool(model_instance):
+            return self._to_json_process_pool(model_instance, additional_base_model_class, fk_to_skip, checkpoint)
+        if isinstance(model_instance, QuerySet) and self.use_pipeline(model_instance):
+            return self._to_json_pipelined(model_instance, additional_base_model_class, fk_to_skip, checkpoint)
         # Get all Crypts for this list of instances
         crypts_dispatched = self.update_model_crypts(model_instance)
         # convert to list if not iterable
@@ -397,6 +562,7 @@ class BaseController(BaseProducer):
             model_instance = [model_instance]
         if isinstance(model_instance, QuerySet):
             model_instance = [m for m in model_instance]
+        row_count = len(model_instance)
         # append crypts to all instances to be dispatched
         model_instances = crypts_dispatched + model_instance
         if self.has_incoming_transactions(model_instances):
@@ -417,56 +583,269 @@ class BaseController(BaseProducer):
                 break
             model_instances = self.fk_instances + model_instances
             if model_instances:
-                # serialize all
-                json_obj = serializers.serialize('json', model_instances,
-                                                 ensure_ascii=False, use_natural_keys=True, indent=2)
-                # deserialize all
-                deserialized_objects = []
+                if self.bundle:
+                    self._write_to_bundle(model_instances)
+                else:
+                    self._write_to_destination(model_instances)
+        if checkpoint:
+            checkpoint.advance(row_count, len(model_instances),
+                               last_pk=model_instance[-1].pk if model_instance else None, is_complete=True)
+
+    def _to_json_pipelined(self, queryset, additional_base_model_class=None, fk_to_skip=None, checkpoint=None):
+        """Sends a queryset to the destination page by page, reading and
+        serializing the next pages in a :class:`Pipeline` reader thread
+        while the current page is saved. The checkpoint, if any, is advanced
+        after each page is saved."""
+        if self.has_incoming_transactions([queryset.model]):
+            raise PendingTransactionError('One or more listed models have pending incoming '
+                                          'transactions on \'{0}\'. Consume them first. Got '
+                                          '\'{1}\'.'.format(self.get_using_source(), queryset.model))
+        # the reader also queries the destination for foreign keys already there
+        pipeline = Pipeline(depth=self.pipeline_depth, using=[queryset.db, self.get_using_destination()])
+        # only the reader adds to the foreign keys, merged into the session container once done
+        fk_dependencies = OrderedDict(self.get_session_container('fk_dependencies'))
+
+        def save_page(page):
+            json_obj, last_pk, row_count, object_count = page
+            self._send_to_destination(json_obj, list_items_sent=True)
+            if checkpoint:
+                checkpoint.advance(row_count, object_count, last_pk=last_pk)
+
+        pipeline.run(self._serialize_pages(queryset, additional_base_model_class, fk_to_skip, fk_dependencies),
+                     save_page)
+        self.get_session_container('fk_dependencies').update(fk_dependencies)
+        if checkpoint:
+            checkpoint.complete()
+
+    def use_pipeline(self, queryset):
+        """Returns True if the queryset may be sent by :func:`_to_json_pipelined`.
+
+        Not if writing to a bundle or a payload or inside a transaction, as the reader
+        thread has its own connection and would not see rows not yet committed."""
+        if not self.pipeline_depth or self.bundle or self.payload is not None:
+            return False
+        return not any([connections[alias].in_atomic_block for alias in connections])
+
+    def use_process_pool(self, queryset):
+        """Returns True if the queryset is large enough to be encoded by a :class:`ProcessPoolEncoder`.
+
+        Not if writing to a bundle or inside a transaction, as the encoder closes the
+        connections of this process before starting the worker processes."""
+        if not self.process_pool_threshold or self.bundle:
+            return False
+        if any([connections[alias].in_atomic_block for alias in connections]):
+            return False
+        return queryset.count() >= self.process_pool_threshold
+
+    def _to_json_process_pool(self, queryset, additional_base_model_class=None, fk_to_skip=None, checkpoint=None):
+        """Sends a queryset to the destination in chunks fetched, with their crypts, and
+        encoded by worker processes. Each chunk is saved with :func:`_save_to_destination`
+        after its foreign key instances and the checkpoint, if any, is advanced."""
+        from .process_pool_encoder import ProcessPoolEncoder
+        if self.has_incoming_transactions([queryset.model]):
+            raise PendingTransactionError('One or more listed models have pending incoming '
+                                          'transactions on \'{0}\'. Consume them first. Got '
+                                          '\'{1}\'.'.format(self.get_using_source(), queryset.model))
+        self.is_allowed_base_model_cls(queryset.model, additional_base_model_class)
+        encoder = ProcessPoolEncoder(
+            queryset.model, using=queryset.db, chunk_size=self.pipeline_chunk_size,
+            with_crypts=True, queryset=queryset)
+        pk_ranges = encoder.pk_ranges()
+        for (_, last_pk, pks), (payload, object_count) in zip(pk_ranges, encoder.chunks(pk_ranges)):
+            objects = encoder.codec.decode(payload)
+            model_instances = [deserialized_object.object for deserialized_object in serializers.deserialize(
+                'python', objects, use_natural_keys=True, using=self.get_using_source())]
+            self.fk_instances = []
+            self.get_fk_dependencies(model_instances, fk_to_skip)
+            if self.fk_instances:
+                self._write_to_destination(self.fk_instances)
+            self._send_to_destination(json.dumps(objects, cls=DjangoJSONEncoder, ensure_ascii=False))
+            if checkpoint:
+                checkpoint.advance(len(pks), object_count + len(self.fk_instances), last_pk=last_pk)
+        if checkpoint:
+            checkpoint.complete()
+
+    def _serialize_pages(self, queryset, additional_base_model_class=None, fk_to_skip=None, fk_dependencies=None):
+        """Yields, for each page of the queryset in pk order, a tuple of the
+        serialized instances, with their crypts, m2m list items missing on the
+        destination and foreign key instances, the last pk, the row count and
+        the object count.
+
+        Runs in the :class:`Pipeline` reader thread so uses its own list of foreign
+        key instances per page and adds to ``fk_dependencies``, not to the controller."""
+        fk_dependencies = OrderedDict() if fk_dependencies is None else fk_dependencies
+        last_pk = None
+        queryset = queryset.order_by('pk')
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            page = list(page[:self.pipeline_chunk_size])
+            if not page:
+                break
+            last_pk = page[-1].pk
+            self.is_allowed_base_model_instance(page[0], additional_base_model_class)
+            model_instances = self.get_m2m_list_items(page, missing=True)
+            model_instances += list(self.update_model_crypts(page)) + page
+            fk_instances = self.get_fk_dependencies(
+                model_instances, fk_to_skip, fk_instances=[], fk_dependencies=fk_dependencies)
+            yield (self._serialize_for_destination(fk_instances + model_instances),
+                   last_pk, len(page), len(fk_instances) + len(model_instances))
+
+    def get_m2m_list_items(self, model_instances, missing=False):
+        """Returns the list items of the m2m fields of the model instances,
+        once each, or only those not on the destination if ``missing``."""
+        list_items = OrderedDict()
+        for obj in model_instances:
+            for m2m_field in obj._meta.many_to_many:
+                for list_item in getattr(obj, m2m_field.name).all():
+                    list_items[list_item] = None
+        list_items = list(list_items)
+        if missing and list_items:
+            present = {}
+            for list_item in list_items:
+                present.setdefault(list_item.__class__, []).append(list_item.pk)
+            for list_item_cls, pks in present.items():
+                present[list_item_cls] = self.get_present_on_destination(list_item_cls, pks)
+            list_items = [list_item for list_item in list_items
+                          if list_item.pk not in present[list_item.__class__]]
+        return list_items
+
+    def _write_to_bundle(self, model_instances):
+        """Adds the model instances, preceded by their m2m list items, to the dispatch bundle."""
+        self.bundle.add(self.get_m2m_list_items(model_instances) + model_instances)
+
+    def _write_to_destination(self, model_instances):
+        """Serializes the model instances and saves them on the destination."""
+        self._send_to_destination(self._serialize_for_destination(model_instances))
+
+    def _send_to_destination(self, json_obj, list_items_sent=False):
+        """Saves a serialized chunk on the destination or, if ``payload`` is set, adds it to the payload."""
+        if self.payload is not None:
+            self.payload.add(json_obj, list_items_sent)
+        else:
+            self._save_to_destination(json_obj, list_items_sent)
+
+    def write_payload(self):
+        """Saves the chunks collected in ``payload`` on the destination, in order, with
+        :func:`_save_to_destination`, then calls the payload's callbacks, and returns
+        the number of objects saved.
+
+        Called by the :class:`DispatchScheduler` writer once the dispatch is done."""
+        payload, self.payload = self.payload, None
+        try:
+            saved = 0
+            for json_obj, list_items_sent in payload.chunks:
+                saved += self._save_to_destination(json_obj, list_items_sent)
+            for callback, args in payload.callbacks:
+                callback(*args)
+        finally:
+            self.payload = payload
+        return saved
+
+    def _serialize_for_destination(self, model_instances):
+        return serializers.serialize('json', model_instances, ensure_ascii=False, use_natural_keys=True)
+
+    def _save_to_destination(self, json_obj, list_items_sent=False):
+        """Deserializes and saves on the destination, retrying objects that fail on integrity.
+
+        If the controller has a batch scope (see :func:`get_batch_scope`) and ``writer``
+        is not 'upsert', the chunk is recorded by its batch id in the destination's
+        :class:`DispatchBatch` ledger once saved, and a chunk already in the ledger for
+        the same run, e.g. sent again by a retry, is skipped. An object that fails on
+        integrity but is already on the destination is taken as saved; others are retried
+        as they may depend on an object later in the chunk. If ``writer`` is 'upsert',
+        see :func:`_upsert_to_destination`.
+
+        If ``list_items_sent``, the m2m list items were sent ahead in the chunk,
+        see :func:`serialize_m2m`.
+
+        Each object is saved in its own savepoint if in a transaction, e.g. when
+        called by :func:`write_payload`, so a failed save can be retried.
+
+        Returns the number of objects saved."""
+        scope, batch_id = self.get_batch_id(json_obj)
+        if batch_id and DispatchBatch.objects.is_applied(batch_id, using=self.get_using_destination()):
+            logger.info('Skipping batch {0}. Already saved on {1}.'.format(
+                batch_id, self.get_using_destination()))
+            return 0
+        try:
+            pending = list(serializers.deserialize(
+                "json", json_obj, use_natural_keys=True, using=self.get_using_destination()))
+        except DeserializationError as e:
+            if 'Appointment matching query does not exist' in str(e):
+                return 0
+            raise
+        if self.writer == 'upsert':
+            self._upsert_to_destination(pending, list_items_sent)
+            return len(pending)
+        saved = self._save_with_retries(pending, list_items_sent)
+        if batch_id:
+            DispatchBatch.objects.record(batch_id, saved, scope=scope, using=self.get_using_destination())
+        return saved
+
+    def get_batch_id(self, json_obj):
+        """Returns a tuple of (scope, batch id) of the chunk for the :class:`DispatchBatch`
+        ledger or (None, None) if there is no batch scope or ``writer`` is 'upsert'."""
+        batch_scope = None if self.writer == 'upsert' else self.get_batch_scope()
+        if not batch_scope:
+            return None, None
+        scope, run = batch_scope
+        return scope, DispatchBatch.objects.batch_id(json_obj, '{0}:{1}'.format(scope, run))
+
+    def _save_with_retries(self, pending, list_items_sent=False):
+        """Saves the deserialized objects, retrying those that fail on integrity,
+        and returns the number saved."""
+        saved = 0
+        tries = 0
+        while pending:
+            tries += 1
+            failed = []
+            for deserialized_object in pending:
                 try:
-                    deserialized_objects = serializers.deserialize("json", json_obj, use_natural_keys=True, using=self.get_using_destination())
-                except DeserializationError as e:
-                    if 'Appointment matching query does not exist' in str(e):
-                        pass
+                    # save deserialized_object to destination
+                    with transaction.atomic(using=self.get_using_destination()):
+                        deserialized_object.save(using=self.get_using_destination())
+                except IntegrityError as integrity_error:
+                    if self.is_on_destination(deserialized_object.object):
+                        saved += 1
                     else:
-                        raise
-                # deserialized_objects = list(deserialized_objects)
-                saved = []
-                tries = 0
-                while True:
-                    tries += 1
-                    deserialized_count = 0
-                    for deserialized_object in deserialized_objects:
-                        deserialized_count = deserialized_count + 1
-                        try:
-                            if deserialized_object not in saved:
-                                # save deserialized_object to destination
-                                deserialized_object.save(using=self.get_using_destination())
-                                self.serialize_m2m(deserialized_object)
-                                saved.append(deserialized_object)
-                                self.add_to_session_container(instance, 'serialized')
-                                self.update_session_container_class_counter(instance)
-                        except IntegrityError as integrity_error:
-                            # raise IntegrityError('{}. Got {}.'.format(deserialized_object, str(integrity_error)))
-                            if integrity_error.args[1].find('Duplicate entry'):
-                                saved.append(deserialized_object)
-                            #  TODO: change the handling of the exception to something like this:
-                            #         as is raises IndexError: tuple index out of range
-#                             if 'Duplicate entry' in str(integrity_error):  # and 'hash' not in str(integrity_error):
-#                                 saved.append(deserialized_object)
-#                             elif 'columns hash, algorithm, mode are not unique' in str(integrity_error):
-#                                 # don't worry about duplicate Crypts?
-#                                 saved.append(deserialized_object)
-#                             else:
-#                                 # only include this if you are OK passing ALL integrity errors
-#                                 saved.append(deserialized_object)
-                            continue
-                    if len(saved) == deserialized_count:
-                        break
-                    if tries > 20:
-                        raise DeserializationError('Unable to deserialize object. Tries exceeded '
-                                                   'on {0}. Got {1}'.format(
-                                                       deserialized_object.object.__class__,
-                                                       str(integrity_error)))
+                        failed.append((deserialized_object, integrity_error))
+                    continue
+                self.serialize_m2m(deserialized_object, list_items_sent)
+                saved += 1
+                self.add_to_session_container(deserialized_object.object, 'serialized')
+                self.update_session_container_class_counter(deserialized_object.object)
+            if failed and (tries > 20 or len(failed) == len(pending)):
+                deserialized_object, integrity_error = failed[0]
+                raise DeserializationError('Unable to deserialize object. Tries exceeded '
+                                           'on {0}. Got {1}'.format(
+                                               deserialized_object.object.__class__,
+                                               str(integrity_error)))
+            pending = [deserialized_object for deserialized_object, _ in failed]
+        return saved
+
+    def _upsert_to_destination(self, deserialized_objects, list_items_sent=False):
+        """Upserts the deserialized objects, grouped by model, so rows already
+        on the destination, e.g. on re-dispatch, are updated without an
+        IntegrityError, then adds their m2m list items."""
+        UpsertWriter(self.get_using_destination()).write(
+            [deserialized_object.object for deserialized_object in deserialized_objects])
+        for deserialized_object in deserialized_objects:
+            self.serialize_m2m(deserialized_object, list_items_sent)
+            self.add_to_session_container(deserialized_object.object, 'serialized')
+            self.update_session_container_class_counter(deserialized_object.object)
+
+    def is_on_destination(self, instance):
+        """Returns True if the instance, by pk or natural key, is already on the destination."""
+        manager = instance.__class__._default_manager.db_manager(self.get_using_destination())
+        if manager.filter(pk=instance.pk).exists():
+            return True
+        if hasattr(instance, 'natural_key') and hasattr(manager, 'get_by_natural_key'):
+            try:
+                manager.get_by_natural_key(*instance.natural_key())
+                return True
+            except instance.__class__.DoesNotExist:
+                pass
+        return False
 
     def serialize_dependencies(self, d_obj, user_container, to_json_callback):
         """Checks for foreign keys and, if found, sends using the callback.
@@ -476,10 +855,12 @@ class BaseController(BaseProducer):
         TODO: any issue about natural keys?? this searched the destination on pk."""
         self.serialize_m2m(d_obj, user_container, to_json_callback)
 
-    def serialize_m2m(self, d_obj):
+    def serialize_m2m(self, d_obj, list_items_sent=False):
         """Checks for M2M.
 
         If found, populate the list table, then add the list items to the m2m field.
+        If ``list_items_sent``, the list table is not populated, e.g. when saving a
+        page of a :class:`Pipeline` whose reader sent the list items ahead.
         See https://docs.djangoproject.com/en/dev/topics/db/examples/many_to_many/"""
         for m2m_rel_mgr in d_obj.object._meta.many_to_many:
             pk = getattr(d_obj.object, 'pk')
@@ -491,23 +872,21 @@ class BaseController(BaseProducer):
             m2m = m2m_rel_mgr.name
             # try something like test_item_m2m.m2m.all(), gets all() list_model instances for this m2m
             m2m_qs = getattr(inst, m2m).all()
-            # create list_model instances on destination if they do not exist
-            # dst_list_item_natural_keys = []  # list of tuples returned by natural key on list item
-            dst_list_item_pks = []
-            for src_list_item in m2m_qs:
-                if not src_list_item.__class__.objects.using(
-                        self.get_using_destination()).filter(pk=src_list_item.pk).exists():
+            # create list_model instances on destination if they do not exist,
+            # checking the destination for all list items at once
+            src_list_items = list(m2m_qs)
+            if not src_list_items:
+                continue
+            list_item_cls = src_list_items[0].__class__
+            dst_list_item_pks = [src_list_item.pk for src_list_item in src_list_items]
+            if not list_items_sent:
+                present = self.get_present_on_destination(list_item_cls, dst_list_item_pks)
+                missing = [src_list_item for src_list_item in src_list_items if src_list_item.pk not in present]
+                if missing:
                     # no need to use callback, list models are not registered with dispatch
-                    self._to_json(src_list_item, additional_base_model_class=BaseListModel)
-                    # record source pk for use later
-                # dst_list_item_natural_keys.append(src_list_item.natural_key())
-                dst_list_item_pks.append(src_list_item.pk)
+                    self._to_json(missing, additional_base_model_class=BaseListModel)
             # get instance of this model on destination
             dest_inst = cls.objects.using(self.get_using_destination()).get(pk=pk)
-            # find the pk for each list model instance and add to the m2m "field"
-            # for values_tpl in dst_list_item_natural_keys:
-            for pk in dst_list_item_pks:
-                # get the list_model instance on destination
-                item_inst = src_list_item.__class__.objects.using(self.get_using_destination()).get(pk=pk)
-                # add to m2m rel_manager on destination, this is like instance.m2m.add(item)
-                getattr(dest_inst, m2m).add(item_inst)  # calls the signal
+            # add the list model instances on destination to the m2m rel_manager, like instance.m2m.add(*items)
+            getattr(dest_inst, m2m).add(*list_item_cls.objects.using(
+                self.get_using_destination()).filter(pk__in=dst_list_item_pks))  # calls the signal
@@ -5,9 +5,9 @@ from django.db.models import get_model, ForeignKey, OneToOneField
 from django.db import IntegrityError
 from django.core.exceptions import ImproperlyConfigured
 from edc.subject.visit_schedule.models import MembershipForm
-from ..exceptions import (DispatchModelError, DispatchError,
-                          AlreadyDispatched, DispatchControllerError)
-from ..models import DispatchItemRegister, DispatchContainerRegister
+from ..exceptions import (DispatchModelError, DispatchError, AlreadyDispatched,
+                          AlreadyDispatchedContainer, DispatchControllerError)
+from ..models import DispatchItemRegister, DispatchContainerRegister, DispatchSubjectIndex, DispatchCheckpoint
 from .base_controller import BaseController
 
 logger = logging.getLogger(__name__)
@@ -52,6 +52,8 @@ class BaseDispatch(BaseController):
         self._user_container_cls = None
         self._dispatch = None
         self._dispatch_container_register = None
+        self._claimed_container_register = None
+        self._subject_index = {}
         self._visit_models = {}
         # register .. don't want multiple instances for the same producer running
         # registered_controllers.register(self, retry=kwargs.get('retry', False))
@@ -78,13 +80,30 @@ class BaseDispatch(BaseController):
         # add the container
         self.add_to_session_container(user_container, 'dispatched')
         self.add_to_session_container(user_container, 'serialized')
-        # get list of dispatched items for this container and add to session container
-        for dispatch_register_item in self.get_registered_items():
-            item_cls = get_model(dispatch_register_item.item_app_label,
-                                 dispatch_register_item.item_model_name)
-            instance = item_cls.objects.get(pk=dispatch_register_item.item_pk)
-            self.add_to_session_container(instance, 'dispatched')
-            self.add_to_session_container(instance, 'serialized')
+        # get list of dispatched items for this container and add to session container,
+        # fetching the instances of each model in bulk
+        item_pks = {}
+        for item_app_label, item_model_name, item_pk in self.get_registered_items().values_list(
+                'item_app_label', 'item_model_name', 'item_pk'):
+            item_pks.setdefault((item_app_label, item_model_name), []).append(item_pk)
+        for (item_app_label, item_model_name), pks in item_pks.items():
+            item_cls = get_model(item_app_label, item_model_name)
+            for index in range(0, len(pks), 500):
+                for instance in item_cls.objects.filter(pk__in=pks[index:index + 500]):
+                    self.add_to_session_container(instance, 'dispatched')
+                    self.add_to_session_container(instance, 'serialized')
+
+    def get_batch_scope(self):
+        """Returns the container register pk and the time it was claimed, so chunks
+        are skipped only when sent again for the same claim of the container."""
+        if not self._dispatch_container_register:
+            return None
+        return (str(self._dispatch_container_register.pk),
+                str(self._dispatch_container_register.dispatch_datetime))
+
+    def get_checkpoint_register(self):
+        """Returns the container register of this dispatch, once claimed, for checkpoints."""
+        return self._dispatch_container_register
 
     def register_with_dispatch_item_register(self, instance, user_container=None):
         """Registers a user model with DispatchItemRegister."""
@@ -195,11 +214,24 @@ class BaseDispatch(BaseController):
     def _set_container_register_instance(self, dispatch_container_register=None):
         """Creates a dispatch container instance for this controller session.
 
-        This gets or creates for each instance."""
+        The container is claimed for the producer with
+        :func:`DispatchContainerRegisterManager.claim`. If it is already
+        claimed, the register is reused if claimed for this producer (retry),
+        otherwise AlreadyDispatchedContainer is raised.
+
+        The checkpoints of an earlier dispatch are deleted when the container
+        is claimed anew and kept when the register is reused so a retry resumes.
+
+        If the container was claimed in a batch (see :func:`set_claimed_container_register`),
+        the claimed register is used."""
         if dispatch_container_register:
             # just requery
             self._dispatch_container_register = DispatchContainerRegister.objects.using(
                 self.get_using_source()).get(pk=str(dispatch_container_register.pk))
+        elif self._claimed_container_register:
+            self._dispatch_container_register = self._claimed_container_register
+            DispatchCheckpoint.objects.using(self.get_using_source()).filter(
+                dispatch_container_register=self._dispatch_container_register).delete()
         else:
             # confirm user's app_label and model name get a valid container model
             user_container_model = get_model(self.get_user_container_app_label(),
@@ -228,22 +260,34 @@ class BaseDispatch(BaseController):
                                     'not found on model instance {1}.'.format(
                                         self.get_user_container_identifier_attrname(),
                                         self.get_user_container_model_name()))
-            defaults = {'is_dispatched': True,
-                        'return_datetime': None,
-                        'container_identifier_attrname': self.get_user_container_identifier_attrname(),
-                        'producer': self.get_producer(),
-                        'container_identifier': getattr(
-                            user_container, self.get_user_container_identifier_attrname())}
-            self._dispatch_container_register, created = DispatchContainerRegister.objects.using(
-                self.get_using_source()).get_or_create(
-                    container_app_label=self.get_user_container_app_label(),
-                    container_model_name=self.get_user_container_model_name(),
-                    container_pk=user_container.pk,
-                    defaults=defaults)
-            if not created:
-                for attrname, value in defaults.iteritems():
-                    setattr(self._dispatch_container_register, attrname, value)
-                self._dispatch_container_register.save(using=self.get_using_source())
+            claimed = DispatchContainerRegister.objects.claim(
+                self.get_producer(),
+                self.get_user_container_app_label(),
+                self.get_user_container_model_name(),
+                self.get_user_container_identifier_attrname(),
+                [user_container],
+                using=self.get_using_source())
+            if claimed:
+                self._dispatch_container_register = claimed[0]
+                DispatchCheckpoint.objects.using(self.get_using_source()).filter(
+                    dispatch_container_register=self._dispatch_container_register).delete()
+            else:
+                dispatch_container_register = DispatchContainerRegister.objects.using(
+                    self.get_using_source()).select_related('producer').get(
+                        container_app_label=self.get_user_container_app_label(),
+                        container_model_name=self.get_user_container_model_name(),
+                        container_pk=user_container.pk)
+                if dispatch_container_register.producer_id != self.get_producer().pk:
+                    raise AlreadyDispatchedContainer(
+                        'Container {0} is claimed by producer \'{1}\'.'.format(
+                            dispatch_container_register.container_identifier,
+                            dispatch_container_register.producer.name))
+                self._dispatch_container_register = dispatch_container_register
+
+    def set_claimed_container_register(self, dispatch_container_register):
+        """Sets the register of the user container claimed for the producer in a batch,
+        e.g. by the :class:`DispatchScheduler`, for :func:`_set_container_register_instance`."""
+        self._claimed_container_register = dispatch_container_register
 
     def get_container_register_instance(self):
         """Gets the dispatch container instance for this controller sessions."""
@@ -297,6 +341,7 @@ class BaseDispatch(BaseController):
         if self.in_session_container(instance, 'dispatched'):
             dispatch_item_register = True
         else:
+            subject_identifiers = self.get_subject_identifiers(instance)
             try:
                 dispatch_item_register = DispatchItemRegister.objects.using(self.get_using_source()).get(
                     dispatch_container_register=self.get_container_register_instance(),
@@ -310,6 +355,7 @@ class BaseDispatch(BaseController):
                 dispatch_item_register.item_app_label = instance._meta.app_label
                 dispatch_item_register.item_model_name = instance._meta.object_name  # not lower!
                 dispatch_item_register.item_identifier_attrname = self.get_user_item_identifier_attrname()
+                dispatch_item_register.registered_subjects = '\n'.join(subject_identifiers) or None
                 dispatch_item_register.save()
             except DispatchItemRegister.DoesNotExist:
                 dispatch_item_register = DispatchItemRegister.objects.using(self.get_using_source()).create(
@@ -324,6 +370,7 @@ class BaseDispatch(BaseController):
                     item_app_label=instance._meta.app_label,
                     item_model_name=instance._meta.object_name,  # not lower!
                     item_identifier_attrname=self.get_user_item_identifier_attrname(),
+                    registered_subjects='\n'.join(subject_identifiers) or None,
                     )
             except IntegrityError:
                 raise ImproperlyConfigured('Attempting to dispatch a model that is not \"dispatchable\". '
@@ -331,9 +378,52 @@ class BaseDispatch(BaseController):
                                            'check that this model has method \'include_for_dispatch()\' '
                                            'or model\'s app_label is included in settings.'
                                            'DISPATCH_APP_LABELS'.format(instance._meta.object_name))
+            self._index_subjects(dispatch_item_register, subject_identifiers)
             self.add_to_session_container(instance, 'dispatched')
         return dispatch_item_register
 
+    def get_subject_identifiers(self, instance):
+        """Returns a list of subject identifiers linked to an instance being dispatched.
+
+        Looks for attribute subject_identifier on the instance or on its
+        registered_subject. Users may override for other relations."""
+        subject_identifier = getattr(instance, 'subject_identifier', None)
+        if not subject_identifier:
+            registered_subject = getattr(instance, 'registered_subject', None)
+            subject_identifier = getattr(registered_subject, 'subject_identifier', None)
+        if subject_identifier:
+            return [subject_identifier]
+        return []
+
+    def _index_subjects(self, dispatch_item_register, subject_identifiers):
+        """Collects the subject identifiers of a registered item for :func:`flush_subject_index`."""
+        self._subject_index[dispatch_item_register.pk] = (dispatch_item_register, set(subject_identifiers))
+
+    def flush_subject_index(self):
+        """Replaces the DispatchSubjectIndex rows of the items registered since the
+        last flush with one delete and one bulk insert, in chunks of 500.
+
+        Called once per container by :func:`DispatchController._post_dispatch`. Call
+        it after registering items outside of :func:`DispatchController.dispatch`."""
+        if not self._subject_index:
+            return
+        using = self.get_using_source()
+        pks = list(self._subject_index.keys())
+        for index in range(0, len(pks), 500):
+            DispatchSubjectIndex.objects.using(using).filter(
+                dispatch_item_register__pk__in=pks[index:index + 500]).delete()
+        DispatchSubjectIndex.objects.using(using).bulk_create([
+            DispatchSubjectIndex(
+                dispatch_item_register=dispatch_item_register,
+                producer=dispatch_item_register.producer,
+                subject_identifier=subject_identifier,
+                item_app_label=dispatch_item_register.item_app_label,
+                item_model_name=dispatch_item_register.item_model_name,
+                item_pk=dispatch_item_register.item_pk)
+            for dispatch_item_register, subject_identifiers in self._subject_index.values()
+            for subject_identifier in subject_identifiers], batch_size=500)
+        self._subject_index = {}
+
     def get_membershipform_models(self):
         """Returns a list of 'visible' membership form model classes."""
         return [membership_form.content_type_map.content_type.model_class()
@@ -219,8 +219,13 @@ class BaseDispatchController(BaseDispatch):
                         raise DispatchItemError('All instances must be configured for dispatch. Found {0} '
                                                 'that are not. Got {1}. See method \'is_dispatchable_model\''
                                                 ''.format(len(not_dispatchable), not_dispatchable))
+                    # on retry, items dispatched before the retry are expected
+                    is_retry = self.get_controller_state() == 'retry'
                     already_dispatched_items = [
-                        user_instance for user_instance in user_items if user_instance.is_dispatched_as_item(using=self.get_using_source(), user_container=user_container)]
+                        user_instance for user_instance in user_items
+                        if not (is_retry and self.in_session_container(user_instance, 'dispatched')) and
+                        user_instance.is_dispatched_as_item(
+                            using=self.get_using_source(), user_container=user_container)]
                     if already_dispatched_items:
                         raise AlreadyDispatchedItem('{0} models are already dispatched. Got {1}'.format(len(already_dispatched_items), already_dispatched_items))
                     # dispatch
@@ -1,26 +1,180 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, IntegrityError, transaction
+
 from ..exceptions import AlreadyRegisteredController
+from ..models import DispatchProducerLock
+
+logger = logging.getLogger(__name__)
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+nullhandler = logger.addHandler(NullHandler())
 
 
 class ControllerRegister(object):
-    """Registers controllers to prevent more than one controller instance for the same settings_key."""
+    """Registers controllers to prevent more than one controller instance for the same settings_key.
+
+    Also locks producers so only one dispatch or return runs against a
+    producer at a time, across threads and processes. The lock is a
+    :class:`DispatchProducerLock` row on ``using`` owned by a holder,
+    by default the host, process and thread. It is re-entrant for the same
+    holder so workers sharing a holder, e.g. those of a
+    :class:`DispatchScheduler`, may dispatch to the producer together.
+
+    The lock is a lease: while held, a heartbeat thread renews it so a long
+    dispatch keeps it, and a holder that dies stops renewing so its lock
+    expires and may be taken over.
+
+    Settings:
+        DISPATCH_LOCK_TIMEOUT: seconds after which a lock not renewed may be taken over (default=600).
+        DISPATCH_LOCK_HEARTBEAT: seconds between renewals (default=DISPATCH_LOCK_TIMEOUT / 3).
+    """
     def __init__(self):
         self._register = []
+        self._lock = threading.RLock()
+        self._producer_locks = {}
 
     def register(self, controller, retry=False):
         from .base_controller import BaseController
         if not isinstance(controller, BaseController):
             raise TypeError('Controller must be an instance of dispatch.classes.Base.')
-        if str(controller) in self._register:
-            if not retry:
-                raise AlreadyRegisteredController(
-                    '{0} has already been registered.'.format(str(controller)))
-        else:
-            self._register.append(str(controller))
+        with self._lock:
+            if str(controller) in self._register:
+                if not retry:
+                    raise AlreadyRegisteredController(
+                        '{0} has already been registered.'.format(str(controller)))
+            else:
+                self._register.append(str(controller))
 
     def deregister(self, controller):
+        with self._lock:
+            try:
+                self._register.remove(str(controller))
+            except:
+                pass
+
+    def get_holder(self):
+        return '{0}-{1}-{2}'.format(socket.gethostname(), os.getpid(), threading.current_thread().ident)
+
+    @property
+    def lock_timeout(self):
+        return getattr(settings, 'DISPATCH_LOCK_TIMEOUT', 600)
+
+    @property
+    def heartbeat_interval(self):
+        return getattr(settings, 'DISPATCH_LOCK_HEARTBEAT', self.lock_timeout / 3.0)
+
+    def acquire_producer(self, producer_name, holder=None, wait=None, using=None):
+        """Locks the producer for the holder and returns the holder.
+
+        Waits up to ``wait`` seconds (default=0) for another holder to
+        release it, then raises AlreadyRegisteredController.
+
+        The lock row is created outside of the in-process lock so a slow
+        database does not block other producers. While the producer is
+        held, a heartbeat thread renews the lease."""
+        holder = holder or self.get_holder()
+        deadline = time.time() + (wait or 0)
+        while True:
+            with self._lock:
+                held = self._producer_locks.get(producer_name)
+                if held and held['holder'] == holder and held['ready'].is_set():
+                    held['count'] += 1
+                    return holder
+                pending = held['ready'] if held and held['holder'] == holder else None
+                if not held:
+                    # reserve the producer in this process while creating the lock row
+                    held = {'holder': holder, 'count': 0, 'ready': threading.Event(), 'stop': threading.Event()}
+                    self._producer_locks[producer_name] = held
+            if pending:
+                # another thread of the same holder is creating the lock row
+                pending.wait(0.5)
+                continue
+            if held['holder'] == holder and held['count'] == 0 and not held['ready'].is_set():
+                if self._create_lock(producer_name, holder, using):
+                    with self._lock:
+                        held['count'] = 1
+                        held['ready'].set()
+                    self._start_heartbeat(producer_name, holder, held['stop'], using)
+                    return holder
+                with self._lock:
+                    del self._producer_locks[producer_name]
+                    held['ready'].set()
+            if time.time() >= deadline:
+                lock = DispatchProducerLock.objects.using(using).filter(producer_name=producer_name).first()
+                raise AlreadyRegisteredController('Producer \'{0}\' is locked by {1}. Try again later.'.format(
+                    producer_name, lock.holder if lock else 'another controller'))
+            time.sleep(0.5)
+
+    def release_producer(self, producer_name, holder=None, using=None):
+        holder = holder or self.get_holder()
+        with self._lock:
+            held = self._producer_locks.get(producer_name)
+            if not held or held['holder'] != holder or not held['ready'].is_set():
+                return
+            held['count'] -= 1
+            if held['count'] > 0:
+                return
+            del self._producer_locks[producer_name]
+            held['stop'].set()
+        DispatchProducerLock.objects.using(using).filter(
+            producer_name=producer_name, holder=holder).delete()
+
+    @contextmanager
+    def producer_lock(self, producer_name, holder=None, wait=None, using=None):
+        """Holds the producer lock for the duration of a with block."""
+        holder = self.acquire_producer(producer_name, holder, wait, using)
+        try:
+            yield holder
+        finally:
+            self.release_producer(producer_name, holder, using)
+
+    def renew_producer(self, producer_name, holder, using=None):
+        """Extends the lease of the holder's lock and returns False if the lock was lost."""
+        return bool(DispatchProducerLock.objects.using(using).filter(
+            producer_name=producer_name, holder=holder).update(
+                expires_datetime=datetime.today() + timedelta(seconds=self.lock_timeout)))
+
+    def _start_heartbeat(self, producer_name, holder, stop, using=None):
+        def heartbeat():
+            try:
+                while not stop.wait(self.heartbeat_interval):
+                    if not self.renew_producer(producer_name, holder, using):
+                        logger.warning('Lost the lock on producer \'{0}\' held by {1}.'.format(
+                            producer_name, holder))
+                        return
+            finally:
+                connections[using or 'default'].close()
+        thread = threading.Thread(target=heartbeat)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _create_lock(self, producer_name, holder, using=None):
+        now = datetime.today()
+        # take over a lock not released, or renewed, by its holder
+        DispatchProducerLock.objects.using(using).filter(
+            producer_name=producer_name, expires_datetime__lt=now).delete()
         try:
-            self._register.remove(str(controller))
-        except:
-            pass
+            with transaction.atomic(using=using):
+                DispatchProducerLock.objects.using(using).create(
+                    producer_name=producer_name,
+                    holder=holder,
+                    acquired_datetime=now,
+                    expires_datetime=now + timedelta(seconds=self.lock_timeout))
+        except IntegrityError:
+            return False
+        return True
 
 registered_controllers = ControllerRegister()
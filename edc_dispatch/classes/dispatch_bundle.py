@@ -0,0 +1,313 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from datetime import datetime
+
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from ..exceptions import DispatchBundleError
+
+from .payload_compressor import PayloadCompressor
+from .row_codec import JsonRowCodec, row_codecs
+
+
+class DispatchBundleWriter(object):
+    """Writes a dispatch payload to a bundle file instead of to a live
+    destination database.
+
+    A bundle is laid out as::
+
+        MAGIC | [dictionary] | segment | segment | ... | index | index length (8 bytes) | MAGIC
+
+    Each segment is the encoded list of serialized instances of one
+    model for one container, in load order. Segments are encoded with
+    ``codec``, a :class:`JsonRowCodec` (default) or a :class:`PackedRowCodec`,
+    whose name is recorded in the index. The index is a json document
+    with the format, version, producer and created datetime and, for
+    random access, the offset, length, sha1 and object count of each
+    segment and the segment numbers needed by each container and model.
+    A container's segments include those, written for an earlier
+    container, that hold instances it shares, such as a foreign key.
+
+    If a :class:`PayloadCompressor` is given, each segment is compressed
+    on its own, so random access still works, and the compressor's preset
+    dictionary, if any, is written once after MAGIC and described in the
+    index so the bundle carries what is needed to read it.
+
+    The bundle is written to ``path`` + '.partial' and renamed to ``path``
+    when closed. If the ``with`` block raises, or :func:`abort` is called,
+    the partial file is deleted so a failed export never leaves a file
+    that reads as a complete bundle.
+
+    Pass an instance to a controller as keyword ``bundle`` and set the
+    container before dispatching it::
+
+        with DispatchBundleWriter(path, producer.name) as bundle:
+            controller = MyDispatchController('default', producer.settings_key, household, bundle=bundle)
+            bundle.set_container(household.household_identifier)
+            controller.dispatch()
+    """
+
+    FORMAT = 'edc-dispatch-bundle'
+    VERSION = 2
+    MAGIC = b'EDCDSPB2'
+
+    def __init__(self, path, producer_name, compressor=None, codec=None):
+        self.path = path
+        self.producer_name = producer_name
+        self.compressor = compressor
+        self.codec = codec or JsonRowCodec()
+        self.container = None
+        self.index = {'format': self.FORMAT,
+                      'version': self.VERSION,
+                      'producer': self.producer_name,
+                      'created': datetime.today(),
+                      'segments': [],
+                      'containers': {},
+                      'models': {},
+                      'encoding': self.codec.name,
+                      'compression': None}
+        self._written = {}
+        self.partial_path = self.path + '.partial'
+        self._file = open(self.partial_path, 'wb')
+        self._file.write(self.MAGIC)
+        if self.compressor:
+            self.index['compression'] = {'method': self.compressor.method,
+                                         'dictionary': self.compressor.dictionary_version,
+                                         'dictionary_offset': self._file.tell(),
+                                         'dictionary_length': len(self.compressor.dictionary or b'')}
+            if self.compressor.dictionary:
+                self._file.write(self.compressor.dictionary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+    @property
+    def containers(self):
+        return list(self.index['containers'].keys())
+
+    @property
+    def segment_count(self):
+        return len(self.index['segments'])
+
+    @property
+    def object_count(self):
+        return sum([segment['count'] for segment in self.index['segments']])
+
+    def stats(self):
+        """Returns the raw and written bytes of the segments and, if compressed, the compressor stats."""
+        stats = {'encoding': self.codec.name,
+                 'segments': self.segment_count,
+                 'objects': self.object_count,
+                 'raw_bytes': sum([segment['raw_length'] for segment in self.index['segments']]),
+                 'bytes': sum([segment['length'] for segment in self.index['segments']])}
+        if self.compressor:
+            stats.update({'compression': self.compressor.stats()})
+        return stats
+
+    def set_container(self, container_identifier):
+        self.container = container_identifier
+        self.index['containers'].setdefault(container_identifier, [])
+
+    def _require_segment(self, segment_number):
+        segment_numbers = self.index['containers'].setdefault(self.container, [])
+        if segment_number not in segment_numbers:
+            segment_numbers.append(segment_number)
+
+    def add(self, model_instances):
+        """Writes the model instances as segments, keeping their order.
+
+        Instances already in the bundle are not written again; their
+        segment is added to the current container's segments instead."""
+        segment = []
+        for instance in model_instances:
+            key = (instance._meta.app_label, instance._meta.object_name, str(instance.pk))
+            if key in self._written:
+                self._require_segment(self._written[key])
+                continue
+            if segment and segment[-1].__class__ != instance.__class__:
+                self._write_segment(segment)
+                segment = []
+            self._written[key] = self.segment_count
+            segment.append(instance)
+        if segment:
+            self._write_segment(segment)
+
+    def _write_segment(self, instances):
+        model = '{0}.{1}'.format(instances[0]._meta.app_label, instances[0]._meta.object_name)
+        data = self.codec.encode(instances)
+        raw_length = len(data)
+        if self.compressor:
+            data = self.compressor.compress(data)
+        segment_number = self.segment_count
+        self.index['segments'].append({'container': self.container,
+                                       'model': model,
+                                       'offset': self._file.tell(),
+                                       'length': len(data),
+                                       'raw_length': raw_length,
+                                       'sha1': hashlib.sha1(data).hexdigest(),
+                                       'count': len(instances)})
+        self.index['models'].setdefault(model, []).append(segment_number)
+        self._require_segment(segment_number)
+        self._file.write(data)
+
+    def close(self):
+        if not self._file.closed:
+            for segment_numbers in self.index['containers'].values():
+                segment_numbers.sort()
+            index = json.dumps(self.index, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+            self._file.write(index)
+            self._file.write(struct.pack('>Q', len(index)))
+            self._file.write(self.MAGIC)
+            self._file.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.partial_path, self.path)
+
+    def abort(self):
+        """Closes and deletes the partial bundle without writing the index."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+class DispatchBundleReader(object):
+    """Reads and loads a bundle written by :class:`DispatchBundleWriter`.
+
+    The file is memory mapped and only the index is decoded when opened.
+    Segments are decoded when requested and their sha1 checked first.
+    Compressed segments are decompressed with the dictionary carried
+    in the bundle."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(self.path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise DispatchBundleError('Dispatch bundle {0} is empty.'.format(self.path))
+        self.index = self._read_index()
+        self.compressor = self._get_compressor()
+        try:
+            self.codec = row_codecs[self.index.get('encoding', JsonRowCodec.name)]()
+        except KeyError:
+            raise DispatchBundleError('Unsupported dispatch bundle encoding. Got {0}.'.format(
+                self.index.get('encoding')))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def _read_index(self):
+        magic = DispatchBundleWriter.MAGIC
+        size = len(self._mmap)
+        if (size < 2 * len(magic) + 8 or self._mmap[:len(magic)] != magic or
+                self._mmap[size - len(magic):] != magic):
+            raise DispatchBundleError('File {0} is not a complete dispatch bundle.'.format(self.path))
+        index_length = struct.unpack('>Q', self._mmap[size - len(magic) - 8:size - len(magic)])[0]
+        index_end = size - len(magic) - 8
+        index = json.loads(self._mmap[index_end - index_length:index_end].decode('utf-8'))
+        if index.get('format') != DispatchBundleWriter.FORMAT:
+            raise DispatchBundleError('File {0} is not a dispatch bundle.'.format(self.path))
+        if index.get('version') != DispatchBundleWriter.VERSION:
+            raise DispatchBundleError('Unsupported dispatch bundle version. Got {0}.'.format(index.get('version')))
+        return index
+
+    def _get_compressor(self):
+        compression = self.index.get('compression')
+        if not compression:
+            return None
+        if compression['method'] not in [PayloadCompressor.METHOD, PayloadCompressor.PRIMED_METHOD]:
+            raise DispatchBundleError('Unsupported dispatch bundle compression. Got {0}.'.format(
+                compression['method']))
+        offset, length = compression['dictionary_offset'], compression['dictionary_length']
+        compressor = PayloadCompressor(dictionary=self._mmap[offset:offset + length] if length else None)
+        if compressor.dictionary_version != compression['dictionary']:
+            raise DispatchBundleError('Dispatch bundle {0} dictionary is corrupted.'.format(self.path))
+        if compressor.method != compression['method']:
+            # e.g. a dictionary used as a zlib zdict
+            raise DispatchBundleError('Unsupported dispatch bundle compression. Got {0} with{1} a dictionary.'.format(
+                compression['method'], '' if length else 'out'))
+        return compressor
+
+    @property
+    def producer(self):
+        return self.index['producer']
+
+    @property
+    def containers(self):
+        return list(self.index['containers'].keys())
+
+    def segment(self, segment_number):
+        """Returns the list of serialized objects in a segment after verifying its checksum."""
+        return self.codec.decode(self.segment_data(segment_number))
+
+    def segment_data(self, segment_number):
+        """Returns the encoded, decompressed bytes of a segment after verifying its checksum."""
+        segment = self.index['segments'][segment_number]
+        data = self._mmap[segment['offset']:segment['offset'] + segment['length']]
+        if hashlib.sha1(data).hexdigest() != segment['sha1']:
+            raise DispatchBundleError('Dispatch bundle {0} segment {1} ({2}) is corrupted.'.format(
+                self.path, segment_number, segment['model']))
+        if self.compressor:
+            data = self.compressor.decompress(data)
+        return data
+
+    def segment_numbers(self, containers=None, models=None):
+        """Returns the segment numbers, in load order, for the containers
+        and/or models. If neither is given, all segments."""
+        if containers is None and models is None:
+            return list(range(0, len(self.index['segments'])))
+        segment_numbers = set()
+        for container in containers or []:
+            try:
+                segment_numbers.update(self.index['containers'][container])
+            except KeyError:
+                raise DispatchBundleError('Container {0} not found in dispatch bundle {1}.'.format(
+                    container, self.path))
+        if models:
+            model_segment_numbers = set()
+            for model in models:
+                model_segment_numbers.update(self.index['models'].get(model, []))
+            if containers is None:
+                segment_numbers = model_segment_numbers
+            else:
+                segment_numbers.intersection_update(model_segment_numbers)
+        return sorted(segment_numbers)
+
+    def segments(self, containers=None, models=None):
+        """Yields the decoded segments for the containers and/or models in load order."""
+        for segment_number in self.segment_numbers(containers, models):
+            yield self.segment(segment_number)
+
+    def load(self, using=None, containers=None):
+        """Saves the objects of all or the given containers to ``using``
+        in one transaction and returns the number of objects saved."""
+        using = using or 'default'
+        saved = 0
+        with transaction.atomic(using=using):
+            for objects in self.segments(containers=containers):
+                for deserialized_object in serializers.deserialize(
+                        'python', objects, use_natural_keys=True, using=using):
+                    deserialized_object.save(using=using)
+                    saved += 1
+        return saved
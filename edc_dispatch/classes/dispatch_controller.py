@@ -49,16 +49,32 @@ class DispatchController(BaseDispatchController):
         """Dispatches items to a device by creating a dispatch item
         instance.
 
+        Holds the producer lock so only one dispatch or return runs against
+        the producer at a time, see :class:`ControllerRegister`.
+
         ..note:: calls the user overridden method :func:`pre_dispatch`,
                  :func:`dispatch_prep` and :func:`post_dispatch`."""
-        # check for pending transactions
-        if self.has_outgoing_transactions_producer():
+        with self.producer_lock():
+            return self._dispatch_to_producer(debug, **kwargs)
+
+    def _dispatch_to_producer(self, debug=None, **kwargs):
+        # check for pending transactions (a bundle has no live producer to check)
+        if not self.bundle and self.has_outgoing_transactions_producer():
             msg = ('Producer \'{0}\' has pending outgoing transactions. '
                    'Run bhp_sync first.').format(self.get_producer_name())
         else:
             # TODO: already dispatched checks to pre_dispatch
             user_container = self.get_user_container_instance()
-            if user_container.is_dispatched_as_item():
+            if user_container.is_dispatched_as_item() and self.get_controller_state() == 'retry':
+                # resume an interrupted dispatch from its checkpoints
+                if self.bundle:
+                    self.bundle.set_container(self.get_user_container_identifier())
+                self._pre_dispatch(user_container, **kwargs)
+                self._dispatch_prep(**kwargs)
+                self._post_dispatch(user_container, **kwargs)
+                msg = 'Successfully resumed dispatch of {0} {1}'.format(
+                    user_container._meta.object_name, self.get_user_container_identifier())
+            elif user_container.is_dispatched_as_item():
                 if debug:
                     raise AlreadyDispatchedContainer('Container {0} is already dispatched. '
                                                      'Got {1}.'.format(user_container._meta.object_name,
@@ -69,6 +85,8 @@ class DispatchController(BaseDispatchController):
                     self.get_producer_name())
                 registered_controllers.deregister(self)
             else:
+                if self.bundle:
+                    self.bundle.set_container(self.get_user_container_identifier())
                 self._pre_dispatch(user_container, **kwargs)
                 # check source for the producer based on using_destination.
                 if self.debug:
@@ -96,7 +114,9 @@ class DispatchController(BaseDispatchController):
         pass
 
     def _post_dispatch(self, user_container, **kwargs):
-        """Calls user's pre_dispatch after dispatch is complete."""
+        """Writes the subject index of the registered items then calls
+        user's post_dispatch after dispatch is complete."""
+        self.flush_subject_index()
         self.post_dispatch(user_container, **kwargs)
 
     def post_dispatch(self, user_container, **kwargs):
@@ -0,0 +1,107 @@
+import logging
+import threading
+
+from datetime import datetime
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import get_model
+
+from ..models import DispatchJob, DispatchJobContainer
+
+from .dispatch_scheduler import DispatchScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+nullhandler = logger.addHandler(NullHandler())
+
+
+class DispatchJobRunner(object):
+    """Runs a claimed :class:`DispatchJob` with a :class:`DispatchScheduler`,
+    recording the outcome of each container as it is written.
+
+    While the job runs, a heartbeat is recorded every DISPATCH_JOB_HEARTBEAT
+    seconds (default=DISPATCH_JOB_TIMEOUT / 3) so the job is not requeued."""
+
+    def __init__(self, job, max_workers=None):
+        self.job = job
+        self.max_workers = max_workers
+
+    def get_dispatch_controller_cls(self):
+        module_name, cls_name = self.job.controller.rsplit('.', 1)
+        return getattr(import_module(module_name), cls_name)
+
+    def get_user_containers(self):
+        """Returns the user container instances in job order, failing those no longer found."""
+        user_containers = []
+        for job_container in DispatchJobContainer.objects.filter(job=self.job, status='queued').order_by('sequence'):
+            model_cls = get_model(job_container.container_app_label, job_container.container_model_name)
+            try:
+                user_containers.append(model_cls.objects.get(pk=job_container.container_pk))
+            except model_cls.DoesNotExist:
+                self.update_container(job_container.container_pk, 'failed', error='Container not found.')
+        return user_containers
+
+    @property
+    def heartbeat_interval(self):
+        return getattr(settings, 'DISPATCH_JOB_HEARTBEAT', DispatchJob.objects.get_timeout() / 3.0)
+
+    def start_heartbeat(self, stop):
+        def heartbeat():
+            try:
+                while not stop.wait(self.heartbeat_interval):
+                    if not DispatchJob.objects.heartbeat(self.job):
+                        logger.warning('Dispatch job {0} is no longer claimed by {1}.'.format(
+                            self.job.pk, self.job.worker))
+                        return
+            finally:
+                connection.close()
+        thread = threading.Thread(target=heartbeat)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def run(self):
+        logger.info('Running dispatch job {0} for {1}.'.format(self.job.pk, self.job.producer.name))
+        stop = threading.Event()
+        self.start_heartbeat(stop)
+        try:
+            dispatch_scheduler = DispatchScheduler(
+                self.get_dispatch_controller_cls(),
+                self.job.producer,
+                self.get_user_containers(),
+                max_workers=self.max_workers,
+                controller_kwargs=self.job.get_controller_kwargs(),
+                dispatch_kwargs=self.job.get_dispatch_kwargs())
+            dispatch_scheduler.run(callback=self.on_container)
+            self.job.status = 'done'
+            if DispatchJobContainer.objects.filter(job=self.job, status='failed').exists():
+                self.job.status = 'failed'
+        except Exception as e:
+            logger.error('Dispatch job {0} failed. Got {1}'.format(self.job.pk, str(e)))
+            self.job.status = 'failed'
+            self.job.error = str(e)
+        finally:
+            stop.set()
+        self.job.finished_datetime = datetime.today()
+        # a job requeued as stale may now belong to another worker
+        DispatchJob.objects.filter(pk=self.job.pk, worker=self.job.worker, status='running').update(
+            status=self.job.status, error=self.job.error, finished_datetime=self.job.finished_datetime)
+        return self.job
+
+    def on_container(self, user_container, msg, error, timing):
+        if error:
+            self.update_container(user_container.pk, 'failed', error=str(error))
+        else:
+            self.update_container(user_container.pk, 'dispatched', message=msg,
+                                  object_count=timing[1] if timing else 0,
+                                  seconds=timing[2] if timing else None)
+
+    def update_container(self, container_pk, status, **kwargs):
+        DispatchJobContainer.objects.filter(job=self.job, container_pk=str(container_pk)).update(
+            status=status, finished_datetime=datetime.today(), **kwargs)
@@ -0,0 +1,219 @@
+import logging
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.six.moves import queue
+
+from edc.device.sync.exceptions import PendingTransactionError
+from edc_sync.helpers import TransactionHelper
+
+from ..exceptions import DispatchError
+from ..models import DispatchContainerRegister
+
+from .controller_register import registered_controllers
+
+logger = logging.getLogger(__name__)
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+nullhandler = logger.addHandler(NullHandler())
+
+
+class ContainerPayload(object):
+    """Collects in memory the serialized chunks a controller would save
+    on the destination for one container, and the callbacks to call once
+    they are saved, e.g. to record a reference data version.
+
+    Pass an instance to a controller as keyword ``payload``; the chunks
+    are saved by :func:`BaseController.write_payload`."""
+
+    def __init__(self):
+        self.container = None
+        self.chunks = []
+        self.callbacks = []
+
+    def set_container(self, container_identifier):
+        self.container = container_identifier
+
+    def add(self, json_obj, list_items_sent=False):
+        self.chunks.append((json_obj, list_items_sent))
+
+    def on_write(self, callback, *args):
+        self.callbacks.append((callback, args))
+
+
+class DispatchScheduler(object):
+    """Dispatches several user containers to one producer through a
+    bounded thread pool.
+
+    Each container is dispatched by its own controller in a worker thread,
+    in a transaction on the source, with the writes to the producer
+    collected in a :class:`ContainerPayload` instead. A single writer, the
+    calling thread, then saves the payloads on the producer in the order
+    the containers were given, one transaction per container, with the
+    container's controller (see :func:`BaseController.write_payload`) so
+    the batch ledger skips chunks already saved for an earlier container.
+    The worker holds its source transaction open until its payload is
+    written so the dispatch registers, and checkpoints, of a container
+    that fails to write are rolled back.
+
+    The producer is locked for the whole batch, see :class:`ControllerRegister`;
+    the workers share the lock holder. The containers are claimed for the
+    producer in one batch per container model before the workers start
+    (see :func:`DispatchContainerRegisterManager.claim`) and those that
+    fail are released so they may be dispatched again.
+
+    A container that fails does not stop the others. :func:`run` returns
+    a list of (user_container, message, error) in the order given and,
+    if given, calls ``callback(user_container, message, error, timing)``
+    as each container is written, where timing is a tuple of
+    (container identifier, objects saved, seconds) or None.
+
+    Settings:
+        DISPATCH_MAX_WORKERS: default number of worker threads (default=4).
+    """
+
+    def __init__(self, dispatch_controller_cls, producer, user_containers, using_source=None,
+                 max_workers=None, controller_kwargs=None, dispatch_kwargs=None):
+        self.dispatch_controller_cls = dispatch_controller_cls
+        self.producer = producer
+        self.user_containers = list(user_containers)
+        self.using_source = using_source or 'default'
+        self.using_destination = producer.settings_key
+        self.max_workers = max_workers or getattr(settings, 'DISPATCH_MAX_WORKERS', 4)
+        self.controller_kwargs = controller_kwargs or {}
+        self.dispatch_kwargs = dispatch_kwargs or {}
+        self.dispatch_url = None
+        self.timings = []
+
+    def has_outgoing_transactions(self):
+        producer_hostname = self.using_destination.split('-')[0]
+        return TransactionHelper().has_outgoing_for_producer(producer_hostname, self.using_destination)
+
+    def run(self, callback=None):
+        lock_holder = 'scheduler-{0}'.format(uuid.uuid4().hex)
+        with registered_controllers.producer_lock(
+                self.producer.name, holder=lock_holder,
+                wait=self.controller_kwargs.get('lock_wait'), using=self.using_source):
+            return self._run(callback, lock_holder)
+
+    def _run(self, callback, lock_holder):
+        if self.has_outgoing_transactions():
+            raise PendingTransactionError('Producer \'{0}\' has pending outgoing transactions. '
+                                          'Run bhp_sync first.'.format(self.producer.name))
+        dispatch_controllers = [self.get_dispatch_controller(user_container, lock_holder)
+                                for user_container in self.user_containers]
+        claimed = self.claim([dispatch_controller for dispatch_controller, _ in dispatch_controllers
+                              if dispatch_controller])
+        collected = [queue.Queue(maxsize=1) for _ in self.user_containers]
+        written = [queue.Queue(maxsize=1) for _ in self.user_containers]
+        results = []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.user_containers) or 1)) as executor:
+            for index, (dispatch_controller, error) in enumerate(dispatch_controllers):
+                if error:
+                    collected[index].put((None, None, error))
+                else:
+                    executor.submit(self.collect, dispatch_controller, collected[index], written[index])
+            try:
+                for index, user_container in enumerate(self.user_containers):
+                    dispatch_controller, msg, error = collected[index].get()
+                    timing = None
+                    if not error:
+                        try:
+                            timing = self.write(dispatch_controller)
+                        except Exception as e:
+                            logger.error('Failed to write {0} to \'{1}\'. Got {2}'.format(
+                                user_container, self.using_destination, str(e)))
+                            error = e
+                        written[index].put(error is None)
+                    results.append((user_container, None if error else msg, error))
+                    if callback:
+                        callback(user_container, None if error else msg, error, timing)
+            finally:
+                # release workers still waiting if the writer stopped early
+                for index in range(len(results), len(self.user_containers)):
+                    written[index].put(False)
+        # the workers have rolled back, return the claims of the containers that failed
+        self.release([claimed[str(user_container.pk)] for user_container, _, error in results
+                      if error and str(user_container.pk) in claimed])
+        return results
+
+    def get_dispatch_controller(self, user_container, lock_holder):
+        """Returns a tuple of (dispatch controller, None) for the container or
+        (None, error) if the controller could not be created."""
+        try:
+            dispatch_controller = self.dispatch_controller_cls(
+                self.using_source, self.using_destination, user_container,
+                payload=ContainerPayload(), lock_holder=lock_holder, **self.controller_kwargs)
+            dispatch_controller.payload.set_container(dispatch_controller.get_user_container_identifier())
+        except Exception as e:
+            return None, e
+        return dispatch_controller, None
+
+    def claim(self, dispatch_controllers):
+        """Claims the controllers' user containers for the producer, one batch
+        per container model, and returns a dictionary of the claimed
+        DispatchContainerRegister instances by container pk.
+
+        A container not claimed here, e.g. one dispatched earlier to this
+        producer, is left for its controller to claim or reuse."""
+        batches = {}
+        for dispatch_controller in dispatch_controllers:
+            key = (dispatch_controller.get_user_container_app_label(),
+                   dispatch_controller.get_user_container_model_name(),
+                   dispatch_controller.get_user_container_identifier_attrname())
+            batches.setdefault(key, []).append(dispatch_controller)
+        claimed = {}
+        for (app_label, model_name, identifier_attrname), batch in batches.items():
+            user_containers = [dispatch_controller.get_user_container_instance() for dispatch_controller in batch]
+            registers = DispatchContainerRegister.objects.claim(
+                self.producer, app_label, model_name, identifier_attrname, user_containers,
+                using=self.using_source)
+            registers = dict((dispatch_container_register.container_pk, dispatch_container_register)
+                             for dispatch_container_register in registers)
+            for dispatch_controller, user_container in zip(batch, user_containers):
+                if str(user_container.pk) in registers:
+                    dispatch_controller.set_claimed_container_register(registers[str(user_container.pk)])
+            claimed.update(registers)
+        return claimed
+
+    def release(self, dispatch_container_registers):
+        """Returns the claims of containers that failed to dispatch so they may be dispatched again."""
+        if dispatch_container_registers:
+            DispatchContainerRegister.objects.release(dispatch_container_registers, using=self.using_source)
+
+    def collect(self, dispatch_controller, collected, written):
+        """Dispatches one container to a payload. Runs in a worker thread."""
+        is_collected = False
+        try:
+            with transaction.atomic(using=self.using_source):
+                msg = dispatch_controller.dispatch(**self.dispatch_kwargs)
+                self.dispatch_url = dispatch_controller.get_dispatch_url()
+                # the worker waits below, so the writer has the controller to itself
+                collected.put((dispatch_controller, msg, None))
+                is_collected = True
+                if not written.get():
+                    # roll back the dispatch registers
+                    raise DispatchError('Failed to write {0} to \'{1}\'.'.format(
+                        dispatch_controller.get_user_container_identifier(), self.using_destination))
+        except Exception as e:
+            if not is_collected:
+                collected.put((None, None, e))
+        finally:
+            # each thread has its own connection for the alias
+            connections[self.using_source].close()
+
+    def write(self, dispatch_controller):
+        """Saves a container's payload on the producer in one transaction
+        with the container's controller."""
+        started = time.time()
+        with transaction.atomic(using=self.using_destination):
+            saved = dispatch_controller.write_payload()
+        self.timings.append((dispatch_controller.payload.container, saved, round(time.time() - started, 3)))
+        return self.timings[-1]
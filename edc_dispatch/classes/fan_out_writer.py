@@ -0,0 +1,145 @@
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core import serializers
+from django.db import connections, transaction
+from django.db.models import get_app, get_models
+
+from edc_sync.helpers import TransactionHelper
+
+from ..exceptions import AlreadyRegisteredController
+
+from .base_controller import BaseController
+from .controller_register import registered_controllers
+from .process_pool_encoder import ProcessPoolEncoder
+from .reference_data import ReferenceData
+from .row_codec import JsonRowCodec
+
+logger = logging.getLogger(__name__)
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+nullhandler = logger.addHandler(NullHandler())
+
+
+class FanOutWriter(object):
+    """Serializes reference data once and writes the same encoded payload
+    to several producers.
+
+    Reference and list data, e.g. list models, lab list models, registered
+    subjects and crypts, are the same for every producer, so instead of
+    each controller serializing them again, add the model classes here
+    and write to all producers in one pass. Each producer is written in
+    its own thread, with its own connection to the producer's
+    settings.DATABASES alias and in one transaction. A producer with
+    pending outgoing transactions, or locked by a dispatch or return
+    (see :class:`ControllerRegister`), is skipped. If saving any instance
+    on a producer fails, e.g. with an IntegrityError, that producer's whole
+    write is rolled back and reported as an error; the other producers
+    are not affected.
+
+    Instances added with :func:`add_model` are sent with the crypts of
+    their encrypted fields. If ``processes`` is set, they are fetched,
+    hashed and encoded in chunks by a :class:`ProcessPoolEncoder`.
+
+    Reference models added with :func:`add_model` are not written to a
+    producer that holds their current version (see :class:`ReferenceData`)
+    and their version is recorded on the producers written to.
+
+    The result of :func:`write` is a dictionary keyed by producer name::
+
+        {'netbook01': {'saved': 1200, 'seconds': 4.2, 'current': ['app_label.ModelName']},
+         'netbook02': {'skipped': 'pending outgoing transactions'},
+         'netbook03': {'error': '...'}}
+    """
+
+    def __init__(self, producer_names, using=None, max_workers=None, codec=None, processes=None):
+        self.producer_names = list(producer_names)
+        self.using = using or 'default'
+        self.max_workers = max_workers or 4
+        self.codec = codec or JsonRowCodec()
+        self.processes = processes
+        self.reference_data = ReferenceData(self.using)
+        self.payloads = []
+        self.models = []
+
+    @classmethod
+    def list_models(cls, app_label, base_cls):
+        """Returns the model classes of the app that are subclasses of base_cls, as in
+        :func:`DispatchController.dispatch_list_models`."""
+        return [model_cls for model_cls in get_models(get_app(app_label)) if issubclass(model_cls, base_cls)]
+
+    def add_model(self, model_cls):
+        """Encodes all instances of the model class on ``using`` once."""
+        version = None
+        if self.reference_data.is_reference_model(model_cls):
+            version = self.reference_data.version(model_cls)
+        if self.processes:
+            payloads = [payload for payload, _ in ProcessPoolEncoder(
+                model_cls, self.using, processes=self.processes, codec=self.codec, with_crypts=True).chunks()]
+        else:
+            instances = list(model_cls.objects.using(self.using).all())
+            payloads = [self.codec.encode(list(BaseController.update_model_crypts(instances)) + instances)]
+        self.payloads.append((model_cls, version, payloads))
+        self.models.append(model_cls)
+
+    def add(self, model_instances, model_cls=None, version=None):
+        """Encodes the model instances once. Add in load order, e.g. list models first."""
+        self.payloads.append((model_cls, version, [self.codec.encode(model_instances)]))
+
+    @property
+    def payload_bytes(self):
+        return sum([len(payload) for _, _, payloads in self.payloads for payload in payloads])
+
+    def write(self):
+        """Writes the payloads to all producers concurrently and returns the status per producer."""
+        status = {}
+        # decoded once, deserialized per producer
+        objects = [(model_cls, version, [self.codec.decode(payload) for payload in payloads])
+                   for model_cls, version, payloads in self.payloads]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.producer_names) or 1)) as executor:
+            futures = dict(
+                (executor.submit(self.write_producer, producer_name, objects), producer_name)
+                for producer_name in self.producer_names)
+            for future, producer_name in futures.items():
+                try:
+                    status[producer_name] = future.result()
+                except Exception as e:
+                    logger.error('Fan out failed for producer \'{0}\'. Got {1}'.format(producer_name, str(e)))
+                    status[producer_name] = {'error': str(e)}
+        return status
+
+    def write_producer(self, producer_name, objects):
+        """Saves all payloads on one producer in one transaction, so an error saving
+        any instance rolls back the producer's whole write. Runs in a worker thread."""
+        started = time.time()
+        saved = 0
+        current = []
+        try:
+            registered_controllers.acquire_producer(producer_name, using=self.using)
+        except AlreadyRegisteredController as e:
+            return {'skipped': str(e)}
+        try:
+            if TransactionHelper().has_outgoing(producer_name):
+                return {'skipped': 'pending outgoing transactions'}
+            with transaction.atomic(using=producer_name):
+                for model_cls, version, payloads_objects in objects:
+                    if version and self.reference_data.is_current(model_cls, producer_name):
+                        current.append('{0}.{1}'.format(model_cls._meta.app_label, model_cls._meta.object_name))
+                        continue
+                    for payload_objects in payloads_objects:
+                        for deserialized_object in serializers.deserialize(
+                                'python', payload_objects, use_natural_keys=True, using=producer_name):
+                            deserialized_object.save(using=producer_name)
+                            saved += 1
+                    if version:
+                        self.reference_data.record(model_cls, producer_name, version)
+        finally:
+            registered_controllers.release_producer(producer_name, using=self.using)
+            # each thread has its own connection for the alias
+            connections[producer_name].close()
+        return {'saved': saved, 'seconds': round(time.time() - started, 3), 'current': current}
@@ -0,0 +1,270 @@
+import hashlib
+
+from datetime import datetime
+
+from django.db import connections
+from django.utils.encoding import force_text
+
+
+def _md5(value):
+    return None if value is None else hashlib.md5(force_text(value).encode('utf-8')).hexdigest()
+
+
+def _hex8(value, start):
+    return None if value is None else int(value[start - 1:start + 7], 16)
+
+
+class ModelDigest(object):
+    """Computes per-row hashes over the field values of a set of model
+    instances on one database, a digest per bucket of rows and a single
+    root hash of the bucket digests.
+
+    Two digests of the same rows on different databases are compared
+    with :func:`compare`: if the roots match nothing more is done,
+    otherwise only the row hashes of mismatching buckets are compared.
+
+    With method 'database' (the default on mysql, postgresql and sqlite)
+    the row hashes are computed by the database and only aggregated per
+    bucket, so a digest transfers one row per bucket. Row hashes, not
+    field values, are fetched only for the buckets that differ. The bucket
+    digest is then the row count and two sums of the row hashes, a
+    checksum rather than a Merkle hash, and the row hashes depend on how
+    the vendor casts values to text, so these digests only compare between
+    databases of the same vendor. :func:`compare` falls back to method
+    'python' if the vendors differ. With method 'python' the field values
+    are read with values_list and hashed here, and the bucket digest is
+    the hash of the bucket's sorted row hashes.
+
+    Args:
+        model_cls: the model class.
+        using: settings.DATABASES key to read from.
+        pks: the pks to digest. If None, all instances of the model.
+
+    Keywords:
+        exclude_fields: field attnames to leave out of the row hash.
+        bucket_count: number of buckets rows are distributed over (default=256).
+        chunk_size: number of pks per query (default=500).
+        method: 'database' or 'python' (default='database' if the vendor is supported).
+    """
+
+    DATABASE_VENDORS = ['mysql', 'postgresql', 'sqlite']
+    NULL = '<null>'
+
+    def __init__(self, model_cls, using, pks=None, **kwargs):
+        self.model_cls = model_cls
+        self.using = using
+        self.pks = None if pks is None else sorted(set([force_text(pk) for pk in pks]))
+        self.exclude_fields = kwargs.get('exclude_fields', None) or []
+        self.bucket_count = kwargs.get('bucket_count', None) or 256
+        self.chunk_size = kwargs.get('chunk_size', None) or 500
+        self.method = kwargs.get('method', None) or self.default_method(using)
+        self.vendor = connections[using].vendor
+        self._row_digests = None
+        self._bucket_rows = None
+        self._bucket_digests = None
+
+    def __repr__(self):
+        return 'ModelDigest({0}, {1})'.format(self.model_cls._meta.object_name, self.using)
+
+    @classmethod
+    def default_method(cls, *using):
+        """Returns 'database' if all the aliases are of the same supported vendor, otherwise 'python'."""
+        vendors = set([connections[alias].vendor for alias in using])
+        if len(vendors) == 1 and vendors.pop() in cls.DATABASE_VENDORS:
+            return 'database'
+        return 'python'
+
+    @property
+    def attnames(self):
+        return [field.attname for field in self.model_cls._meta.fields
+                if field.attname not in self.exclude_fields]
+
+    @property
+    def columns(self):
+        return [field.column for field in self.model_cls._meta.fields
+                if field.attname not in self.exclude_fields]
+
+    def hash_values(self, values):
+        """Returns the hex digest of a sequence of field values."""
+        hasher = hashlib.sha1()
+        for value in values:
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            hasher.update(force_text(value).encode('utf-8'))
+            hasher.update(b'\x1f')
+        return hasher.hexdigest()
+
+    def bucket(self, pk):
+        """Returns the bucket number of a pk."""
+        return int(hashlib.sha1(force_text(pk).encode('utf-8')).hexdigest()[:8], 16) % self.bucket_count
+
+    def _values(self):
+        attnames = self.attnames
+        pk_index = attnames.index(self.model_cls._meta.pk.attname)
+        queryset = self.model_cls.objects.using(self.using)
+        if self.pks is None:
+            for values in queryset.values_list(*attnames).iterator():
+                yield force_text(values[pk_index]), values
+        else:
+            for index in range(0, len(self.pks), self.chunk_size):
+                for values in queryset.filter(pk__in=self.pks[index:index + self.chunk_size]).values_list(*attnames):
+                    yield force_text(values[pk_index]), values
+
+    @property
+    def row_digests(self):
+        """Returns a dictionary of {pk: row hash} (method 'python')."""
+        if self._row_digests is None:
+            self._row_digests = dict((pk, self.hash_values(values)) for pk, values in self._values())
+        return self._row_digests
+
+    @property
+    def bucket_rows(self):
+        """Returns a dictionary of {bucket: {pk: row hash}} (method 'python')."""
+        if self._bucket_rows is None:
+            self._bucket_rows = {}
+            for pk, row_digest in self.row_digests.items():
+                self._bucket_rows.setdefault(self.bucket(pk), {})[pk] = row_digest
+        return self._bucket_rows
+
+    @property
+    def bucket_digests(self):
+        """Returns a dictionary of {bucket: bucket hash}."""
+        if self._bucket_digests is None:
+            if self.method == 'database':
+                self._bucket_digests = self._database_bucket_digests()
+            else:
+                self._bucket_digests = dict(
+                    (bucket, self.hash_values([item for pair in sorted(rows.items()) for item in pair]))
+                    for bucket, rows in self.bucket_rows.items())
+        return self._bucket_digests
+
+    @property
+    def root(self):
+        """Returns the hash of all bucket hashes."""
+        return self.hash_values(
+            [item for pair in sorted(self.bucket_digests.items()) for item in pair])
+
+    def get_bucket_rows(self, buckets):
+        """Returns a dictionary of {bucket: {pk: row hash}} for the buckets only."""
+        if self.method == 'database':
+            return self._database_bucket_rows(buckets)
+        return dict((bucket, self.bucket_rows.get(bucket, {})) for bucket in buckets)
+
+    def compare(self, other):
+        """Compares with a digest of the same model on another database.
+
+        Both digests must use the same bucket_count and method. Digests with
+        method 'database' of databases of different vendors are compared
+        with method 'python' instead.
+
+        Returns a dictionary of pks that are 'diverged', 'missing' from
+        other or 'extra' in other, drilling down only into mismatching buckets."""
+        if self.bucket_count != other.bucket_count:
+            raise ValueError('Cannot compare digests with different bucket counts. Got {0} and {1}.'.format(
+                self.bucket_count, other.bucket_count))
+        if self.method != other.method:
+            raise ValueError('Cannot compare digests of different methods. Got {0} and {1}.'.format(
+                self.method, other.method))
+        if self.method == 'database' and self.vendor != other.vendor:
+            return self.python_digest().compare(other.python_digest())
+        result = {'diverged': [], 'missing': [], 'extra': []}
+        if self.root == other.root:
+            return result
+        buckets = [bucket for bucket in set(self.bucket_digests.keys()) | set(other.bucket_digests.keys())
+                   if self.bucket_digests.get(bucket) != other.bucket_digests.get(bucket)]
+        my_bucket_rows = self.get_bucket_rows(buckets)
+        their_bucket_rows = other.get_bucket_rows(buckets)
+        for bucket in buckets:
+            mine = my_bucket_rows.get(bucket, {})
+            theirs = their_bucket_rows.get(bucket, {})
+            for pk, row_digest in mine.items():
+                if pk not in theirs:
+                    result['missing'].append(pk)
+                elif theirs[pk] != row_digest:
+                    result['diverged'].append(pk)
+            result['extra'].extend([pk for pk in theirs if pk not in mine])
+        for key in result:
+            result[key].sort()
+        return result
+
+    def python_digest(self):
+        """Returns a digest of the same rows with method 'python'."""
+        return self.__class__(self.model_cls, self.using, self.pks, exclude_fields=self.exclude_fields,
+                              bucket_count=self.bucket_count, chunk_size=self.chunk_size, method='python')
+
+    def _expressions(self, connection):
+        """Returns the SQL of the (bucket, row hash) select list and the hex to integer template."""
+        quote_name = connection.ops.quote_name
+        pk_column = quote_name(self.model_cls._meta.pk.column)
+        if connection.vendor == 'mysql':
+            texts = ['COALESCE(CAST({0} AS CHAR), \'{1}\')'.format(quote_name(column), self.NULL)
+                     for column in self.columns]
+            row_hash = 'MD5(CONCAT_WS(CHAR(31), {0}))'.format(', '.join(texts))
+            hex8 = 'CAST(CONV(SUBSTRING({0}, {1}, 8), 16, 10) AS UNSIGNED)'
+            bucket = 'MOD({0}, {1})'.format(hex8.format('MD5(CAST({0} AS CHAR))'.format(pk_column), 1),
+                                            self.bucket_count)
+        elif connection.vendor == 'postgresql':
+            texts = ['COALESCE(CAST({0} AS TEXT), \'{1}\')'.format(quote_name(column), self.NULL)
+                     for column in self.columns]
+            row_hash = 'MD5(CONCAT_WS(CHR(31), {0}))'.format(', '.join(texts))
+            hex8 = '((\'x\' || SUBSTR({0}, {1}, 8))::bit(32)::bigint)'
+            bucket = 'MOD({0}, {1})'.format(hex8.format('MD5(CAST({0} AS TEXT))'.format(pk_column), 1),
+                                            self.bucket_count)
+        else:
+            # sqlite has no md5, use python functions registered on the connection
+            connection.ensure_connection()
+            connection.connection.create_function('dispatch_md5', 1, _md5)
+            connection.connection.create_function('dispatch_hex8', 2, _hex8)
+            texts = ['COALESCE(CAST({0} AS TEXT), \'{1}\')'.format(quote_name(column), self.NULL)
+                     for column in self.columns]
+            row_hash = 'dispatch_md5({0})'.format(' || CHAR(31) || '.join(texts))
+            hex8 = 'dispatch_hex8({0}, {1})'
+            bucket = '({0} %% {1})'.format(hex8.format('dispatch_md5({0})'.format(pk_column), 1),
+                                           self.bucket_count)
+        select = '{0} AS pk, {1} AS bucket, {2} AS row_hash FROM {3}'.format(
+            pk_column, bucket, row_hash, quote_name(self.model_cls._meta.db_table))
+        return select, hex8, pk_column
+
+    def _pk_chunks(self):
+        if self.pks is None:
+            yield None
+        else:
+            for index in range(0, len(self.pks), self.chunk_size):
+                yield self.pks[index:index + self.chunk_size]
+
+    def _database_bucket_digests(self):
+        connection = connections[self.using]
+        select, hex8, pk_column = self._expressions(connection)
+        totals = {}
+        for pks in self._pk_chunks():
+            where, params = '', []
+            if pks is not None:
+                where = ' WHERE {0} IN ({1})'.format(pk_column, ', '.join(['%s'] * len(pks)))
+                params = pks
+            sql = ('SELECT bucket, COUNT(*), SUM({0}), SUM({1}) FROM (SELECT {2}{3}) AS digest '
+                   'GROUP BY bucket').format(hex8.format('row_hash', 1), hex8.format('row_hash', 9), select, where)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                for bucket, count, sum1, sum2 in cursor.fetchall():
+                    total = totals.setdefault(int(bucket), [0, 0, 0])
+                    total[0] += int(count)
+                    total[1] += int(sum1 or 0)
+                    total[2] += int(sum2 or 0)
+        return dict((bucket, '{0}:{1}:{2}'.format(*total)) for bucket, total in totals.items())
+
+    def _database_bucket_rows(self, buckets):
+        connection = connections[self.using]
+        select, _, pk_column = self._expressions(connection)
+        bucket_rows = {}
+        buckets = sorted(buckets)
+        for pks in self._pk_chunks():
+            for index in range(0, len(buckets), self.chunk_size):
+                bucket_chunk = buckets[index:index + self.chunk_size]
+                where = ' WHERE {0} IN ({1})'.format(pk_column, ', '.join(['%s'] * len(pks))) if pks else ''
+                sql = 'SELECT pk, bucket, row_hash FROM (SELECT {0}{1}) AS digest WHERE bucket IN ({2})'.format(
+                    select, where, ', '.join(['%s'] * len(bucket_chunk)))
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, (pks or []) + bucket_chunk)
+                    for pk, bucket, row_hash in cursor.fetchall():
+                        bucket_rows.setdefault(int(bucket), {})[force_text(pk)] = row_hash
+        return bucket_rows
@@ -0,0 +1,129 @@
+import hashlib
+import re
+import time
+import zlib
+
+from collections import Counter
+
+
+class PayloadCompressor(object):
+    """Compresses dispatch payloads with zlib and an optional preset
+    dictionary.
+
+    Serialized rows repeat the same field names and many of the same
+    values across containers so a dictionary trained on representative
+    payloads (see :func:`train`) lets even small segments compress well.
+    The dictionary is identified by :attr:`dictionary_version`, the
+    first 12 characters of its sha1, and must be the same on both ends.
+
+    zlib's ``zdict`` is not available on Python 2 so, on all interpreters,
+    the dictionary is primed instead: the compressor and decompressor are
+    first fed the dictionary, up to a sync flush, and copied for each
+    payload. Only the deflate blocks after the flush are stored, so the
+    payload back-references the dictionary as with ``zdict``, but the
+    stream is not zdict compatible; its method is 'zlib-primed'.
+
+    Counters of raw and compressed bytes and of the time spent compressing
+    are kept for reporting.
+    """
+
+    METHOD = 'zlib'
+    PRIMED_METHOD = 'zlib-primed'
+    MAX_DICTIONARY_SIZE = 32768
+
+    def __init__(self, dictionary=None, level=None):
+        if dictionary and len(dictionary) > self.MAX_DICTIONARY_SIZE:
+            raise ValueError('zlib dictionary may not exceed {0} bytes. Got {1}.'.format(
+                self.MAX_DICTIONARY_SIZE, len(dictionary)))
+        self.dictionary = dictionary or None
+        self.level = 6 if level is None else level
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_seconds = 0.0
+        self._compressor = None
+        self._decompressor = None
+
+    @classmethod
+    def from_file(cls, path, level=None):
+        with open(path, 'rb') as f:
+            return cls(dictionary=f.read(), level=level)
+
+    @property
+    def method(self):
+        return self.PRIMED_METHOD if self.dictionary else self.METHOD
+
+    @property
+    def dictionary_version(self):
+        if not self.dictionary:
+            return None
+        return hashlib.sha1(self.dictionary).hexdigest()[:12]
+
+    def compress(self, data, chunk_size=65536):
+        """Returns the compressed bytes, feeding the compressor chunk by chunk."""
+        started = time.time()
+        if self.dictionary:
+            if not self._compressor:
+                self._compressor = zlib.compressobj(self.level)
+                self._compressor.compress(self.dictionary)
+                self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            compressor = self._compressor.copy()
+        else:
+            compressor = zlib.compressobj(self.level)
+        chunks = [compressor.compress(data[index:index + chunk_size])
+                  for index in range(0, len(data), chunk_size)]
+        chunks.append(compressor.flush())
+        compressed = b''.join(chunks)
+        self.compress_seconds += time.time() - started
+        self.raw_bytes += len(data)
+        self.compressed_bytes += len(compressed)
+        return compressed
+
+    def decompress(self, data):
+        if self.dictionary:
+            if not self._decompressor:
+                # any encoding of the dictionary primes the window, the level does not matter
+                primer = zlib.compressobj(self.level)
+                self._decompressor = zlib.decompressobj()
+                self._decompressor.decompress(primer.compress(self.dictionary) + primer.flush(zlib.Z_SYNC_FLUSH))
+            decompressor = self._decompressor.copy()
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    @property
+    def ratio(self):
+        if not self.raw_bytes:
+            return None
+        return float(self.compressed_bytes) / self.raw_bytes
+
+    def stats(self):
+        return {'method': self.method,
+                'dictionary': self.dictionary_version,
+                'raw_bytes': self.raw_bytes,
+                'compressed_bytes': self.compressed_bytes,
+                'compress_seconds': round(self.compress_seconds, 3)}
+
+    @classmethod
+    def train(cls, samples, size=None):
+        """Returns a preset dictionary built from a list of representative
+        json payloads (bytes).
+
+        zlib has no trainer so the dictionary is the concatenation of the
+        json keys and string values that save the most bytes (count x length)
+        across the samples, with the most valuable last as zlib finds
+        matches nearest the end of the dictionary cheapest."""
+        size = min(size or cls.MAX_DICTIONARY_SIZE, cls.MAX_DICTIONARY_SIZE)
+        counter = Counter()
+        for sample in samples:
+            counter.update(re.findall(br'"(?:[^"\\]|\\.){2,64}"\s*:?\s*', sample))
+        scored = sorted(
+            [(count * len(token), token) for token, count in counter.items() if count > 1],
+            reverse=True)
+        selected = []
+        total = 0
+        for _, token in scored:
+            if total + len(token) > size:
+                continue
+            selected.append(token)
+            total += len(token)
+        return b''.join(reversed(selected))
@@ -0,0 +1,75 @@
+import threading
+
+from django.db import connections
+from django.utils import six
+from django.utils.six.moves import queue
+
+
+class Pipeline(object):
+    """Overlaps producing and consuming items with a bounded queue.
+
+    :func:`run` iterates ``items`` in a reader thread, e.g. to page through
+    a source queryset and encode each page, while the calling thread
+    consumes them, e.g. by writing them to the destination. The reader
+    blocks once ``depth`` items are waiting, so ``depth`` is the
+    backpressure between a fast source and a slow destination or the
+    other way round.
+
+    An exception in the reader is raised in the calling thread; if the
+    consumer raises, the reader is stopped. The reader thread's
+    connections to ``using``, an alias or list of aliases, are closed
+    when it is done.
+    """
+
+    DONE = object()
+
+    def __init__(self, depth=None, using=None):
+        self.depth = depth or 2
+        self.using = [using] if isinstance(using, six.string_types) else list(using or [])
+
+    def run(self, items, consume):
+        """Consumes the items and returns the number consumed."""
+        pipe = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read, args=(items, pipe, stop))
+        reader.daemon = True
+        reader.start()
+        try:
+            return self._consume(pipe, consume)
+        finally:
+            stop.set()
+            reader.join()
+
+    def _put(self, pipe, stop, item):
+        """Puts an item on the pipe, returns False if stopped before there is room."""
+        while not stop.is_set():
+            try:
+                pipe.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self, items, pipe, stop):
+        """Puts (error, item) tuples on the pipe. Runs in the reader thread."""
+        try:
+            for item in items:
+                if not self._put(pipe, stop, (None, item)):
+                    return
+            self._put(pipe, stop, (None, self.DONE))
+        except Exception as e:
+            self._put(pipe, stop, (e, None))
+        finally:
+            for using in self.using:
+                connections[using].close()
+
+    def _consume(self, pipe, consume):
+        consumed = 0
+        while True:
+            error, item = pipe.get()
+            if error:
+                raise error
+            if item is self.DONE:
+                return consumed
+            consume(item)
+            consumed += 1
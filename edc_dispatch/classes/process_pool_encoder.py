@@ -0,0 +1,97 @@
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.db.models import get_model
+
+from .base_controller import BaseController
+from .row_codec import JsonRowCodec, row_codecs
+
+
+def encode_range(app_label, model_name, using, first_pk, last_pk, codec_name, with_crypts, pks=None):
+    """Fetches and encodes the instances of a model in a pk range, or with the pks.
+
+    Runs in a worker process with its own database connection and
+    returns a tuple of (encoded bytes, number of instances)."""
+    if not apps.ready:
+        django.setup()
+    model_cls = get_model(app_label, model_name)
+    if pks is None:
+        queryset = model_cls.objects.using(using).filter(pk__gte=first_pk, pk__lte=last_pk)
+    else:
+        queryset = model_cls.objects.using(using).filter(pk__in=pks)
+    instances = list(queryset.order_by('pk'))
+    if with_crypts:
+        instances = list(BaseController.update_model_crypts(instances)) + instances
+    return row_codecs[codec_name]().encode(instances), len(instances)
+
+
+class ProcessPoolEncoder(object):
+    """Fetches and encodes all instances of a model in worker processes.
+
+    The pks are split into ranges of ``chunk_size``, each range is fetched
+    and encoded by a worker process and the encoded chunks are yielded by
+    :func:`chunks` in pk order. At most two ranges per process are in
+    flight so a slow consumer holds back the workers. Crypts of encrypted
+    fields are hashed and added ahead of each chunk if ``with_crypts`` is True.
+
+    If ``queryset`` is set, only its instances are encoded; the workers
+    fetch each chunk by its pks instead of by pk range.
+
+    Connections of the parent are closed before the pool starts so the
+    worker processes do not share them; do not call from inside a transaction.
+
+    Settings:
+        DISPATCH_PROCESSES: default number of processes (default=number of cpus).
+    """
+
+    def __init__(self, model_cls, using=None, chunk_size=None, processes=None, codec=None, with_crypts=None,
+                 queryset=None):
+        self.model_cls = model_cls
+        self.queryset = queryset
+        self.using = using or 'default'
+        self.chunk_size = chunk_size or 500
+        self.processes = processes or getattr(settings, 'DISPATCH_PROCESSES', None) or multiprocessing.cpu_count()
+        self.codec = codec or JsonRowCodec()
+        self.with_crypts = with_crypts
+
+    def pk_ranges(self):
+        """Returns a list of (first pk, last pk, pks) covering ``chunk_size`` instances each.
+
+        pks is None unless ``queryset`` is set."""
+        pk_ranges = []
+        pks = []
+        queryset = self.model_cls.objects.using(self.using) if self.queryset is None else self.queryset
+        for pk in queryset.order_by('pk').values_list('pk', flat=True).iterator():
+            pks.append(pk)
+            if len(pks) == self.chunk_size:
+                pk_ranges.append((pks[0], pks[-1], None if self.queryset is None else pks))
+                pks = []
+        if pks:
+            pk_ranges.append((pks[0], pks[-1], None if self.queryset is None else pks))
+        return pk_ranges
+
+    def chunks(self, pk_ranges=None):
+        """Yields a tuple of (encoded bytes, number of instances) per pk range, in pk order."""
+        pk_ranges = self.pk_ranges() if pk_ranges is None else pk_ranges
+        if not pk_ranges:
+            return
+        for connection in connections.all():
+            connection.close()
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            max_in_flight = 2 * self.processes
+            futures = deque()
+            for first_pk, last_pk, pks in pk_ranges:
+                futures.append(executor.submit(
+                    encode_range, self.model_cls._meta.app_label, self.model_cls._meta.object_name,
+                    self.using, first_pk, last_pk, self.codec.name, self.with_crypts, pks))
+                if len(futures) >= max_in_flight:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
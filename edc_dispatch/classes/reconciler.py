@@ -0,0 +1,132 @@
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.db.models import get_model
+
+from ..models import DispatchItemRegister
+
+from .model_digest import ModelDigest
+
+logger = logging.getLogger(__name__)
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+nullhandler = logger.addHandler(NullHandler())
+
+
+class Reconciler(object):
+    """Compares the DispatchItemRegister on the server with the instances
+    found on each producer.
+
+    Register rows are grouped by (producer, model) and existence is
+    checked with one pk__in query per chunk. Producers are reconciled
+    concurrently, each in its own thread and with its own connection
+    to the producer's settings.DATABASES alias.
+
+    If ``extra`` is True, instances on the producer that are not dispatched
+    to it are reported as 'extra'. This reads every pk of each model on the
+    producer and includes instances the producer created itself, so it is
+    off by default.
+
+    If ``digest`` is True, instances found on both sides are also
+    compared per model with a :class:`ModelDigest` and
+    rows whose field values differ are reported as 'diverged'.
+
+    The result of :func:`reconcile` is a dictionary keyed by producer name::
+
+        {'netbook01': {'found': 10, 'missing': 1, 'extra': 2, 'diverged': 0,
+                       'models': {'app_label.ModelName': {'found': 10, 'missing': 1, 'extra': 2, 'diverged': 0,
+                                                          'missing_pks': ['...'], 'extra_pks': ['...'],
+                                                          'diverged_pks': []}}}}
+    """
+
+    def __init__(self, producer_names, using=None, max_workers=None, chunk_size=None, digest=None, extra=None):
+        self.producer_names = list(producer_names)
+        self.digest = digest
+        self.extra = extra
+        self.using = using or 'default'
+        self.max_workers = max_workers or 4
+        self.chunk_size = chunk_size or 500
+
+    def get_dispatched_pks(self):
+        """Returns a dictionary of {producer_name: {(app_label, model_name): {container_pk: set(item_pks)}}}
+        for all dispatched items of the producers using a single query."""
+        dispatched_pks = dict((producer_name, {}) for producer_name in self.producer_names)
+        values = DispatchItemRegister.objects.using(self.using).filter(
+            producer__name__in=self.producer_names,
+            is_dispatched=True).values_list(
+                'producer__name', 'item_app_label', 'item_model_name', 'dispatch_container_register', 'item_pk')
+        for producer_name, app_label, model_name, container_pk, item_pk in values.iterator():
+            dispatched_pks[producer_name].setdefault(
+                (app_label, model_name), {}).setdefault(container_pk, set()).add(item_pk)
+        return dispatched_pks
+
+    def reconcile(self):
+        """Reconciles all producers concurrently and returns the summary."""
+        dispatched_pks = self.get_dispatched_pks()
+        summary = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.producer_names) or 1)) as executor:
+            futures = dict(
+                (executor.submit(self.reconcile_producer, producer_name, dispatched_pks[producer_name]), producer_name)
+                for producer_name in self.producer_names)
+            for future, producer_name in futures.items():
+                try:
+                    summary[producer_name] = future.result()
+                except Exception as e:
+                    logger.error('Reconcile failed for producer \'{0}\'. Got {1}'.format(producer_name, str(e)))
+                    summary[producer_name] = {'error': str(e)}
+        return summary
+
+    def reconcile_producer(self, producer_name, model_pks):
+        """Returns the summary for one producer. Runs in a worker thread."""
+        summary = {'found': 0, 'missing': 0, 'extra': 0, 'diverged': 0, 'models': {}}
+        try:
+            for (app_label, model_name), container_pks in model_pks.items():
+                model_cls = get_model(app_label, model_name)
+                if not model_cls:
+                    logger.warning('Unknown model {0}.{1} in DispatchItemRegister'.format(app_label, model_name))
+                    continue
+                model_summary = self.reconcile_model(producer_name, model_cls, container_pks)
+                summary['models']['{0}.{1}'.format(app_label, model_name)] = model_summary
+                for key in ['found', 'missing', 'extra', 'diverged']:
+                    summary[key] += model_summary[key]
+        finally:
+            # each thread has its own connection for the alias
+            connections[producer_name].close()
+        return summary
+
+    def reconcile_model(self, producer_name, model_cls, container_pks):
+        """Returns the found/missing/extra/diverged counts and pks for one model on one producer.
+
+        Args:
+            container_pks: a dictionary of {container_pk: set(item_pks)}."""
+        pks = set([str(pk) for item_pks in container_pks.values() for pk in item_pks])
+        found = set()
+        pk_list = sorted(pks)
+        for index in range(0, len(pk_list), self.chunk_size):
+            found.update([str(pk) for pk in model_cls.objects.using(producer_name).filter(
+                pk__in=pk_list[index:index + self.chunk_size]).values_list('pk', flat=True)])
+        extra = set()
+        if self.extra:
+            extra = set([str(pk) for pk in model_cls.objects.using(producer_name).values_list(
+                'pk', flat=True).iterator()]) - pks
+        missing = pks - found
+        diverged = set()
+        if self.digest and found:
+            # one digest per side for all found instances of the model; bucket hashes
+            # are computed by each database and only mismatching buckets drilled into
+            method = ModelDigest.default_method(self.using, producer_name)
+            source_digest = ModelDigest(model_cls, self.using, found, chunk_size=self.chunk_size, method=method)
+            producer_digest = ModelDigest(model_cls, producer_name, found, chunk_size=self.chunk_size, method=method)
+            diverged.update(source_digest.compare(producer_digest)['diverged'])
+        return {'found': len(found),
+                'missing': len(missing),
+                'extra': len(extra),
+                'diverged': len(diverged),
+                'missing_pks': sorted(missing),
+                'extra_pks': sorted(extra),
+                'diverged_pks': sorted(diverged)}
@@ -0,0 +1,89 @@
+import hashlib
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from lis.base.model.models import BaseLabListModel, BaseLabListUuidModel
+
+from edc.base.model.models import BaseListModel
+from edc.core.bhp_variables.models import StudySite
+from edc_subject.visit_schedule.models import VisitDefinition, ScheduleGroup
+
+from ..models import ReferenceDataVersion
+
+from .model_digest import ModelDigest
+
+
+class ReferenceData(object):
+    """Computes a content version for reference models on the source and
+    compares it with the version recorded on a destination.
+
+    Reference models are list models, lab list models, visit definitions,
+    schedule groups and study sites. The version of a model is the sha1
+    of its row count and max ``modified`` or, if ``digest`` is True, the
+    :class:`ModelDigest` root of all its rows, which also catches edits
+    that do not touch ``modified``.
+
+    A controller skips a reference model, including the per-row foreign
+    key checks, if the destination already holds the same version, and
+    records the version once the whole model has been sent.
+
+    Settings:
+        DISPATCH_REFERENCE_DATA_DIGEST: default for ``digest`` (default=False).
+    """
+
+    reference_base_models = (BaseListModel, BaseLabListModel, BaseLabListUuidModel,
+                             VisitDefinition, ScheduleGroup, StudySite)
+
+    def __init__(self, using_source, digest=None):
+        self.using_source = using_source
+        if digest is None:
+            digest = getattr(settings, 'DISPATCH_REFERENCE_DATA_DIGEST', False)
+        self.digest = digest
+        self._versions = {}
+        self._current = {}
+
+    def is_reference_model(self, model_cls):
+        return issubclass(model_cls, self.reference_base_models)
+
+    def version(self, model_cls):
+        """Returns a tuple of (version, row count, max modified) of the model on the source."""
+        if model_cls not in self._versions:
+            queryset = model_cls.objects.using(self.using_source)
+            max_modified = None
+            if 'modified' in [field.name for field in model_cls._meta.fields]:
+                aggregate = queryset.aggregate(row_count=Count('pk'), max_modified=Max('modified'))
+                row_count, max_modified = aggregate['row_count'], aggregate['max_modified']
+            else:
+                row_count = queryset.count()
+            if self.digest:
+                version = ModelDigest(model_cls, self.using_source).root
+            else:
+                version = hashlib.sha1('{0}|{1}'.format(
+                    row_count, max_modified.isoformat() if max_modified else '').encode('utf-8')).hexdigest()
+            self._versions[model_cls] = (version, row_count, max_modified)
+        return self._versions[model_cls]
+
+    def is_current(self, model_cls, using_destination):
+        """Returns True if model_cls is a reference model and the destination holds its current version."""
+        key = (model_cls, using_destination)
+        if key not in self._current:
+            self._current[key] = self.is_reference_model(model_cls) and (
+                ReferenceDataVersion.objects.get_version(
+                    model_cls._meta.app_label, model_cls._meta.object_name, using=using_destination) ==
+                self.version(model_cls)[0])
+        return self._current[key]
+
+    def record(self, model_cls, using_destination, version=None):
+        """Records the version, computed before the model was sent, on the destination."""
+        version, row_count, max_modified = version or self.version(model_cls)
+        ReferenceDataVersion.objects.using(using_destination).update_or_create(
+            app_label=model_cls._meta.app_label,
+            model_name=model_cls._meta.object_name,
+            defaults={'version': version,
+                      'row_count': row_count,
+                      'max_modified': max_modified,
+                      'updated': datetime.today()})
+        self._current[(model_cls, using_destination)] = True
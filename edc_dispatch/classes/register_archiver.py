@@ -0,0 +1,92 @@
+import logging
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import (DispatchItemRegister, DispatchContainerRegister,
+                      DispatchItemRegisterArchive, DispatchContainerRegisterArchive)
+
+logger = logging.getLogger(__name__)
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+nullhandler = logger.addHandler(NullHandler())
+
+
+class RegisterArchiver(object):
+    """Moves returned dispatch register rows into the archive tables in batches.
+
+    Only rows with is_dispatched=False and a return_datetime older than
+    ``archive_after_days`` are moved. Item registers are moved first; a
+    container register is moved once none of its item registers remain
+    in the active table.
+
+    Settings:
+        DISPATCH_ARCHIVE_AFTER_DAYS: default age in days (default=90).
+        DISPATCH_ARCHIVE_BATCH_SIZE: default rows per batch (default=1000).
+    """
+
+    item_fields = ['id', 'created', 'modified', 'producer', 'is_dispatched', 'dispatch_datetime',
+                   'return_datetime', 'dispatch_container_register', 'item_app_label', 'item_model_name',
+                   'item_identifier_attrname', 'item_identifier', 'item_pk', 'dispatch_host',
+                   'dispatch_using', 'registered_subjects']
+
+    container_fields = ['id', 'created', 'modified', 'producer', 'is_dispatched', 'dispatch_datetime',
+                        'return_datetime', 'container_app_label', 'container_model_name',
+                        'container_identifier_attrname', 'container_identifier', 'container_pk',
+                        'dispatched_using', 'dispatch_items']
+
+    def __init__(self, using=None, archive_after_days=None, batch_size=None):
+        self.using = using or 'default'
+        if archive_after_days is None:
+            archive_after_days = getattr(settings, 'DISPATCH_ARCHIVE_AFTER_DAYS', 90)
+        self.archive_after_days = int(archive_after_days)
+        self.batch_size = int(batch_size or getattr(settings, 'DISPATCH_ARCHIVE_BATCH_SIZE', 1000))
+        if self.batch_size < 1:
+            raise ValueError('Batch size must be greater than 0. Got {0}.'.format(self.batch_size))
+
+    def get_cutoff_datetime(self):
+        return datetime.today() - timedelta(days=self.archive_after_days)
+
+    def archive(self):
+        """Archives returned item and container registers and returns a
+        dictionary of the number of rows moved for each."""
+        return {'items': self.archive_items(), 'containers': self.archive_containers()}
+
+    def archive_items(self):
+        queryset = DispatchItemRegister.objects.using(self.using).filter(
+            is_dispatched=False,
+            return_datetime__lt=self.get_cutoff_datetime())
+        return self._archive_in_batches(
+            queryset, DispatchItemRegister, DispatchItemRegisterArchive, self.item_fields,
+            {'dispatch_container_register': 'dispatch_container_register_pk'})
+
+    def archive_containers(self):
+        queryset = DispatchContainerRegister.objects.using(self.using).filter(
+            is_dispatched=False,
+            return_datetime__lt=self.get_cutoff_datetime(),
+            dispatchitemregister__isnull=True)
+        return self._archive_in_batches(
+            queryset, DispatchContainerRegister, DispatchContainerRegisterArchive, self.container_fields)
+
+    def _archive_in_batches(self, queryset, model_cls, archive_model_cls, fields, rename=None):
+        """Copies rows to the archive model and deletes them from the
+        active model, one transaction per batch."""
+        rename = rename or {}
+        rename.update({'producer': 'producer_id'})
+        archived = 0
+        while True:
+            with transaction.atomic(using=self.using):
+                rows = list(queryset.order_by('return_datetime').values(*fields)[:self.batch_size])
+                if not rows:
+                    break
+                archive_model_cls.objects.using(self.using).bulk_create(
+                    [archive_model_cls(**dict((rename.get(k, k), v) for k, v in row.items())) for row in rows])
+                model_cls.objects.using(self.using).filter(pk__in=[row['id'] for row in rows]).delete()
+            archived += len(rows)
+            logger.info('Archived {0} {1} rows.'.format(archived, model_cls._meta.object_name))
+        return archived
@@ -0,0 +1,71 @@
+from django.db.models import get_model
+
+from edc_sync.exceptions import PendingTransactionError
+
+from ..models import RepairHistory
+
+from .base_controller import BaseController
+
+
+class RepairController(BaseController):
+    """Re-sends only the instances a :class:`Reconciler` reported as
+    missing on, or diverged from, a producer.
+
+    Instances are sent with :func:`_to_json` so their foreign key
+    dependencies and crypts are sent with them, bypassing the
+    :class:`DispatchBatch` ledger. Each repaired model is recorded in
+    :class:`RepairHistory`."""
+
+    def _repr(self):
+        return 'RepairController[{0}]'.format(self.get_producer().settings_key)
+
+    def __init__(self, using_source, using_destination, **kwargs):
+        super(RepairController, self).__init__(using_source, using_destination, **kwargs)
+        self.chunk_size = kwargs.get('chunk_size', None) or 500
+
+    def get_batch_scope(self):
+        """Returns None so the :class:`DispatchBatch` ledger never skips a re-send."""
+        return None
+
+    def repair(self, producer_summary):
+        """Sends missing and diverged instances listed in the summary of one
+        producer from :func:`Reconciler.reconcile` and returns a dictionary
+        of {'app_label.ModelName': number of instances sent}.
+
+        Diverged instances are overwritten with the source copy so pending
+        transactions on the producer must be synced and consumed first."""
+        with self.producer_lock():
+            return self._repair(producer_summary)
+
+    def _repair(self, producer_summary):
+        if self.has_outgoing_transactions():
+            raise PendingTransactionError('Producer \'{0}\' has pending outgoing transactions. '
+                                          'Run bhp_sync first.'.format(self.get_producer_name()))
+        repaired = {}
+        for label, model_summary in producer_summary.get('models', {}).items():
+            missing_pks = model_summary.get('missing_pks', [])
+            diverged_pks = model_summary.get('diverged_pks', [])
+            if not missing_pks and not diverged_pks:
+                continue
+            model_cls = get_model(*label.split('.'))
+            repaired[label] = self.repair_model(model_cls, missing_pks + diverged_pks)
+            RepairHistory.objects.using(self.get_using_source()).create(
+                producer=self.get_producer(),
+                item_app_label=model_cls._meta.app_label,
+                item_model_name=model_cls._meta.object_name,
+                missing_pks='\n'.join(missing_pks) or None,
+                diverged_pks='\n'.join(diverged_pks) or None,
+                repaired=repaired[label])
+        return repaired
+
+    def repair_model(self, model_cls, pks):
+        """Sends the instances of model_cls with the given pks in chunks."""
+        sent = 0
+        pks = sorted(set(pks))
+        for index in range(0, len(pks), self.chunk_size):
+            instances = list(model_cls.objects.using(self.get_using_source()).filter(
+                pk__in=pks[index:index + self.chunk_size]))
+            if instances:
+                self._to_json(instances, additional_base_model_class=model_cls)
+                sent += len(instances)
+        return sent
@@ -1,9 +1,10 @@
 from datetime import datetime
+from django.db import transaction
 from django.db.models import get_model
 from django.db.models.query import QuerySet
 from edc.device.sync.exceptions import PendingTransactionError
 from ..exceptions import DispatchContainerError, AlreadyReturned
-from ..models import DispatchContainerRegister, DispatchItemRegister
+from ..models import DispatchBatch, DispatchContainerRegister, DispatchItemRegister
 from .base_return import BaseReturn
 
 
@@ -18,19 +19,32 @@ class ReturnController(BaseReturn):
         return dispatch_container_cls
 
     def get_user_container_instances_for_producer(self, using=None, **kwargs):
-        """Returns a queryset of dispatched user container instances for this producer."""
+        """Returns a list of dispatched user container instances for this producer."""
         # get the DispatchContainer instance for user's container model app_label and model
-        user_containers = []
         if kwargs.get('selected_container_identifiers', None):
             dispatch_container_registers = DispatchContainerRegister.objects.filter(container_identifier__in=kwargs.get('selected_container_identifiers', None),
                                                                                     producer=self.get_producer(),
                                                                                     is_dispatched=True)
         else:
             dispatch_container_registers = DispatchContainerRegister.objects.filter(producer=self.get_producer(), is_dispatched=True)
+        return self.get_user_containers_for_registers(dispatch_container_registers)
+
+    def get_user_containers_for_registers(self, dispatch_container_registers):
+        """Returns a list of user container instances for the DispatchContainerRegister
+        instances using one query per user container model class and identifier attrname."""
+        identifiers = {}
         for dispatch_container_register in dispatch_container_registers:
-            user_container_cls = get_model(dispatch_container_register.container_app_label, dispatch_container_register.container_model_name)
+            identifiers.setdefault(
+                (dispatch_container_register.container_app_label,
+                 dispatch_container_register.container_model_name,
+                 dispatch_container_register.container_identifier_attrname),
+                []).append(dispatch_container_register.container_identifier)
+        user_containers = []
+        for (app_label, model_name, identifier_attrname), container_identifiers in identifiers.items():
+            user_container_cls = get_model(app_label, model_name)
             if user_container_cls:
-                user_containers.append(user_container_cls.objects.get(**{dispatch_container_register.container_identifier_attrname: dispatch_container_register.container_identifier}))
+                user_containers.extend(user_container_cls.objects.filter(
+                    **{'{0}__in'.format(identifier_attrname): container_identifiers}))
         return user_containers
 
     def get_dispatch_item_instances_for_container(self, dispatch_container_register, using=None):
@@ -63,41 +77,76 @@ class ReturnController(BaseReturn):
                 is_dispatched=True,
                 return_datetime__isnull=True).update(
                     return_datetime=datetime.now(),
-                    is_dispatched=False)
+                    is_dispatched=False,
+                    dispatched_item_identifier=None)
         return dispatch_container_register
 
     def _return_items_for_queryset(self, queryset, using=None):
-        """Returns items in a queryset."""
-        dispatch_container_registers = []
+        """Returns items in a queryset with one UPDATE per model class and
+        returns a list of the affected DispatchContainerRegister pks.
+
+        Raises DispatchItemRegister.DoesNotExist, and returns none of the
+        items, if any item is not dispatched."""
+        item_pks = {}
         for obj in queryset:
-            dispatch_item_register = DispatchItemRegister.objects.using(using).get(
-                item_app_label=obj._meta.app_label,
-                item_model_name=obj._meta.object_name,
-                item_pk=obj.pk,
-                is_dispatched=True,
-                return_datetime__isnull=True)
-            DispatchItemRegister.objects.filter(pk=dispatch_item_register.pk).update(
+            item_pks.setdefault((obj._meta.app_label, obj._meta.object_name), []).append(obj.pk)
+        dispatch_container_register_pks = set()
+        with transaction.atomic(using=using):
+            for (app_label, object_name), pks in item_pks.items():
+                dispatch_item_registers = DispatchItemRegister.objects.using(using).filter(
+                    item_app_label=app_label,
+                    item_model_name=object_name,
+                    item_pk__in=pks,
+                    is_dispatched=True,
+                    return_datetime__isnull=True)
+                dispatched = list(dispatch_item_registers.values_list('item_pk', 'dispatch_container_register'))
+                missing = set([str(pk) for pk in pks]) - set([str(item_pk) for item_pk, _ in dispatched])
+                if missing:
+                    raise DispatchItemRegister.DoesNotExist(
+                        'Items {0} of model {1} are not dispatched.'.format(sorted(missing), object_name))
+                dispatch_container_register_pks.update([pk for _, pk in dispatched])
+                dispatch_item_registers.update(
                     return_datetime=datetime.now(),
-                    is_dispatched=False)
-            # if dispatch_item_register.dispatch_container_register:
-            #    dispatch_container_registers.append(dispatch_item_register.dispatch_container_register)
-        return dispatch_container_registers
+                    is_dispatched=False,
+                    dispatched_item_identifier=None)
+        return list(dispatch_container_register_pks)
 
     def get_dispatch_container_register(self, user_container, using=None):
-        if user_container:
-            if not DispatchContainerRegister.objects.using(using).filter(
-                    container_pk=user_container.pk,
-                    container_model_name=user_container._meta.object_name.lower(),
-                    container_app_label=user_container._meta.app_label,
-                    is_dispatched=True,
-                    return_datetime__isnull=True).exists():
-                raise DispatchContainerError('User container {0} is not registered as a "dispatched" dispatch container. Not found in DispatchContainerRegister'.format(user_container))
-        return DispatchContainerRegister.objects.using(using).get(
-            container_pk=user_container.pk,
-            container_model_name=user_container._meta.object_name.lower(),
-            container_app_label=user_container._meta.app_label,
-            is_dispatched=True,
-            return_datetime__isnull=True)
+        try:
+            return DispatchContainerRegister.objects.using(using).get(
+                container_pk=user_container.pk,
+                container_model_name=user_container._meta.object_name.lower(),
+                container_app_label=user_container._meta.app_label,
+                is_dispatched=True,
+                return_datetime__isnull=True)
+        except DispatchContainerRegister.DoesNotExist:
+            raise DispatchContainerError(
+                'User container {0} is not registered as a "dispatched" dispatch container. '
+                'Not found in DispatchContainerRegister'.format(user_container))
+
+    def get_dispatch_container_registers(self, user_containers, using=None):
+        """Returns a list of dispatched DispatchContainerRegister instances for
+        the user containers using one query per user container model class."""
+        container_pks = {}
+        for user_container in user_containers:
+            if isinstance(user_container, DispatchContainerRegister):
+                raise TypeError('Expected the container model to be a user model. Got DispatchContainerRegister')
+            key = (user_container._meta.app_label, user_container._meta.object_name.lower())
+            container_pks.setdefault(key, []).append(user_container.pk)
+        dispatch_container_registers = []
+        for (app_label, model_name), pks in container_pks.items():
+            registers = list(DispatchContainerRegister.objects.using(using).filter(
+                container_pk__in=pks,
+                container_model_name=model_name,
+                container_app_label=app_label,
+                is_dispatched=True,
+                return_datetime__isnull=True))
+            missing = set([str(pk) for pk in pks]) - set([str(register.container_pk) for register in registers])
+            if missing:
+                raise AlreadyReturned('User containers {0} of model {1} are not dispatched.'.format(
+                    sorted(missing), model_name))
+            dispatch_container_registers.extend(registers)
+        return dispatch_container_registers
 
     def _return_by_queryset(self, queryset):
         """Returns all in a queryset registered with DispatchItemRegister after first checking transactions and dispatch items.
@@ -111,10 +160,15 @@ class ReturnController(BaseReturn):
         if self.has_incoming_transactions():
             raise PendingTransactionError('Producer \'{0}\' has pending incoming transactions on '
                                           'this server. Consume them first.'.format(self.get_producer_name()))
-        dispatch_container_registers = self._return_items_for_queryset(queryset)
-        for dispatch_container_register in dispatch_container_registers:
-            if not DispatchItemRegister.objects.filter(dispatch_container_register=dispatch_container_register, is_dispatched=True, return_datetime__isnull=True):
-                DispatchContainerRegister.objects.filter(pk=dispatch_container_register.pk).update(is_dispatched=False, return_datetime=datetime.today())
+        with transaction.atomic():
+            dispatch_container_register_pks = self._return_items_for_queryset(queryset)
+            # return containers that have no dispatched items left
+            returned_pks = list(DispatchContainerRegister.objects.filter(
+                pk__in=dispatch_container_register_pks).exclude(
+                    dispatchitemregister__is_dispatched=True).values_list('pk', flat=True))
+            DispatchContainerRegister.objects.filter(pk__in=returned_pks).update(
+                is_dispatched=False, return_datetime=datetime.today())
+        self.prune_batches(returned_pks)
 
     def _return_by_user_container(self, user_container):
         """Returns the user container and the dispatch_container_register after first checking transactions and dispatch items."""
@@ -125,38 +179,74 @@ class ReturnController(BaseReturn):
             raise AlreadyReturned('The user container {0} is not dispatched.'.format(user_container))
         # confirm no pending transaction on the producer
         if self.has_outgoing_transactions():
-            raise PendingTransactionError('Producer \'{0}\' with settings_key \'{1}\' has pending outgoing transactions. '
-                                          'Run bhp_sync first.'.format(self.get_producer_name(), self.get_using_destination()))
+            raise PendingTransactionError(
+                'Producer \'{0}\' with settings_key \'{1}\' has pending outgoing transactions. '
+                'Run bhp_sync first.'.format(self.get_producer_name(), self.get_using_destination()))
         # confirm no pending transaction for this producer on the source
         if self.has_incoming_transactions():
             raise PendingTransactionError('Producer \'{0}\' has pending incoming transactions on '
                                           'this server. Consume them first.'.format(self.get_producer_name()))
         # de-register all items for this user container (including the user container)
         dispatch_container_register = self.deregister_all_for_user_container(user_container)
-        DispatchContainerRegister.objects.filter(pk=dispatch_container_register.pk).update(is_dispatched=False, return_datetime=datetime.today())
+        DispatchContainerRegister.objects.filter(pk=dispatch_container_register.pk).update(
+            is_dispatched=False, return_datetime=datetime.today())
+        self.prune_batches([dispatch_container_register.pk])
+
+    def prune_batches(self, dispatch_container_register_pks):
+        """Deletes the producer's :class:`DispatchBatch` ledger of the returned containers."""
+        if dispatch_container_register_pks:
+            DispatchBatch.objects.prune(dispatch_container_register_pks, using=self.get_using_destination())
 
     def _lock_container_in_producer(self, user_container):
         dispatch_container_register = self.get_dispatch_container_register(user_container)
         self._to_json(dispatch_container_register, DispatchContainerRegister)
 
+    def _return_by_user_containers(self, user_containers):
+        """Returns a list of user containers and their items.
+
+        Checks transactions once for the producer, locks all the
+        containers in the producer in one batch, then returns all
+        items and containers with set-based updates in one transaction."""
+        if not user_containers:
+            return []
+        # confirm no pending transaction on the producer
+        if self.has_outgoing_transactions():
+            raise PendingTransactionError(
+                'Producer \'{0}\' with settings_key \'{1}\' has pending outgoing transactions. '
+                'Run bhp_sync first.'.format(self.get_producer_name(), self.get_using_destination()))
+        # confirm no pending transaction for this producer on the source
+        if self.has_incoming_transactions():
+            raise PendingTransactionError('Producer \'{0}\' has pending incoming transactions on '
+                                          'this server. Consume them first.'.format(self.get_producer_name()))
+        dispatch_container_registers = self.get_dispatch_container_registers(user_containers)
+        self._to_json(dispatch_container_registers, DispatchContainerRegister)
+        pks = [dispatch_container_register.pk for dispatch_container_register in dispatch_container_registers]
+        with transaction.atomic():
+            DispatchItemRegister.objects.filter(
+                dispatch_container_register__pk__in=pks,
+                is_dispatched=True,
+                return_datetime__isnull=True).update(
+                    return_datetime=datetime.now(),
+                    is_dispatched=False,
+                    dispatched_item_identifier=None)
+            DispatchContainerRegister.objects.filter(pk__in=pks).update(
+                is_dispatched=False, return_datetime=datetime.today())
+        self.prune_batches(pks)
+        return dispatch_container_registers
+
     def return_selected_items(self, dispatched_container_list):
         if not dispatched_container_list:
             raise TypeError('dispatched container list cannot be None')
-        for user_container in self.get_user_container_instances_for_producer(selected_container_identifiers=dispatched_container_list):
-            if isinstance(user_container, DispatchContainerRegister):
-                raise TypeError('Expected the container model to be a user model. Got DispatchContainerRegister')
-            self._lock_container_in_producer(user_container)
-            self._return_by_user_container(user_container)
+        with self.producer_lock():
+            self._return_by_user_containers(self.get_user_container_instances_for_producer(
+                selected_container_identifiers=dispatched_container_list))
         return 'Containers {0}, have been returned from producer \'{1}\''.format(str(dispatched_container_list), self.get_producer_name())
 
     def return_dispatched_items(self, queryset=None):
-        """Loops thru dispatch container instances for this producer and returns them."""
-        if isinstance(queryset, QuerySet):
-            self._return_by_queryset(queryset)
-        else:
-            for user_container in self.get_user_container_instances_for_producer():
-                if isinstance(user_container, DispatchContainerRegister):
-                    raise TypeError('Expected the container model to be a user model. Got DispatchContainerRegister')
-                self._lock_container_in_producer(user_container)
-                self._return_by_user_container(user_container)
+        """Returns all dispatched containers for this producer or the items in a queryset."""
+        with self.producer_lock():
+            if isinstance(queryset, QuerySet):
+                self._return_by_queryset(queryset)
+            else:
+                self._return_by_user_containers(self.get_user_container_instances_for_producer())
         return 'All containers have been returned from producer \'{0}\''.format(self.get_producer_name())
@@ -0,0 +1,193 @@
+import json
+import struct
+import uuid
+
+from datetime import date, datetime, timedelta
+
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+
+
+class JsonRowCodec(object):
+    """Encodes model instances as the json list of their python-serialized
+    dictionaries. Verbose but human readable, use it for debugging."""
+
+    name = 'json'
+
+    def serialize(self, instances):
+        return serializers.serialize('python', instances, use_natural_keys=True)
+
+    def encode(self, instances):
+        return json.dumps(self.serialize(instances), cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data):
+        """Returns a list of serialized objects for serializers.deserialize('python', ...)."""
+        return json.loads(data.decode('utf-8'))
+
+
+class PackedRowCodec(JsonRowCodec):
+    """Encodes model instances column by column with :mod:`struct`.
+
+    Each run of instances of one model is written as a block::
+
+        header length (4 bytes) | json header | column | column | ...
+
+    The header holds the model, the row count and, once, the name and
+    type code of each column; the pk is the first column. Each column is
+    its byte length (4 bytes), a null bitmap and the packed non-null values.
+    The type of a column is chosen from its values:
+
+        b: booleans, one byte each
+        q: integers, 8 bytes each
+        d: floats, 8 bytes each
+        u: uuids as text with dashes, 16 bytes each
+        h: uuids as 32 hex characters, 16 bytes each
+        T: naive datetimes, 8 bytes of microseconds since the epoch
+        D: dates, 4 bytes of the proleptic ordinal
+        s: text, a 4 byte length for each value then the utf-8 bytes
+        j: anything else (natural keys, m2m, decimals, aware datetimes),
+           as 's' but json encoded
+
+    :func:`decode` returns the same serialized objects as :class:`JsonRowCodec`
+    except that values are typed as above instead of as json, which the
+    python deserializer accepts."""
+
+    name = 'packed'
+    EPOCH = datetime(1970, 1, 1)
+
+    def encode(self, instances):
+        blocks = []
+        objects = self.serialize(instances)
+        start = 0
+        for index in range(1, len(objects) + 1):
+            if index == len(objects) or objects[index]['model'] != objects[start]['model']:
+                blocks.append(self.encode_block(objects[start:index]))
+                start = index
+        return b''.join(blocks)
+
+    def encode_block(self, objects):
+        names = ['pk'] + sorted(objects[0]['fields'].keys())
+        columns = [[obj['pk'] for obj in objects]]
+        columns.extend([[obj['fields'][name] for obj in objects] for name in names[1:]])
+        type_codes = [self.type_code(values) for values in columns]
+        header = json.dumps({'model': objects[0]['model'],
+                             'count': len(objects),
+                             'columns': [list(column) for column in zip(names, type_codes)]}).encode('utf-8')
+        data = [struct.pack('>I', len(header)), header]
+        for type_code, values in zip(type_codes, columns):
+            column = self.encode_column(type_code, values)
+            data.extend([struct.pack('>I', len(column)), column])
+        return b''.join(data)
+
+    def type_code(self, values):
+        values = [value for value in values if value is not None]
+        if not values:
+            return 's'
+        if all([isinstance(value, bool) for value in values]):
+            return 'b'
+        if all([isinstance(value, six.integer_types) and not isinstance(value, bool) for value in values]):
+            return 'q' if all([-2 ** 63 <= value < 2 ** 63 for value in values]) else 'j'
+        if all([isinstance(value, float) for value in values]):
+            return 'd'
+        if all([isinstance(value, datetime) and value.tzinfo is None for value in values]):
+            return 'T'
+        if all([isinstance(value, date) and not isinstance(value, datetime) for value in values]):
+            return 'D'
+        if all([isinstance(value, six.string_types) for value in values]):
+            for type_code, attr in [('u', '__str__'), ('h', 'hex')]:
+                if all([self.is_uuid(value, attr) for value in values]):
+                    return type_code
+            return 's'
+        return 'j'
+
+    def is_uuid(self, value, attr):
+        try:
+            as_text = getattr(uuid.UUID(value), attr)
+        except ValueError:
+            return False
+        return value == (as_text() if callable(as_text) else as_text)
+
+    def encode_column(self, type_code, values):
+        bitmap = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value is not None:
+                bitmap[index // 8] |= 1 << (index % 8)
+        values = [value for value in values if value is not None]
+        count = len(values)
+        if type_code == 'b':
+            packed = struct.pack('>{0}?'.format(count), *values)
+        elif type_code == 'q':
+            packed = struct.pack('>{0}q'.format(count), *values)
+        elif type_code == 'd':
+            packed = struct.pack('>{0}d'.format(count), *values)
+        elif type_code in ['u', 'h']:
+            packed = b''.join([uuid.UUID(value).bytes for value in values])
+        elif type_code == 'T':
+            packed = struct.pack('>{0}q'.format(count), *[self.to_microseconds(value) for value in values])
+        elif type_code == 'D':
+            packed = struct.pack('>{0}i'.format(count), *[value.toordinal() for value in values])
+        else:
+            if type_code == 'j':
+                values = [json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False) for value in values]
+            values = [value.encode('utf-8') for value in values]
+            packed = struct.pack('>{0}I'.format(count), *[len(value) for value in values]) + b''.join(values)
+        return bytes(bitmap) + packed
+
+    def decode(self, data):
+        objects = []
+        offset = 0
+        while offset < len(data):
+            header_length = struct.unpack_from('>I', data, offset)[0]
+            offset += 4
+            header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+            offset += header_length
+            columns = []
+            for _, type_code in header['columns']:
+                column_length = struct.unpack_from('>I', data, offset)[0]
+                offset += 4
+                columns.append(self.decode_column(type_code, header['count'], data[offset:offset + column_length]))
+                offset += column_length
+            names = [name for name, _ in header['columns']]
+            for row in zip(*columns):
+                objects.append({'model': header['model'], 'pk': row[0], 'fields': dict(zip(names[1:], row[1:]))})
+        return objects
+
+    def decode_column(self, type_code, count, data):
+        bitmap_length = (count + 7) // 8
+        bitmap = bytearray(data[:bitmap_length])
+        is_set = [bool(bitmap[index // 8] & (1 << (index % 8))) for index in range(0, count)]
+        data = data[bitmap_length:]
+        set_count = sum(is_set)
+        if type_code == 'b':
+            values = list(struct.unpack('>{0}?'.format(set_count), data))
+        elif type_code == 'q':
+            values = list(struct.unpack('>{0}q'.format(set_count), data))
+        elif type_code == 'd':
+            values = list(struct.unpack('>{0}d'.format(set_count), data))
+        elif type_code in ['u', 'h']:
+            values = [uuid.UUID(bytes=bytes(data[index:index + 16])) for index in range(0, 16 * set_count, 16)]
+            values = [str(value) if type_code == 'u' else value.hex for value in values]
+        elif type_code == 'T':
+            values = [self.EPOCH + timedelta(microseconds=value)
+                      for value in struct.unpack('>{0}q'.format(set_count), data)]
+        elif type_code == 'D':
+            values = [date.fromordinal(value) for value in struct.unpack('>{0}i'.format(set_count), data)]
+        else:
+            lengths = struct.unpack_from('>{0}I'.format(set_count), data)
+            offset = 4 * set_count
+            values = []
+            for length in lengths:
+                values.append(bytes(data[offset:offset + length]).decode('utf-8'))
+                offset += length
+            if type_code == 'j':
+                values = [json.loads(value) for value in values]
+        values = iter(values)
+        return [next(values) if value_is_set else None for value_is_set in is_set]
+
+    def to_microseconds(self, value):
+        delta = value - self.EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+row_codecs = dict((codec_cls.name, codec_cls) for codec_cls in [JsonRowCodec, PackedRowCodec])
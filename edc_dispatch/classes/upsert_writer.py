@@ -0,0 +1,104 @@
+import sqlite3
+
+from django.db import connections, transaction
+
+
+class UpsertWriter(object):
+    """Saves model instances on ``using`` with the backend's native upsert,
+    one statement per run of instances of a model.
+
+        postgresql (9.5+), sqlite (3.24+): INSERT ... ON CONFLICT (pk) DO UPDATE
+        mysql: INSERT ... ON DUPLICATE KEY UPDATE
+
+    On other backends, or older versions, the upsert is emulated in a
+    transaction: the pks on ``using`` are read in one query, the new
+    instances are bulk created and the others updated.
+
+    Instances are written as raw rows, as the deserializer would, so save
+    methods and signals are not called. Instances of models with multi-table
+    inheritance are saved with :func:`save` (raw).
+    """
+
+    # below the parameter limit of older sqlite versions
+    MAX_PARAMS = 999
+
+    def __init__(self, using=None):
+        self.using = using or 'default'
+        self.connection = connections[self.using]
+        self.statement_count = 0
+
+    @property
+    def method(self):
+        vendor = self.connection.vendor
+        if vendor == 'postgresql' and getattr(self.connection, 'pg_version', 0) >= 90500:
+            return 'on_conflict'
+        if vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 24, 0):
+            return 'on_conflict'
+        if vendor == 'mysql':
+            return 'on_duplicate_key'
+        return 'emulated'
+
+    def write(self, instances):
+        """Upserts the instances, keeping their order, and returns the number written."""
+        run = []
+        for instance in instances:
+            if run and run[-1].__class__ != instance.__class__:
+                self.write_model(run)
+                run = []
+            run.append(instance)
+        if run:
+            self.write_model(run)
+        return len(instances)
+
+    def write_model(self, instances):
+        model_cls = instances[0].__class__
+        if model_cls._meta.parents:
+            for instance in instances:
+                instance.save_base(using=self.using, raw=True)
+            return
+        if self.method == 'emulated':
+            return self._emulate(model_cls, instances)
+        fields = model_cls._meta.local_concrete_fields
+        rows_per_statement = max(1, self.MAX_PARAMS // len(fields))
+        for index in range(0, len(instances), rows_per_statement):
+            sql, params = self.upsert_sql(model_cls, fields, instances[index:index + rows_per_statement])
+            with self.connection.cursor() as cursor:
+                cursor.execute(sql, params)
+            self.statement_count += 1
+
+    def upsert_sql(self, model_cls, fields, instances):
+        quote_name = self.connection.ops.quote_name
+        columns = [quote_name(field.column) for field in fields]
+        pk_column = quote_name(model_cls._meta.pk.column)
+        row = '({0})'.format(', '.join(['%s'] * len(fields)))
+        params = []
+        for instance in instances:
+            params.extend([field.get_db_prep_save(getattr(instance, field.attname), connection=self.connection)
+                           for field in fields])
+        sql = 'INSERT INTO {0} ({1}) VALUES {2}'.format(
+            quote_name(model_cls._meta.db_table), ', '.join(columns), ', '.join([row] * len(instances)))
+        update_columns = [column for column in columns if column != pk_column]
+        if self.method == 'on_duplicate_key':
+            sql += ' ON DUPLICATE KEY UPDATE {0}'.format(', '.join(
+                ['{0} = VALUES({0})'.format(column) for column in update_columns or [pk_column]]))
+        elif update_columns:
+            sql += ' ON CONFLICT ({0}) DO UPDATE SET {1}'.format(pk_column, ', '.join(
+                ['{0} = EXCLUDED.{0}'.format(column) for column in update_columns]))
+        else:
+            sql += ' ON CONFLICT ({0}) DO NOTHING'.format(pk_column)
+        return sql, params
+
+    def _emulate(self, model_cls, instances):
+        manager = model_cls._default_manager.db_manager(self.using)
+        pks = [instance.pk for instance in instances]
+        with transaction.atomic(using=self.using):
+            existing = set()
+            for index in range(0, len(pks), self.MAX_PARAMS):
+                existing.update(manager.filter(pk__in=pks[index:index + self.MAX_PARAMS]).values_list('pk', flat=True))
+            new = [instance for instance in instances if instance.pk not in existing]
+            if new:
+                manager.bulk_create(new)
+            for instance in instances:
+                if instance.pk in existing:
+                    instance.save_base(using=self.using, raw=True, force_update=True)
+        self.statement_count += 1
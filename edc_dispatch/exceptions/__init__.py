@@ -67,4 +67,8 @@ class ControllerBaseModelError(Exception):
 
 
 class DispatchControllerError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class DispatchBundleError(Exception):
+    pass
@@ -0,0 +1,45 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...classes import RegisterArchiver
+
+
+class Command(BaseCommand):
+    """Moves returned DispatchItemRegister and DispatchContainerRegister
+    rows older than a given age into the archive tables."""
+
+    help = 'Archives returned dispatch register rows.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days',
+            dest='days',
+            type='int',
+            default=None,
+            help=('Archive rows returned more than this many days ago '
+                  '(default=settings.DISPATCH_ARCHIVE_AFTER_DAYS or 90).')),
+        make_option(
+            '--batch-size',
+            dest='batch_size',
+            type='int',
+            default=None,
+            help=('Rows moved per transaction (default=settings.DISPATCH_ARCHIVE_BATCH_SIZE or 1000).')),
+        make_option(
+            '--using',
+            dest='using',
+            default='default',
+            help=('settings.DATABASES key of the server database (default=\'default\').')),
+        )
+
+    def handle(self, *args, **options):
+        if args:
+            raise CommandError('Command does not accept positional arguments.')
+        try:
+            archiver = RegisterArchiver(
+                using=options['using'], archive_after_days=options['days'], batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        archived = archiver.archive()
+        self.stdout.write('Archived {0} item registers and {1} container registers returned before {2}.'.format(
+            archived['items'], archived['containers'], archiver.get_cutoff_datetime()))
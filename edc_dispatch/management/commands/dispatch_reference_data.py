@@ -0,0 +1,112 @@
+import json
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from django_crypto_fields.models import Crypt
+from edc.base.model.models import BaseListModel
+from edc.device.sync.models import Producer
+from edc.device.sync.utils import load_producer_db_settings
+from lis.base.model.models import BaseLabListModel, BaseLabListUuidModel
+
+from ...classes import FanOutWriter
+from ...classes.row_codec import row_codecs
+
+
+class Command(BaseCommand):
+    """Serializes reference data once and writes it to all, or the given,
+    active producers concurrently, then writes a json status per producer.
+    """
+    args = '[<producer_name> ...]'
+
+    help = 'Dispatch list models, lab list models, registered subjects and crypts to producers in one pass.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--list-app',
+            dest='list_apps',
+            action='append',
+            default=[],
+            help=('App label of list models to send. May be repeated.')),
+        make_option(
+            '--lab',
+            dest='lab',
+            action='store_true',
+            default=False,
+            help=('Send the lab list models of lab_clinic_api.')),
+        make_option(
+            '--registered-subjects',
+            dest='registered_subjects',
+            action='store_true',
+            default=False,
+            help=('Send registration.RegisteredSubject.')),
+        make_option(
+            '--crypt',
+            dest='crypt',
+            action='store_true',
+            default=False,
+            help=('Send all Crypt instances.')),
+        make_option(
+            '--model',
+            dest='models',
+            action='append',
+            default=[],
+            help=('Send an additional model, as app_label.ModelName. May be repeated.')),
+        make_option(
+            '--workers',
+            dest='workers',
+            type='int',
+            default=4,
+            help=('Number of producers to write concurrently (default=4).')),
+        make_option(
+            '--processes',
+            dest='processes',
+            type='int',
+            default=0,
+            help=('Fetch, hash and encode in this many worker processes (default=0, in this process).')),
+        make_option(
+            '--encoding',
+            dest='encoding',
+            default='json',
+            help=('Payload encoding, one of {0} (default=json).'.format(', '.join(sorted(row_codecs))))),
+        )
+
+    def handle(self, *args, **options):
+        load_producer_db_settings()
+        producers = Producer.objects.filter(is_active=True)
+        if args:
+            producers = producers.filter(name__in=args)
+            inactive = set(args) - set([producer.name for producer in producers])
+            if inactive:
+                raise CommandError('Producers {0} are not active.'.format(', '.join(sorted(inactive))))
+        try:
+            codec = row_codecs[options['encoding']]()
+        except KeyError:
+            raise CommandError('Unknown encoding \'{0}\'.'.format(options['encoding']))
+        writer = FanOutWriter([producer.name for producer in producers], max_workers=options['workers'], codec=codec,
+                              processes=options['processes'])
+        for model_cls in self.get_models(**options):
+            writer.add_model(model_cls)
+        if not writer.models:
+            raise CommandError('Nothing to send. Specify --list-app, --lab, --registered-subjects, --crypt or --model.')
+        self.stdout.write('Encoded {0} models in {1} bytes.'.format(len(writer.models), writer.payload_bytes))
+        self.stdout.write(json.dumps(writer.write(), indent=2, sort_keys=True))
+
+    def get_models(self, **options):
+        models = []
+        for app_label in options['list_apps']:
+            models.extend(FanOutWriter.list_models(app_label, BaseListModel))
+        if options['lab']:
+            models.extend(FanOutWriter.list_models('lab_clinic_api', (BaseLabListModel, BaseLabListUuidModel)))
+        if options['registered_subjects']:
+            models.append(get_model('registration', 'RegisteredSubject'))
+        if options['crypt']:
+            models.append(Crypt)
+        for label in options['models']:
+            model_cls = get_model(*label.split('.'))
+            if not model_cls:
+                raise CommandError('Unknown model \'{0}\'.'.format(label))
+            models.append(model_cls)
+        return models
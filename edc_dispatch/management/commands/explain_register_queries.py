@@ -0,0 +1,93 @@
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import get_model
+
+
+class Command(BaseCommand):
+    """Prints the query plan and mean latency of the dispatch register hot queries.
+
+    Run against a copy of a large register table before and after
+    applying the composite indexes to compare plans and timings."""
+
+    help = 'Explains and times the hot DispatchItemRegister/DispatchContainerRegister queries.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--using',
+            dest='using',
+            default='default',
+            help=('settings.DATABASES key to run the queries against (default=\'default\').')),
+        make_option(
+            '--repeat',
+            dest='repeat',
+            type='int',
+            default=20,
+            help=('Number of times to run each query when timing (default=20).')),
+        )
+
+    def handle(self, *args, **options):
+        using = options['using']
+        if using not in connections:
+            raise CommandError('Unknown database \'{0}\'.'.format(using))
+        for name, queryset in self.hot_queries(using):
+            self.stdout.write('=============================')
+            self.stdout.write(name)
+            for row in self.explain(queryset, using):
+                self.stdout.write('  {0}'.format(' '.join([str(col) for col in row])))
+            self.stdout.write('  mean {0:.3f} ms over {1} runs'.format(
+                self.time_query(queryset, options['repeat']), options['repeat']))
+        self.stdout.write('=============================')
+
+    def hot_queries(self, using):
+        """Returns a list of (name, queryset) for the register lookups
+        that run on every dispatch, return and form render."""
+        DispatchItemRegister = get_model('dispatch', 'DispatchItemRegister')
+        DispatchContainerRegister = get_model('dispatch', 'DispatchContainerRegister')
+        dispatch_item_register = DispatchItemRegister.objects.using(using).order_by('-created').first()
+        dispatch_container_register = DispatchContainerRegister.objects.using(using).order_by('-created').first()
+        if not dispatch_item_register or not dispatch_container_register:
+            raise CommandError('Dispatch registers on \'{0}\' are empty. Nothing to explain.'.format(using))
+        return [
+            ('DispatchItemRegister by (item_identifier, is_dispatched)',
+             DispatchItemRegister.objects.using(using).filter(
+                 item_identifier=dispatch_item_register.item_identifier,
+                 is_dispatched=True)),
+            ('DispatchItemRegister by (dispatch_container_register, is_dispatched, return_datetime)',
+             DispatchItemRegister.objects.using(using).filter(
+                 dispatch_container_register=dispatch_item_register.dispatch_container_register_id,
+                 is_dispatched=True,
+                 return_datetime__isnull=True)),
+            ('DispatchContainerRegister by (producer, is_dispatched, return_datetime)',
+             DispatchContainerRegister.objects.using(using).filter(
+                 producer=dispatch_container_register.producer_id,
+                 is_dispatched=True,
+                 return_datetime__isnull=True)),
+            ('DispatchContainerRegister by (container_identifier, is_dispatched, return_datetime)',
+             DispatchContainerRegister.objects.using(using).filter(
+                 container_identifier=dispatch_container_register.container_identifier,
+                 is_dispatched=True,
+                 return_datetime__isnull=True)),
+        ]
+
+    def explain(self, queryset, using):
+        """Returns the rows of the backend's query plan for the queryset."""
+        connection = connections[using]
+        sql, params = queryset.query.sql_with_params()
+        if connection.vendor == 'sqlite':
+            sql = 'EXPLAIN QUERY PLAN {0}'.format(sql)
+        else:
+            sql = 'EXPLAIN {0}'.format(sql)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def time_query(self, queryset, repeat):
+        """Returns the mean wall time in milliseconds to evaluate the queryset."""
+        started = time.time()
+        for _ in range(0, repeat):
+            list(queryset.all())
+        return (time.time() - started) * 1000.0 / repeat
@@ -0,0 +1,113 @@
+import json
+import uuid
+
+from importlib import import_module
+from optparse import make_option
+
+from django.conf import settings
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import get_model
+
+from edc.device.sync.models import Producer
+
+from ...classes import DispatchBundleWriter, DispatchController, PayloadCompressor, registered_controllers
+from ...classes.row_codec import row_codecs
+
+
+class Command(BaseCommand):
+    """Dispatches user containers to a bundle file instead of to a live producer database.
+
+    The containers are registered as dispatched to the producer on the
+    server as with a normal dispatch, in one transaction that is committed
+    only once the bundle is complete. If a container fails, the bundle is
+    deleted and none of the containers are registered. Load the bundle on
+    the device with the import_dispatch_bundle command."""
+
+    args = '<bundle_file> <container_pk> [<container_pk> ...]'
+    help = 'Writes the dispatch payload of one or more user containers to a bundle file.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--controller',
+            dest='controller',
+            default=None,
+            help=('Dotted path to the DispatchController subclass, '
+                  'e.g. bcpp_dispatch.classes.BcppDispatchController.')),
+        make_option(
+            '--container-model',
+            dest='container_model',
+            default=None,
+            help=('app_label.model_name of the user container model, e.g. bcpp_household.plot.')),
+        make_option(
+            '--producer',
+            dest='producer',
+            default=None,
+            help=('Name of the producer the bundle is prepared for.')),
+        make_option(
+            '--encoding',
+            dest='encoding',
+            default='json',
+            help=('Segment encoding, one of {0} (default=json). Use json to debug.'.format(
+                ', '.join(sorted(row_codecs))))),
+        make_option(
+            '--compress',
+            dest='compress',
+            action='store_true',
+            default=False,
+            help=('Compress bundle segments with zlib.')),
+        make_option(
+            '--dictionary',
+            dest='dictionary',
+            default=None,
+            help=('Path to a preset zlib dictionary from train_dispatch_dictionary '
+                  '(default=settings.DISPATCH_BUNDLE_DICTIONARY). Implies --compress.')),
+        )
+
+    def handle(self, *args, **options):
+        if len(args) < 2:
+            raise CommandError('Expected a bundle file and at least one container pk.')
+        if not options['controller'] or not options['container_model'] or not options['producer']:
+            raise CommandError('Options --controller, --container-model and --producer are required.')
+        module_name, cls_name = options['controller'].rsplit('.', 1)
+        dispatch_controller_cls = getattr(import_module(module_name), cls_name)
+        if not issubclass(dispatch_controller_cls, DispatchController):
+            raise CommandError('{0} is not a subclass of DispatchController.'.format(options['controller']))
+        user_container_model_cls = get_model(*options['container_model'].split('.'))
+        if not user_container_model_cls:
+            raise CommandError('Unknown container model {0}.'.format(options['container_model']))
+        try:
+            producer = Producer.objects.get(name=options['producer'])
+        except Producer.DoesNotExist:
+            raise CommandError('Unknown producer {0}.'.format(options['producer']))
+        compressor = self.get_compressor(options)
+        codec = self.get_codec(options)
+        # the lock is held outside the transaction, the controllers share the lock holder
+        lock_holder = 'export-{0}'.format(uuid.uuid4().hex)
+        with registered_controllers.producer_lock(producer.name, holder=lock_holder):
+            with transaction.atomic():
+                with DispatchBundleWriter(args[0], producer.name, compressor=compressor, codec=codec) as bundle:
+                    for user_container in user_container_model_cls.objects.filter(pk__in=args[1:]):
+                        dispatch_controller = dispatch_controller_cls(
+                            'default', producer.settings_key, user_container, bundle=bundle,
+                            lock_holder=lock_holder)
+                        self.stdout.write(dispatch_controller.dispatch())
+        self.stdout.write('Wrote {0} objects in {1} segments for {2} containers to {3}.'.format(
+            bundle.object_count, bundle.segment_count, len(bundle.containers), args[0]))
+        self.stdout.write(json.dumps(bundle.stats(), indent=2, sort_keys=True))
+
+    def get_compressor(self, options):
+        dictionary = options['dictionary'] or getattr(settings, 'DISPATCH_BUNDLE_DICTIONARY', None)
+        if options['dictionary'] or (options['compress'] and dictionary):
+            return PayloadCompressor.from_file(dictionary)
+        elif options['compress']:
+            return PayloadCompressor()
+        return None
+
+    def get_codec(self, options):
+        try:
+            return row_codecs[options['encoding']]()
+        except KeyError:
+            raise CommandError('Unknown encoding \'{0}\'. Expected one of {1}.'.format(
+                options['encoding'], ', '.join(sorted(row_codecs))))
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...classes import DispatchBundleReader
+from ...exceptions import DispatchBundleError
+
+
+class Command(BaseCommand):
+
+    args = '<bundle_file>'
+    help = 'Loads a dispatch bundle written by export_dispatch_bundle into the local database.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--using',
+            dest='using',
+            default='default',
+            help=('settings.DATABASES key to load the bundle into (default=\'default\').')),
+        make_option(
+            '--container',
+            dest='containers',
+            action='append',
+            default=None,
+            help=('Load only this container identifier. May be repeated.')),
+        )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Expected the path to a dispatch bundle.')
+        try:
+            with DispatchBundleReader(args[0]) as reader:
+                saved = reader.load(using=options['using'], containers=options['containers'])
+        except DispatchBundleError as e:
+            raise CommandError(str(e))
+        self.stdout.write('Loaded {0} objects for containers {1} from producer bundle \'{2}\'.'.format(
+            saved, ', '.join(options['containers'] or reader.containers), reader.producer))
@@ -1,16 +1,21 @@
+import json
+
 from optparse import make_option
 
-from django.db.models import get_model
 from django.core.management.base import BaseCommand, CommandError
 
 from edc.device.sync.models import Producer
 from edc.device.sync.utils import load_producer_db_settings
 
+from ...classes import Reconciler, RepairController
+
 
 class Command(BaseCommand):
-    """ Sends an email to a list of recipients about the status of uploading transaction files
+    """Reconciles the dispatch item register on the server with the
+    instances found on each active producer and writes a json summary
+    of found, missing and extra instances per producer and model.
     """
-    args = ('--producer')
+    args = ('[<producer_name>]')
 
     help = 'Reconcile dispatch item registers with the producer.'
 
@@ -21,39 +26,64 @@ class Command(BaseCommand):
             action='store_true',
             default=False,
             help=('Enter producer name')),
+        make_option(
+            '--workers',
+            dest='workers',
+            type='int',
+            default=4,
+            help=('Number of producers to reconcile concurrently (default=4).')),
+        make_option(
+            '--digest',
+            dest='digest',
+            action='store_true',
+            default=False,
+            help=('Also compare field values of found instances using row digests.')),
+        make_option(
+            '--extra',
+            dest='extra',
+            action='store_true',
+            default=False,
+            help=('Also report instances on the producer that are not dispatched to it. '
+                  'Reads every pk of each model on the producer.')),
+        make_option(
+            '--repair',
+            dest='repair',
+            action='store_true',
+            default=False,
+            help=('Re-send missing (and, with --digest, diverged) instances to the producer.')),
+        make_option(
+            '--pks',
+            dest='pks',
+            action='store_true',
+            default=False,
+            help=('Include the missing, extra and diverged pks in the summary.')),
         )
 
     def handle(self, *args, **options):
-        if len(args) == 0 or len(args) == 1:
-            pass
-        else:
+        if len(args) > 1:
             raise CommandError('Command expecting One or Zero arguments. One being --producer <producer_name>')
-        if options['producer']:
-            self.reconcile(producer=args[0])
-        else:
-            self.reconcile()
+        summary = self.reconcile(
+            producer=args[0] if args else None, workers=options['workers'], digest=options['digest'],
+            extra=options['extra'])
+        if options['repair']:
+            for producer_name, producer_summary in summary.items():
+                if 'error' not in producer_summary:
+                    producer_summary['repaired'] = RepairController(
+                        'default', producer_name).repair(producer_summary)
+        if not options['pks']:
+            for producer_summary in summary.values():
+                for model_summary in producer_summary.get('models', {}).values():
+                    del model_summary['missing_pks']
+                    del model_summary['extra_pks']
+                    del model_summary['diverged_pks']
+        self.stdout.write(json.dumps(summary, indent=2, sort_keys=True))
 
-    def reconcile(self, producer=None):
+    def reconcile(self, producer=None, workers=None, digest=None, extra=None):
         load_producer_db_settings()
-        DispatchItemRegister = get_model('dispatch', 'DispatchItemRegister')
-        producer_list = []
-        if producer and not Producer.objects.filter(name=producer, is_active=True):
-            print 'Producer \'{}\' is not active'.format(producer)
-        elif producer and Producer.objects.filter(name=producer, is_active=True):
-            producer_list = [producer]
-        else:
-            producer_list = [pr.name for pr in Producer.objects.filter(is_active=True)]
-        dispatched_items = DispatchItemRegister.objects.filter(producer__name__in=producer_list)
-        print '============================='
-        for item in dispatched_items:
-            app = item.item_app_label
-            model = item.item_model_name
-            Model = get_model(app, model)
-            try:
-                #name = item.producer.name.split('-')[0]
-                Model.objects.using(item.producer.name).get(id=item.item_pk)
-                print 'Found instance of \'{}\' in \'{}\' with pk={}'.format(model, item.producer.name, item.item_pk)
-            except Model.DoesNotExist:
-                print 'MISSING instance of \'{}\' in \'{}\' with pk={}'.format(model, item.producer.name, item.item_pk)
-        print "DONE"
-        print '============================='
+        producers = Producer.objects.filter(is_active=True)
+        if producer:
+            producers = producers.filter(name=producer)
+            if not producers:
+                raise CommandError('Producer \'{}\' is not active'.format(producer))
+        return Reconciler([pr.name for pr in producers], max_workers=workers, digest=digest,
+                          extra=extra).reconcile()
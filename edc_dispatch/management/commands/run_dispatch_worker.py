@@ -0,0 +1,55 @@
+import os
+import socket
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...classes import DispatchJobRunner
+from ...models import DispatchJob
+
+
+class Command(BaseCommand):
+    """Runs queued dispatch jobs, one at a time, until interrupted.
+
+    Jobs are enqueued by the dispatch view if settings.DISPATCH_JOBS is True.
+    Several workers may run at once; each job is claimed by one worker only."""
+
+    help = 'Runs queued dispatch jobs.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--once',
+            dest='once',
+            action='store_true',
+            default=False,
+            help=('Exit when no queued jobs are left.')),
+        make_option(
+            '--sleep',
+            dest='sleep',
+            type='float',
+            default=5.0,
+            help=('Seconds to wait between polls when the queue is empty (default=5).')),
+        make_option(
+            '--workers',
+            dest='workers',
+            type='int',
+            default=None,
+            help=('Number of containers of a job to dispatch concurrently (default=settings.DISPATCH_MAX_WORKERS).')),
+        )
+
+    def handle(self, *args, **options):
+        worker = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+        self.stdout.write('Dispatch worker {0} started.'.format(worker))
+        while True:
+            job = DispatchJob.objects.claim(worker)
+            if job:
+                job = DispatchJobRunner(job, max_workers=options['workers']).run()
+                progress = job.progress()
+                self.stdout.write('Job {0} {1}: {2} dispatched, {3} failed of {4} containers.'.format(
+                    job.pk, job.status, progress['dispatched'], progress['failed'], progress['total']))
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,42 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...classes import DispatchBundleReader, PayloadCompressor
+from ...exceptions import DispatchBundleError
+
+
+class Command(BaseCommand):
+    """Trains a preset zlib dictionary from the segments of existing
+    dispatch bundles. The dictionary version is the first 12 characters
+    of its sha1 and is recorded in each bundle compressed with it."""
+
+    args = '<dictionary_file> <bundle_file> [<bundle_file> ...]'
+    help = 'Trains a zlib preset dictionary for dispatch payloads from representative bundles.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--size',
+            dest='size',
+            type='int',
+            default=PayloadCompressor.MAX_DICTIONARY_SIZE,
+            help=('Maximum dictionary size in bytes (default={0}).'.format(
+                PayloadCompressor.MAX_DICTIONARY_SIZE))),
+        )
+
+    def handle(self, *args, **options):
+        if len(args) < 2:
+            raise CommandError('Expected a dictionary file and at least one bundle file.')
+        samples = []
+        for path in args[1:]:
+            try:
+                with DispatchBundleReader(path) as reader:
+                    for segment_number in reader.segment_numbers():
+                        samples.append(reader.segment_data(segment_number))
+            except DispatchBundleError as e:
+                raise CommandError(str(e))
+        dictionary = PayloadCompressor.train(samples, size=options['size'])
+        with open(args[0], 'wb') as f:
+            f.write(dictionary)
+        self.stdout.write('Wrote {0} byte dictionary version {1} trained on {2} segments to {3}.'.format(
+            len(dictionary), PayloadCompressor(dictionary).dictionary_version, len(samples), args[0]))
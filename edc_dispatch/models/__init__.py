@@ -3,3 +3,13 @@ from .base_dispatch import BaseDispatch
 from .dispatch_item_register import DispatchItemRegister
 from .dispatch_container_register import DispatchContainerRegister
 from .prepare_history import PrepareHistory
+from .dispatch_item_register_archive import DispatchItemRegisterArchive
+from .dispatch_container_register_archive import DispatchContainerRegisterArchive
+from .dispatch_subject_index import DispatchSubjectIndex
+from .repair_history import RepairHistory
+from .reference_data_version import ReferenceDataVersion
+from .dispatch_job import DispatchJob
+from .dispatch_job_container import DispatchJobContainer
+from .dispatch_producer_lock import DispatchProducerLock
+from .dispatch_checkpoint import DispatchCheckpoint
+from .dispatch_batch import DispatchBatch
@@ -0,0 +1,35 @@
+from django.db import models
+from edc.device.sync.models import Producer
+
+
+class BaseDispatchArchive(models.Model):
+    """A base model for archived (returned) dispatch register rows.
+
+    Archived rows keep the pk, audit dates and dispatch dates of the
+    original register row. They are not editable and are not synced."""
+
+    id = models.CharField(max_length=36, primary_key=True)
+
+    created = models.DateTimeField(null=True)
+
+    modified = models.DateTimeField(null=True)
+
+    producer = models.ForeignKey(Producer, verbose_name="Producer / Netbook")
+
+    is_dispatched = models.BooleanField(default=False)
+
+    dispatch_datetime = models.DateTimeField(
+        verbose_name="Dispatch date",
+        null=True)
+
+    return_datetime = models.DateTimeField(
+        verbose_name="Return date",
+        null=True,
+        db_index=True)
+
+    archive_datetime = models.DateTimeField(
+        verbose_name="Archive date",
+        auto_now_add=True)
+
+    class Meta:
+        abstract = True
@@ -0,0 +1,61 @@
+import hashlib
+
+from datetime import datetime
+
+from django.db import models, IntegrityError, transaction
+
+
+class DispatchBatchManager(models.Manager):
+
+    def batch_id(self, json_obj, run=None):
+        """Returns the batch id of a serialized chunk, the sha1 of the run and its json."""
+        if not isinstance(json_obj, bytes):
+            json_obj = json_obj.encode('utf-8')
+        if run:
+            json_obj = run.encode('utf-8') + b'\x1f' + json_obj
+        return hashlib.sha1(json_obj).hexdigest()
+
+    def is_applied(self, batch_id, using=None):
+        return self.using(using).filter(batch_id=batch_id).exists()
+
+    def record(self, batch_id, object_count, scope=None, using=None):
+        """Records the batch as applied, ignoring a batch recorded concurrently."""
+        try:
+            with transaction.atomic(using=using):
+                self.using(using).create(batch_id=batch_id, object_count=object_count, scope=scope)
+        except IntegrityError:
+            pass
+
+    def prune(self, scopes, using=None):
+        """Deletes the batches of the scopes, e.g. of returned containers, and returns the number deleted."""
+        batches = self.using(using).filter(scope__in=[str(scope) for scope in scopes])
+        count = batches.count()
+        batches.delete()
+        return count
+
+
+class DispatchBatch(models.Model):
+    """A ledger, on a destination, of the serialized chunks already saved.
+
+    A chunk is identified by the sha1 of its dispatch run and its json so
+    a retried transfer of the same run that sends the same chunk again
+    skips it with one lookup, while another run, e.g. a re-dispatch after
+    a return, saves it again. The scope, e.g. the container register pk,
+    is kept so the batches of a container are pruned when it is returned."""
+
+    batch_id = models.CharField(max_length=40, unique=True)
+
+    scope = models.CharField(max_length=50, null=True, db_index=True)
+
+    object_count = models.IntegerField(default=0)
+
+    applied_datetime = models.DateTimeField(default=datetime.today)
+
+    objects = DispatchBatchManager()
+
+    def __unicode__(self):
+        return self.batch_id
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchbatch'
@@ -0,0 +1,115 @@
+import hashlib
+
+from datetime import datetime
+
+from django.db import models
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+from .dispatch_container_register import DispatchContainerRegister
+
+
+class DispatchCheckpointManager(models.Manager):
+
+    def query_hash(self, queryset):
+        """Returns the sha1 of the queryset's model and SQL or None if the query is empty."""
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return None
+        return hashlib.sha1('{0}.{1}|{2}'.format(
+            queryset.model._meta.app_label, queryset.model._meta.object_name, sql).encode('utf-8')).hexdigest()
+
+    def for_queryset(self, dispatch_container_register, queryset, using=None):
+        """Returns the checkpoint of the queryset for the container, created if new, or None."""
+        query_hash = self.query_hash(queryset)
+        if not query_hash:
+            return None
+        checkpoint, _ = self.using(using).get_or_create(
+            dispatch_container_register=dispatch_container_register,
+            query_hash=query_hash,
+            defaults={'app_label': queryset.model._meta.app_label,
+                      'model_name': queryset.model._meta.object_name})
+        return checkpoint
+
+    def progress(self, dispatch_container_register, using=None):
+        """Returns a list of dictionaries of the checkpoints of a container."""
+        return [checkpoint.to_dict() for checkpoint in self.using(using).filter(
+            dispatch_container_register=dispatch_container_register).order_by('created')]
+
+
+class DispatchCheckpoint(models.Model):
+    """Records, on the source, how far a queryset sent for a dispatched
+    container has been written to the producer.
+
+    A queryset is identified by the sha1 of its model and SQL so the same
+    query run again for the container, e.g. by a retry, finds its checkpoint.
+    The checkpoint is advanced after each chunk is saved on the producer,
+    with the pk of the last row of the chunk when the queryset is sent in
+    pk order, and is complete once the whole queryset is sent."""
+
+    dispatch_container_register = models.ForeignKey(DispatchContainerRegister)
+
+    query_hash = models.CharField(max_length=40)
+
+    app_label = models.CharField(max_length=35)
+
+    model_name = models.CharField(max_length=35)
+
+    last_pk = models.CharField(max_length=50, null=True)
+
+    row_count = models.IntegerField(default=0)
+
+    object_count = models.IntegerField(default=0)
+
+    chunk_count = models.IntegerField(default=0)
+
+    is_complete = models.BooleanField(default=False)
+
+    created = models.DateTimeField(default=datetime.today)
+
+    updated = models.DateTimeField(default=datetime.today)
+
+    objects = DispatchCheckpointManager()
+
+    def __unicode__(self):
+        return "{0}.{1} {2}".format(self.app_label, self.model_name, self.last_pk)
+
+    def resume(self, queryset):
+        """Returns the queryset in pk order from after the last pk sent."""
+        queryset = queryset.order_by('pk')
+        if self.last_pk is not None:
+            queryset = queryset.filter(pk__gt=self.last_pk)
+        return queryset
+
+    def advance(self, row_count, object_count, last_pk=None, is_complete=False):
+        """Records a chunk saved on the producer."""
+        self.row_count += row_count
+        self.object_count += object_count
+        self.chunk_count += 1
+        if last_pk is not None:
+            self.last_pk = str(last_pk)
+        self.is_complete = is_complete
+        self.updated = datetime.today()
+        self.save(update_fields=['row_count', 'object_count', 'chunk_count', 'last_pk', 'is_complete', 'updated'])
+
+    def complete(self):
+        self.is_complete = True
+        self.updated = datetime.today()
+        self.save(update_fields=['is_complete', 'updated'])
+
+    def to_dict(self):
+        return {'model': '{0}.{1}'.format(self.app_label, self.model_name),
+                'last_pk': self.last_pk,
+                'rows': self.row_count,
+                'objects': self.object_count,
+                'chunks': self.chunk_count,
+                'complete': self.is_complete}
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchcheckpoint'
+        unique_together = (('dispatch_container_register', 'query_hash'), )
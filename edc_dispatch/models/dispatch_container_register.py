@@ -1,8 +1,77 @@
-from django.db import models
+from datetime import datetime
+
+from django.db import models, transaction, IntegrityError
 from django.core.exceptions import ValidationError
 from .base_dispatch import BaseDispatch
 
 
+class DispatchContainerRegisterManager(models.Manager):
+
+    def claim(self, producer, container_app_label, container_model_name, container_identifier_attrname,
+              user_containers, using=None):
+        """Reserves the user containers for the producer and returns the
+        claimed DispatchContainerRegister instances.
+
+        A container already dispatched, or being claimed by another worker,
+        is not claimed. Registers are created for new containers first.
+        Each row is then claimed with a conditional UPDATE, so parallel
+        workers never claim the same container and never retry on
+        IntegrityError. (SELECT ... FOR UPDATE SKIP LOCKED would need
+        Django 1.11.)
+
+        See :class:`DispatchScheduler`, which claims its containers in one batch."""
+        using = using or 'default'
+        if not user_containers:
+            return []
+        options = {'container_app_label': container_app_label,
+                   'container_model_name': container_model_name,
+                   'container_pk__in': [str(user_container.pk) for user_container in user_containers]}
+        self._create_missing(producer, container_app_label, container_model_name,
+                             container_identifier_attrname, user_containers, using)
+        values = {'producer': producer,
+                  'is_dispatched': True,
+                  'dispatch_datetime': datetime.today(),
+                  'return_datetime': None}
+        queryset = self.using(using).filter(is_dispatched=False, **options)
+        claimed_pks = [pk for pk in queryset.values_list('pk', flat=True)
+                       if self.using(using).filter(pk=pk, is_dispatched=False).update(**values)]
+        return list(self.using(using).filter(pk__in=claimed_pks))
+
+    def release(self, dispatch_container_registers, using=None):
+        """Returns claimed containers that were not dispatched after all, e.g. that
+        failed to dispatch, so they may be claimed again."""
+        return self.using(using).filter(
+            pk__in=[dispatch_container_register.pk for dispatch_container_register in dispatch_container_registers],
+            is_dispatched=True).update(is_dispatched=False, return_datetime=datetime.today())
+
+    def _create_missing(self, producer, container_app_label, container_model_name,
+                        container_identifier_attrname, user_containers, using):
+        existing_pks = self.using(using).filter(
+            container_app_label=container_app_label,
+            container_model_name=container_model_name,
+            container_pk__in=[str(user_container.pk) for user_container in user_containers]).values_list(
+                'container_pk', flat=True)
+        existing_pks = set([str(pk) for pk in existing_pks])
+        for user_container in user_containers:
+            if str(user_container.pk) in existing_pks:
+                continue
+            try:
+                # created as returned, i.e. available to claim
+                with transaction.atomic(using=using):
+                    self.using(using).create(
+                        producer=producer,
+                        is_dispatched=False,
+                        return_datetime=datetime.today(),
+                        container_app_label=container_app_label,
+                        container_model_name=container_model_name,
+                        container_identifier_attrname=container_identifier_attrname,
+                        container_identifier=getattr(user_container, container_identifier_attrname),
+                        container_pk=str(user_container.pk))
+            except IntegrityError:
+                # created by another worker
+                pass
+
+
 class DispatchContainerRegister(BaseDispatch):
 
     container_app_label = models.CharField(max_length=35)
@@ -21,7 +90,7 @@ class DispatchContainerRegister(BaseDispatch):
         max_length=500,
         help_text='Dispatch items. One per line.')
 
-    objects = models.Manager()
+    objects = DispatchContainerRegisterManager()
 
     def save(self, *args, **kwargs):
         if not self.is_dispatched and not self.return_datetime:
@@ -47,3 +116,7 @@ class DispatchContainerRegister(BaseDispatch):
         app_label = "dispatch"
         db_table = 'bhp_dispatch_dispatchcontainerregister'
         unique_together = ('container_app_label', 'container_model_name', 'container_pk')
+        index_together = [
+            ['producer', 'is_dispatched', 'return_datetime'],
+            ['container_identifier', 'is_dispatched', 'return_datetime'],
+        ]
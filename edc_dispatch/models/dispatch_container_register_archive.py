@@ -0,0 +1,32 @@
+from django.db import models
+
+from .base_dispatch_archive import BaseDispatchArchive
+
+
+class DispatchContainerRegisterArchive(BaseDispatchArchive):
+    """A returned DispatchContainerRegister moved out of the active table.
+
+    .. seealso:: :class:`dispatch.classes.RegisterArchiver`"""
+
+    container_app_label = models.CharField(max_length=35)
+
+    container_model_name = models.CharField(max_length=35)
+
+    container_identifier_attrname = models.CharField(max_length=35)
+
+    container_identifier = models.CharField(max_length=35, db_index=True)
+
+    container_pk = models.CharField(max_length=50)
+
+    dispatched_using = models.CharField(max_length=35, null=True)
+
+    dispatch_items = models.TextField(max_length=500)
+
+    objects = models.Manager()
+
+    def __unicode__(self):
+        return self.container_identifier
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchcontainerregisterarchive'
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.core.exceptions import ValidationError
+
+from ..exceptions import AlreadyDispatchedItem
+
 from .base_dispatch import BaseDispatch
 from .dispatch_container_register import DispatchContainerRegister
 
@@ -29,29 +32,36 @@ class DispatchItemRegister(BaseDispatch):
         help_text="List of Registered Subjects linked to this DispatchItem"
         )
 
+    dispatched_item_identifier = models.CharField(
+        max_length=40,
+        null=True,
+        unique=True,
+        editable=False,
+        help_text=("Set to item_identifier while is_dispatched=True, otherwise None. "
+                   "The unique constraint prevents an item being dispatched twice."))
+
     objects = models.Manager()
 
-# temp removed - erikvw (fails on unknown producer when setting dispatched to False)
-# no longer necessary to check if the instance is dispatched, as this is done by
-# the controller class.
     def save(self, *args, **kwargs):
-        """Confirms an instance does not exist for this item_identifier."""
+        """Saves the instance, letting the unique constraint on
+        dispatched_item_identifier reject a second dispatch of the same item_identifier."""
         using = kwargs.get('using')
-        if self.__class__.objects.using(using).filter(
-                item_identifier=self.item_identifier,
-                is_dispatched=True,
-                ).exclude(pk=self.pk).exists():
-            dispatch_item = self.__class__.objects.using(using).get(
-                item_identifier=self.item_identifier,
-                is_dispatched=True,
-                ).exclude(pk=self.pk)
-            raise ValueError("Cannot dispatch. The item \'{0}\' is already dispatched to \'{1}\'.".format(dispatch_item.item_identifier, dispatch_item.dispatch_container_register.producer))
         if self.is_dispatched and self.return_datetime:
             raise ValidationError('Attribute return_datetime must be None if is_dispatched=True.')
         if not self.is_dispatched and not self.return_datetime:
             raise ValidationError('Attribute \'return_datetime\' may not be None if \'is_dispatched\'=False.')
-
-        super(DispatchItemRegister, self).save(*args, **kwargs)
+        self.dispatched_item_identifier = self.item_identifier if self.is_dispatched else None
+        try:
+            with transaction.atomic(using=using):
+                super(DispatchItemRegister, self).save(*args, **kwargs)
+        except IntegrityError:
+            dispatch_item = self.__class__.objects.using(using).filter(
+                dispatched_item_identifier=self.item_identifier).exclude(pk=self.pk).first()
+            if not dispatch_item:
+                raise
+            raise AlreadyDispatchedItem(
+                'Cannot dispatch. The item \'{0}\' is already dispatched to \'{1}\'.'.format(
+                    dispatch_item.item_identifier, dispatch_item.producer))
 
     def __unicode__(self):
         return "Dispatch Item {0} {1} -> {2} ({3})".format(self.item_model_name, self.item_identifier, self.producer.name, self.is_dispatched)
@@ -60,4 +70,8 @@ class DispatchItemRegister(BaseDispatch):
         app_label = "dispatch"
         db_table = 'bhp_dispatch_dispatchitemregister'
         unique_together = (('dispatch_container_register', 'item_pk', 'item_identifier', 'is_dispatched'), )
-        index_together = [['item_app_label', 'item_model_name', 'item_pk', 'is_dispatched'], ]
+        index_together = [
+            ['item_app_label', 'item_model_name', 'item_pk', 'is_dispatched'],
+            ['item_identifier', 'is_dispatched'],
+            ['dispatch_container_register', 'is_dispatched', 'return_datetime'],
+        ]
@@ -0,0 +1,41 @@
+from django.db import models
+
+from .base_dispatch_archive import BaseDispatchArchive
+
+
+class DispatchItemRegisterArchive(BaseDispatchArchive):
+    """A returned DispatchItemRegister moved out of the active table.
+
+    The container is referred to by pk only as the container
+    register may still be active or may itself be archived.
+
+    .. seealso:: :class:`dispatch.classes.RegisterArchiver`"""
+
+    dispatch_container_register_pk = models.CharField(max_length=36, db_index=True)
+
+    item_app_label = models.CharField(max_length=35)
+
+    item_model_name = models.CharField(max_length=35)
+
+    item_identifier_attrname = models.CharField(max_length=35)
+
+    item_identifier = models.CharField(max_length=40, db_index=True)
+
+    item_pk = models.CharField(max_length=50)
+
+    dispatch_host = models.CharField(max_length=35, null=True)
+
+    dispatch_using = models.CharField(max_length=35, null=True)
+
+    registered_subjects = models.TextField(null=True)
+
+    objects = models.Manager()
+
+    def __unicode__(self):
+        return "Dispatch Item {0} {1} -> {2} (archived)".format(
+            self.item_model_name, self.item_identifier, self.producer.name)
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchitemregisterarchive'
+        index_together = [['item_app_label', 'item_model_name', 'item_pk'], ]
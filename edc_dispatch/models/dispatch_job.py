@@ -0,0 +1,174 @@
+import json
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import get_model, Q
+
+from edc.base.model.models import BaseUuidModel
+from edc.device.sync.models import Producer
+
+JOB_STATUS = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
+
+def encode_kwargs(kwargs):
+    """Returns kwargs as json with model instances replaced by their (app_label, model_name, pk)."""
+    encoded = {}
+    for key, value in (kwargs or {}).items():
+        if isinstance(value, models.Model):
+            value = {'__model__': [value._meta.app_label, value._meta.object_name, str(value.pk)]}
+        encoded[key] = value
+    return json.dumps(encoded)
+
+
+def decode_kwargs(value):
+    kwargs = json.loads(value or '{}')
+    for key, value in kwargs.items():
+        if isinstance(value, dict) and '__model__' in value:
+            app_label, model_name, pk = value['__model__']
+            kwargs[key] = get_model(app_label, model_name).objects.get(pk=pk)
+    return kwargs
+
+
+class DispatchJobManager(models.Manager):
+
+    def enqueue(self, dispatch_controller_cls, producer, user_containers, controller_kwargs=None,
+                dispatch_kwargs=None, user=None):
+        """Creates a queued job with one :class:`DispatchJobContainer` per user container, in order."""
+        DispatchJobContainer = get_model('dispatch', 'DispatchJobContainer')
+        job = self.create(
+            producer=producer,
+            controller='{0}.{1}'.format(dispatch_controller_cls.__module__, dispatch_controller_cls.__name__),
+            controller_kwargs=encode_kwargs(controller_kwargs),
+            dispatch_kwargs=encode_kwargs(dispatch_kwargs),
+            user=user)
+        DispatchJobContainer.objects.bulk_create([
+            DispatchJobContainer(
+                job=job,
+                sequence=sequence,
+                container_app_label=user_container._meta.app_label,
+                container_model_name=user_container._meta.object_name,
+                container_pk=str(user_container.pk),
+                container_identifier=str(user_container))
+            for sequence, user_container in enumerate(user_containers)])
+        return job
+
+    def get_timeout(self):
+        """Returns the seconds after which a running job without a heartbeat is requeued."""
+        return getattr(settings, 'DISPATCH_JOB_TIMEOUT', 600)
+
+    def requeue_stale(self, timeout=None, using=None):
+        """Requeues running jobs whose worker has not sent a heartbeat within
+        ``timeout`` seconds, e.g. because it died, and returns the number requeued.
+
+        Containers already dispatched are not dispatched again."""
+        cutoff = datetime.today() - timedelta(seconds=self.get_timeout() if timeout is None else timeout)
+        return self.using(using).filter(
+            Q(heartbeat_datetime__lt=cutoff) | Q(heartbeat_datetime__isnull=True, started_datetime__lt=cutoff),
+            status='running').update(status='queued', worker=None, heartbeat_datetime=None)
+
+    def heartbeat(self, job, using=None):
+        """Records that the job's worker is alive and returns False if the job is no longer its own."""
+        return bool(self.using(using).filter(pk=job.pk, worker=job.worker, status='running').update(
+            heartbeat_datetime=datetime.today()))
+
+    def claim(self, worker, using=None):
+        """Returns the oldest queued job after marking it running for this worker, or None.
+
+        The job is claimed with a conditional update so two workers never run the same job.
+        Stale running jobs are requeued first."""
+        self.requeue_stale(using=using)
+        for job in self.using(using).filter(status='queued').order_by('queued_datetime')[:10]:
+            now = datetime.today()
+            claimed = self.using(using).filter(pk=job.pk, status='queued').update(
+                status='running', worker=worker, started_datetime=now, heartbeat_datetime=now)
+            if claimed:
+                return self.using(using).get(pk=job.pk)
+        return None
+
+
+class DispatchJob(BaseUuidModel):
+    """A batch of user containers to be dispatched to a producer by the
+    run_dispatch_worker command instead of inside the HTTP request."""
+
+    producer = models.ForeignKey(Producer)
+
+    controller = models.CharField(
+        max_length=250,
+        help_text='Dotted path to the DispatchController subclass.')
+
+    controller_kwargs = models.TextField(default='{}')
+
+    dispatch_kwargs = models.TextField(default='{}')
+
+    status = models.CharField(max_length=10, choices=JOB_STATUS, default='queued')
+
+    user = models.CharField(max_length=50, null=True)
+
+    worker = models.CharField(max_length=100, null=True)
+
+    error = models.TextField(null=True)
+
+    queued_datetime = models.DateTimeField(default=datetime.today)
+
+    started_datetime = models.DateTimeField(null=True)
+
+    heartbeat_datetime = models.DateTimeField(
+        null=True,
+        help_text='Updated by the worker while the job is running.')
+
+    finished_datetime = models.DateTimeField(null=True)
+
+    objects = DispatchJobManager()
+
+    def __unicode__(self):
+        return "{0} {1} {2}".format(self.producer.name, self.status, self.queued_datetime)
+
+    def get_controller_kwargs(self):
+        return decode_kwargs(self.controller_kwargs)
+
+    def get_dispatch_kwargs(self):
+        return decode_kwargs(self.dispatch_kwargs)
+
+    def progress(self):
+        """Returns a dictionary of per-container status, counts, throughput and ETA."""
+        containers = list(self.dispatchjobcontainer_set.order_by('sequence'))
+        finished = [container for container in containers if container.status in ['dispatched', 'failed']]
+        elapsed = None
+        if self.started_datetime:
+            elapsed = ((self.finished_datetime or datetime.today()) - self.started_datetime).total_seconds()
+        objects = sum([container.object_count for container in finished])
+        progress = {
+            'job': str(self.pk),
+            'status': self.status,
+            'producer': self.producer.name,
+            'error': self.error,
+            'queued': self.queued_datetime.isoformat(),
+            'started': self.started_datetime.isoformat() if self.started_datetime else None,
+            'finished': self.finished_datetime.isoformat() if self.finished_datetime else None,
+            'total': len(containers),
+            'dispatched': len([container for container in finished if container.status == 'dispatched']),
+            'failed': len([container for container in finished if container.status == 'failed']),
+            'remaining': len(containers) - len(finished),
+            'objects': objects,
+            'containers_per_minute': None,
+            'objects_per_second': None,
+            'eta_seconds': None,
+            'containers': [container.to_dict() for container in containers]}
+        if elapsed and finished:
+            progress['containers_per_minute'] = round(60.0 * len(finished) / elapsed, 2)
+            progress['objects_per_second'] = round(objects / elapsed, 2)
+            if self.status == 'running':
+                progress['eta_seconds'] = int(elapsed / len(finished) * progress['remaining'])
+        return progress
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchjob'
+        index_together = [['status', 'queued_datetime'], ]
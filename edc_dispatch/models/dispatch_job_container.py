@@ -0,0 +1,56 @@
+from django.db import models
+
+from .dispatch_job import DispatchJob
+
+JOB_CONTAINER_STATUS = (
+    ('queued', 'Queued'),
+    ('dispatched', 'Dispatched'),
+    ('failed', 'Failed'),
+)
+
+
+class DispatchJobContainer(models.Model):
+    """One user container of a :class:`DispatchJob` and the outcome of its dispatch."""
+
+    job = models.ForeignKey(DispatchJob)
+
+    sequence = models.IntegerField()
+
+    container_app_label = models.CharField(max_length=35)
+
+    container_model_name = models.CharField(max_length=35)
+
+    container_pk = models.CharField(max_length=50)
+
+    container_identifier = models.CharField(max_length=50)
+
+    status = models.CharField(max_length=10, choices=JOB_CONTAINER_STATUS, default='queued')
+
+    message = models.TextField(null=True)
+
+    error = models.TextField(null=True)
+
+    object_count = models.IntegerField(default=0)
+
+    seconds = models.FloatField(null=True)
+
+    finished_datetime = models.DateTimeField(null=True)
+
+    objects = models.Manager()
+
+    def __unicode__(self):
+        return "{0} {1}".format(self.container_identifier, self.status)
+
+    def to_dict(self):
+        return {'identifier': self.container_identifier,
+                'status': self.status,
+                'message': self.message,
+                'error': self.error,
+                'objects': self.object_count,
+                'seconds': self.seconds}
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchjobcontainer'
+        unique_together = (('job', 'sequence'), )
+        ordering = ['sequence']
@@ -0,0 +1,28 @@
+from datetime import datetime
+from django.db import models
+
+
+class DispatchProducerLock(models.Model):
+    """A lease on a producer held by one dispatch or return, across
+    threads and processes. See :class:`ControllerRegister`.
+
+    The unique producer_name makes creating the row the lock. A row past
+    expires_datetime is left by a holder that did not release it and
+    may be taken over."""
+
+    producer_name = models.CharField(max_length=50, unique=True)
+
+    holder = models.CharField(max_length=100)
+
+    acquired_datetime = models.DateTimeField(default=datetime.today)
+
+    expires_datetime = models.DateTimeField()
+
+    objects = models.Manager()
+
+    def __unicode__(self):
+        return "{0} locked by {1}".format(self.producer_name, self.holder)
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchproducerlock'
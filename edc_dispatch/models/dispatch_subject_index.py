@@ -0,0 +1,50 @@
+from django.db import models
+from edc.device.sync.models import Producer
+
+from .dispatch_item_register import DispatchItemRegister
+
+
+class DispatchSubjectIndexManager(models.Manager):
+
+    def is_dispatched_to_producer(self, subject_identifier, using=None):
+        """Returns a tuple of (locked, producer) for the subject identifier.
+
+        The subject is locked if any item linked to the subject is
+        currently dispatched."""
+        dispatch_subject_index = self.using(using).filter(
+            subject_identifier=subject_identifier,
+            dispatch_item_register__is_dispatched=True).select_related('producer').first()
+        if dispatch_subject_index:
+            return True, dispatch_subject_index.producer
+        return False, None
+
+
+class DispatchSubjectIndex(models.Model):
+    """Maps a DispatchItemRegister to the subject identifiers of the dispatched item.
+
+    One row per (dispatch item register, subject identifier). Filled
+    by the dispatch controller when the item is registered. Replaces
+    scanning DispatchItemRegister.registered_subjects with icontains."""
+
+    dispatch_item_register = models.ForeignKey(DispatchItemRegister)
+
+    producer = models.ForeignKey(Producer)
+
+    subject_identifier = models.CharField(max_length=50)
+
+    item_app_label = models.CharField(max_length=35)
+
+    item_model_name = models.CharField(max_length=35)
+
+    item_pk = models.CharField(max_length=50)
+
+    objects = DispatchSubjectIndexManager()
+
+    def __unicode__(self):
+        return "{0} -> {1}".format(self.subject_identifier, self.producer.name)
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_dispatchsubjectindex'
+        unique_together = (('dispatch_item_register', 'subject_identifier'), )
+        index_together = [['subject_identifier', 'dispatch_item_register'], ]
@@ -0,0 +1,39 @@
+from datetime import datetime
+from django.db import models
+
+
+class ReferenceDataVersionManager(models.Manager):
+
+    def get_version(self, app_label, model_name, using=None):
+        """Returns the version of the reference model held on ``using`` or None."""
+        return self.using(using).filter(
+            app_label=app_label, model_name=model_name).values_list('version', flat=True).first()
+
+
+class ReferenceDataVersion(models.Model):
+    """Records, on a destination, the content version of each reference
+    model it holds, as computed on the source by :class:`ReferenceData`.
+
+    One row per model. Written after the whole model has been sent."""
+
+    app_label = models.CharField(max_length=35)
+
+    model_name = models.CharField(max_length=35)
+
+    version = models.CharField(max_length=40)
+
+    row_count = models.IntegerField(default=0)
+
+    max_modified = models.DateTimeField(null=True)
+
+    updated = models.DateTimeField(default=datetime.today)
+
+    objects = ReferenceDataVersionManager()
+
+    def __unicode__(self):
+        return "{0}.{1} {2}".format(self.app_label, self.model_name, self.version)
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_referencedataversion'
+        unique_together = (('app_label', 'model_name'), )
@@ -0,0 +1,27 @@
+from datetime import datetime
+from django.db import models
+from edc.base.model.models import BaseUuidModel
+from edc.device.sync.models import Producer
+
+
+class RepairHistory(BaseUuidModel):
+    """Tracks instances of a model re-sent to a producer by :func:`RepairController.repair`."""
+    producer = models.ForeignKey(Producer)
+    item_app_label = models.CharField(max_length=35)
+    item_model_name = models.CharField(max_length=35)
+    missing_pks = models.TextField(
+        null=True,
+        help_text='Pks of instances missing on the producer. One per line.')
+    diverged_pks = models.TextField(
+        null=True,
+        help_text='Pks of instances that differed on the producer. One per line.')
+    repaired = models.IntegerField(default=0)
+    repair_datetime = models.DateTimeField(default=datetime.today)
+    objects = models.Manager()
+
+    def __unicode__(self):
+        return "{0} {1} @ {2}".format(self.producer.name, self.item_model_name, self.repair_datetime)
+
+    class Meta:
+        app_label = "dispatch"
+        db_table = 'bhp_dispatch_repairhistory'
@@ -1,3 +1,24 @@
 from .base_dispatch_controller_methods_tests import BaseDispatchControllerMethodsTests
 from .dispatch_controller_methods_tests import *
 from .return_controller_methods_tests import ReturnControllerMethodsTests
+from .register_archiver_tests import RegisterArchiverTests
+from .model_digest_tests import ModelDigestTests
+from .dispatch_bundle_tests import DispatchBundleTests
+from .reference_data_tests import ReferenceDataTests
+from .dispatch_job_tests import DispatchJobTests
+from .pipeline_tests import PipelineTests
+from .controller_register_tests import ControllerRegisterTests
+from .dispatch_container_register_tests import DispatchContainerRegisterTests
+from .dispatch_checkpoint_tests import DispatchCheckpointTests
+from .dispatch_batch_tests import DispatchBatchTests
+from .upsert_writer_tests import UpsertWriterTests
+from .destination_presence_tests import DestinationPresenceTests
+from .process_pool_encoder_tests import ProcessPoolEncoderTests
+from .payload_compressor_tests import PayloadCompressorTests
+from .reconciler_tests import ReconcilerTests
+from .repair_controller_tests import RepairControllerTests
+from .dispatch_scheduler_tests import DispatchSchedulerTests
+from .return_controller_tests import ReturnControllerTests
+from .dispatch_subject_index_tests import DispatchSubjectIndexTests
+from .dispatch_item_register_tests import DispatchItemRegisterTests
+from .fan_out_writer_tests import FanOutWriterTests
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from ..classes.controller_register import ControllerRegister
+from ..exceptions import AlreadyRegisteredController
+from ..models import DispatchProducerLock
+
+
+class ControllerRegisterTests(TestCase):
+
+    def setUp(self):
+        self.register = ControllerRegister()
+
+    def test_lock_is_exclusive_per_producer(self):
+        self.register.acquire_producer('netbook01', holder='worker1')
+        self.assertRaises(AlreadyRegisteredController,
+                          self.register.acquire_producer, 'netbook01', holder='worker2')
+        # other producers are not affected
+        self.register.acquire_producer('netbook02', holder='worker2')
+        self.assertEqual(DispatchProducerLock.objects.count(), 2)
+
+    def test_lock_is_held_across_registers(self):
+        self.register.acquire_producer('netbook01', holder='worker1')
+        self.assertRaises(AlreadyRegisteredController,
+                          ControllerRegister().acquire_producer, 'netbook01', holder='worker2')
+
+    def test_lock_is_reentrant_for_holder(self):
+        with self.register.producer_lock('netbook01', holder='worker1'):
+            with self.register.producer_lock('netbook01', holder='worker1'):
+                pass
+            self.assertTrue(DispatchProducerLock.objects.filter(producer_name='netbook01').exists())
+        self.assertFalse(DispatchProducerLock.objects.filter(producer_name='netbook01').exists())
+        self.register.acquire_producer('netbook01', holder='worker2')
+
+    def test_expired_lock_is_taken_over(self):
+        DispatchProducerLock.objects.create(
+            producer_name='netbook01', holder='crashed',
+            expires_datetime=datetime.today() - timedelta(seconds=1))
+        self.register.acquire_producer('netbook01', holder='worker1')
+        self.assertEqual(DispatchProducerLock.objects.get(producer_name='netbook01').holder, 'worker1')
+
+    def test_renew_extends_lease_of_holder_only(self):
+        self.register.acquire_producer('netbook01', holder='worker1')
+        DispatchProducerLock.objects.filter(producer_name='netbook01').update(
+            expires_datetime=datetime.today() + timedelta(seconds=1))
+        self.assertFalse(self.register.renew_producer('netbook01', 'worker2'))
+        self.assertTrue(self.register.renew_producer('netbook01', 'worker1'))
+        lock = DispatchProducerLock.objects.get(producer_name='netbook01')
+        self.assertGreater(lock.expires_datetime, datetime.today() + timedelta(seconds=60))
+
+    def test_heartbeat_stops_on_release(self):
+        self.register.acquire_producer('netbook01', holder='worker1')
+        stop = self.register._producer_locks['netbook01']['stop']
+        self.assertFalse(stop.is_set())
+        self.register.release_producer('netbook01', holder='worker1')
+        self.assertTrue(stop.is_set())
+        self.assertNotIn('netbook01', self.register._producer_locks)
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import BaseController, ContainerPayload
+from ..models import DispatchBatch, DispatchCheckpoint, DispatchContainerRegister
+
+
+class DestinationPresenceTests(TestCase):
+
+    multi_db = True
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.controller = BaseController('default', 'dispatch_destination')
+        self.controller.presence_chunk_size = 2
+        for index in range(1, 6):
+            DispatchBatch.objects.create(pk=index, batch_id='batch{0}'.format(index))
+        for index in [2, 3, 5]:
+            DispatchBatch.objects.using('dispatch_destination').create(pk=index, batch_id='batch{0}'.format(index))
+
+    def test_present_pks_in_chunks(self):
+        self.assertEqual(self.controller.get_present_on_destination(DispatchBatch, [1, 2, 3, 4, 5]), set([2, 3, 5]))
+
+    def test_nothing_present(self):
+        DispatchBatch.objects.using('dispatch_destination').all().delete()
+        self.assertEqual(self.controller.get_present_on_destination(DispatchBatch, [1, 2, 3]), set())
+
+    def test_pipeline_pages_do_not_share_foreign_keys_with_the_writer(self):
+        register = DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier='C1',
+            container_pk='C1')
+        for index in range(0, 3):
+            DispatchCheckpoint.objects.create(
+                dispatch_container_register=register, query_hash=str(index),
+                app_label='dispatch', model_name='dispatchbatch')
+        self.controller.pipeline_chunk_size = 2
+        fk_dependencies = OrderedDict()
+        pages = list(self.controller._serialize_pages(
+            DispatchCheckpoint.objects.all(), DispatchCheckpoint, fk_dependencies=fk_dependencies))
+        self.assertEqual([page[2] for page in pages], [2, 1])
+        # the register is sent ahead of the first page only
+        self.assertIn('dispatch.dispatchcontainerregister', pages[0][0])
+        self.assertNotIn('dispatch.dispatchcontainerregister', pages[1][0])
+        self.assertIn((DispatchContainerRegister, register.pk), fk_dependencies)
+        self.assertEqual(self.controller.fk_instances, [])
+        self.assertFalse(self.controller.get_session_container('fk_dependencies'))
+
+    def test_payload_is_saved_by_write_payload(self):
+        payload = ContainerPayload()
+        self.controller.payload = payload
+        # the batch ledger is kept per container and claim
+        self.controller.get_batch_scope = lambda: ('C1', '2015-01-01 00:00:00')
+        recorded = []
+        self.controller._write_to_destination(list(DispatchBatch.objects.filter(pk__in=[1, 4])))
+        payload.on_write(recorded.append, 'recorded')
+        self.assertFalse(DispatchBatch.objects.using('dispatch_destination').filter(pk__in=[1, 4]).exists())
+        self.assertEqual(self.controller.write_payload(), 2)
+        self.assertEqual(recorded, ['recorded'])
+        self.assertEqual(DispatchBatch.objects.using('dispatch_destination').filter(pk__in=[1, 4]).count(), 2)
+        # written again, e.g. for another container, the chunk is skipped by the batch ledger
+        self.assertEqual(self.controller.write_payload(), 0)
+        self.assertIs(self.controller.payload, payload)
+
+    def test_skip_present_is_off_by_default(self):
+        self.assertFalse(self.controller.skip_present)
+        self.assertTrue(BaseController('default', 'dispatch_destination', skip_present=True).skip_present)
@@ -0,0 +1,33 @@
+from django.test import TestCase
+
+from ..models import DispatchBatch
+
+
+class DispatchBatchTests(TestCase):
+
+    def test_batch_id_is_content_hash(self):
+        json_obj = '[{"pk": 1, "model": "dispatch.testcontainer", "fields": {}}]'
+        self.assertEqual(DispatchBatch.objects.batch_id(json_obj), DispatchBatch.objects.batch_id(json_obj))
+        self.assertNotEqual(DispatchBatch.objects.batch_id(json_obj), DispatchBatch.objects.batch_id('[]'))
+
+    def test_record_is_idempotent(self):
+        batch_id = DispatchBatch.objects.batch_id('[]')
+        self.assertFalse(DispatchBatch.objects.is_applied(batch_id))
+        DispatchBatch.objects.record(batch_id, 0)
+        DispatchBatch.objects.record(batch_id, 0)
+        self.assertTrue(DispatchBatch.objects.is_applied(batch_id))
+        self.assertEqual(DispatchBatch.objects.count(), 1)
+
+    def test_batch_id_is_scoped_to_run(self):
+        json_obj = '[{"pk": 1, "model": "dispatch.testcontainer", "fields": {}}]'
+        self.assertNotEqual(DispatchBatch.objects.batch_id(json_obj, 'C1:2015-01-01'),
+                            DispatchBatch.objects.batch_id(json_obj, 'C1:2015-02-01'))
+        self.assertNotEqual(DispatchBatch.objects.batch_id(json_obj, 'C1:2015-01-01'),
+                            DispatchBatch.objects.batch_id(json_obj))
+
+    def test_prune_by_scope(self):
+        DispatchBatch.objects.record('a', 1, scope='C1')
+        DispatchBatch.objects.record('b', 1, scope='C1')
+        DispatchBatch.objects.record('c', 1, scope='C2')
+        self.assertEqual(DispatchBatch.objects.prune(['C1']), 2)
+        self.assertEqual(list(DispatchBatch.objects.values_list('batch_id', flat=True)), ['c'])
@@ -0,0 +1,114 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import DispatchBundleWriter, DispatchBundleReader, PayloadCompressor, PackedRowCodec
+from ..exceptions import DispatchBundleError
+from ..models import DispatchContainerRegister
+
+
+class DispatchBundleTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.path = tempfile.mktemp(suffix='.bundle')
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def create_container_register(self, container_identifier):
+        return DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier=container_identifier,
+            container_pk=container_identifier)
+
+    def write_bundle(self, compressor=None, codec=None):
+        registers = [self.create_container_register('C{0}'.format(n)) for n in range(0, 3)]
+        with DispatchBundleWriter(self.path, self.producer.name, compressor=compressor, codec=codec) as bundle:
+            bundle.set_container('C0')
+            bundle.add([registers[0]])
+            bundle.set_container('C1')
+            # already written instances are skipped
+            bundle.add(registers)
+        return bundle, registers
+
+    def test_write_and_load(self):
+        bundle, registers = self.write_bundle()
+        self.assertEqual(bundle.object_count, 3)
+        self.assertEqual(bundle.segment_count, 2)
+        DispatchContainerRegister.objects.all().delete()
+        with DispatchBundleReader(self.path) as reader:
+            self.assertEqual(reader.load(), 3)
+            self.assertEqual(reader.producer, self.producer.name)
+            self.assertEqual(sorted(reader.containers), ['C0', 'C1'])
+        self.assertEqual(DispatchContainerRegister.objects.filter(
+            pk__in=[register.pk for register in registers]).count(), 3)
+
+    def test_load_one_container_includes_shared_segments(self):
+        self.write_bundle()
+        DispatchContainerRegister.objects.all().delete()
+        with DispatchBundleReader(self.path) as reader:
+            self.assertEqual(reader.segment_numbers(containers=['C0']), [0])
+            self.assertEqual(reader.segment_numbers(containers=['C1']), [0, 1])
+            self.assertEqual(reader.load(containers=['C0']), 1)
+            self.assertRaises(DispatchBundleError, reader.load, containers=['C9'])
+
+    def test_corrupted_segment_is_detected(self):
+        bundle, registers = self.write_bundle()
+        offset = bundle.index['segments'][1]['offset']
+        with open(self.path, 'r+b') as f:
+            f.seek(offset + 2)
+            f.write(b'X')
+        with DispatchBundleReader(self.path) as reader:
+            reader.segment(0)
+            self.assertRaises(DispatchBundleError, reader.segment, 1)
+
+    def test_incomplete_bundle_is_rejected(self):
+        register = self.create_container_register('C0')
+        bundle = DispatchBundleWriter(self.path, self.producer.name)
+        bundle.set_container('C0')
+        bundle.add([register])
+        bundle._file.close()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertRaises(DispatchBundleError, DispatchBundleReader, bundle.partial_path)
+        bundle.abort()
+        self.assertFalse(os.path.exists(bundle.partial_path))
+
+    def test_failed_export_leaves_no_bundle(self):
+        register = self.create_container_register('C0')
+        try:
+            with DispatchBundleWriter(self.path, self.producer.name) as bundle:
+                bundle.set_container('C0')
+                bundle.add([register])
+                raise ValueError('export failed')
+        except ValueError:
+            pass
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(bundle.partial_path))
+
+    def test_compressed_with_dictionary(self):
+        dictionary = PayloadCompressor.train(
+            [b'{"container_app_label": "dispatch", "container_model_name": "testcontainer"}'] * 2)
+        bundle, registers = self.write_bundle(compressor=PayloadCompressor(dictionary))
+        self.assertLess(bundle.stats()['bytes'], bundle.stats()['raw_bytes'])
+        DispatchContainerRegister.objects.all().delete()
+        with DispatchBundleReader(self.path) as reader:
+            self.assertEqual(reader.compressor.dictionary, dictionary)
+            self.assertEqual(reader.load(), 3)
+
+    def test_packed_encoding(self):
+        bundle, registers = self.write_bundle(codec=PackedRowCodec())
+        with DispatchBundleReader(self.path) as reader:
+            self.assertEqual(reader.index['encoding'], 'packed')
+            objects = reader.segment(1)
+            self.assertEqual([obj['pk'] for obj in objects], [registers[1].pk, registers[2].pk])
+            self.assertEqual(objects[0]['fields']['container_identifier'], 'C1')
+            DispatchContainerRegister.objects.all().delete()
+            self.assertEqual(reader.load(), 3)
@@ -0,0 +1,48 @@
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..models import DispatchCheckpoint, DispatchContainerRegister
+
+
+class DispatchCheckpointTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.registers = [self.create_container_register('C{0}'.format(index)) for index in range(0, 4)]
+        self.container_register = self.registers[0]
+
+    def create_container_register(self, container_identifier):
+        return DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier=container_identifier,
+            container_pk=container_identifier)
+
+    def test_same_query_finds_checkpoint(self):
+        queryset = DispatchContainerRegister.objects.filter(producer=self.producer)
+        checkpoint = DispatchCheckpoint.objects.for_queryset(self.container_register, queryset)
+        self.assertEqual(DispatchCheckpoint.objects.for_queryset(
+            self.container_register, DispatchContainerRegister.objects.filter(producer=self.producer)), checkpoint)
+        self.assertNotEqual(DispatchCheckpoint.objects.for_queryset(
+            self.container_register, DispatchContainerRegister.objects.all()), checkpoint)
+
+    def test_resume_after_last_pk(self):
+        queryset = DispatchContainerRegister.objects.all()
+        checkpoint = DispatchCheckpoint.objects.for_queryset(self.container_register, queryset)
+        sent = list(checkpoint.resume(queryset)[:2])
+        checkpoint.advance(len(sent), len(sent), last_pk=sent[-1].pk)
+        checkpoint = DispatchCheckpoint.objects.for_queryset(self.container_register, queryset)
+        self.assertEqual(checkpoint.row_count, 2)
+        self.assertFalse(checkpoint.is_complete)
+        remaining = list(checkpoint.resume(queryset))
+        self.assertEqual(len(remaining), 2)
+        self.assertFalse(set(sent) & set(remaining))
+        checkpoint.advance(len(remaining), len(remaining), last_pk=remaining[-1].pk, is_complete=True)
+        self.assertEqual(DispatchCheckpoint.objects.progress(self.container_register)[0]['chunks'], 2)
+
+    def test_empty_query_has_no_checkpoint(self):
+        self.assertIsNone(DispatchCheckpoint.objects.for_queryset(
+            self.container_register, DispatchContainerRegister.objects.filter(pk__in=[])))
@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..models import DispatchContainerRegister
+
+
+class Container(object):
+
+    def __init__(self, identifier):
+        self.pk = identifier
+        self.test_container_identifier = identifier
+
+
+class DispatchContainerRegisterTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.other_producer = ProducerFactory(name='other_destination', settings_key='other_destination')
+        self.containers = [Container('C{0}'.format(index)) for index in range(0, 3)]
+
+    def claim(self, producer, containers):
+        return DispatchContainerRegister.objects.claim(
+            producer, 'dispatch', 'testcontainer', 'test_container_identifier', containers)
+
+    def test_claim_creates_registers(self):
+        claimed = self.claim(self.producer, self.containers)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(DispatchContainerRegister.objects.filter(
+            producer=self.producer, is_dispatched=True, return_datetime__isnull=True).count(), 3)
+
+    def test_claimed_containers_are_not_claimed_again(self):
+        self.claim(self.producer, self.containers[:2])
+        claimed = self.claim(self.other_producer, self.containers)
+        self.assertEqual([register.container_identifier for register in claimed], ['C2'])
+        self.assertEqual(DispatchContainerRegister.objects.filter(producer=self.producer).count(), 2)
+
+    def test_released_containers_can_be_claimed(self):
+        claimed = self.claim(self.producer, self.containers)
+        DispatchContainerRegister.objects.release(claimed)
+        self.assertEqual(len(self.claim(self.other_producer, self.containers)), 3)
+        self.assertEqual(DispatchContainerRegister.objects.count(), 3)
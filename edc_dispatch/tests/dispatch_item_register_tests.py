@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..exceptions import AlreadyDispatchedItem
+from ..models import DispatchContainerRegister, DispatchItemRegister
+
+
+class DispatchItemRegisterTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.other_producer = ProducerFactory(name='other_destination', settings_key='other_destination')
+        self.dispatch_container_registers = [self.create_container_register(producer, 'C{0}'.format(n))
+                                             for n, producer in enumerate([self.producer, self.other_producer])]
+
+    def create_container_register(self, producer, container_identifier):
+        return DispatchContainerRegister.objects.create(
+            producer=producer,
+            is_dispatched=True,
+            dispatch_datetime=datetime.today(),
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier=container_identifier,
+            container_pk=container_identifier)
+
+    def dispatch_item(self, dispatch_container_register, item_identifier='ITEM1'):
+        return DispatchItemRegister.objects.create(
+            dispatch_container_register=dispatch_container_register,
+            producer=dispatch_container_register.producer,
+            is_dispatched=True,
+            item_app_label='dispatch',
+            item_model_name='TestItem',
+            item_identifier_attrname='test_item_identifier',
+            item_identifier=item_identifier,
+            item_pk=item_identifier)
+
+    def test_dispatched_item_identifier_is_set_while_dispatched(self):
+        dispatch_item_register = self.dispatch_item(self.dispatch_container_registers[0])
+        self.assertEqual(dispatch_item_register.dispatched_item_identifier, 'ITEM1')
+
+    def test_second_active_dispatch_raises(self):
+        self.dispatch_item(self.dispatch_container_registers[0])
+        self.assertRaises(AlreadyDispatchedItem, self.dispatch_item, self.dispatch_container_registers[1])
+        self.assertEqual(DispatchItemRegister.objects.filter(item_identifier='ITEM1').count(), 1)
+        # another item is not affected
+        self.dispatch_item(self.dispatch_container_registers[1], item_identifier='ITEM2')
+
+    def test_dispatch_after_return_on_save(self):
+        dispatch_item_register = self.dispatch_item(self.dispatch_container_registers[0])
+        dispatch_item_register.is_dispatched = False
+        dispatch_item_register.return_datetime = datetime.today()
+        dispatch_item_register.save()
+        self.assertIsNone(DispatchItemRegister.objects.get(pk=dispatch_item_register.pk).dispatched_item_identifier)
+        self.dispatch_item(self.dispatch_container_registers[1])
+        self.assertEqual(DispatchItemRegister.objects.filter(
+            item_identifier='ITEM1', dispatched_item_identifier='ITEM1').count(), 1)
+
+    def test_dispatch_after_return_by_update(self):
+        # as the set-based returns of the ReturnController do
+        self.dispatch_item(self.dispatch_container_registers[0])
+        DispatchItemRegister.objects.filter(item_identifier='ITEM1').update(
+            is_dispatched=False, return_datetime=datetime.today(), dispatched_item_identifier=None)
+        self.dispatch_item(self.dispatch_container_registers[1])
+        self.assertEqual(DispatchItemRegister.objects.filter(item_identifier='ITEM1').count(), 2)
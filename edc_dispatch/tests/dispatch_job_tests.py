@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import DispatchController
+from ..models import DispatchContainerRegister, DispatchJob, DispatchJobContainer
+
+
+class DispatchJobTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.user_containers = [DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier='C{0}'.format(n),
+            container_pk='C{0}'.format(n)) for n in range(0, 3)]
+
+    def enqueue(self):
+        return DispatchJob.objects.enqueue(
+            DispatchController, self.producer, self.user_containers,
+            controller_kwargs={'app_name': 'dispatch'}, dispatch_kwargs={'survey': self.producer})
+
+    def test_enqueue(self):
+        job = self.enqueue()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.controller, 'edc_dispatch.classes.dispatch_controller.DispatchController')
+        self.assertEqual(job.get_controller_kwargs(), {'app_name': 'dispatch'})
+        self.assertEqual(job.get_dispatch_kwargs(), {'survey': self.producer})
+        self.assertEqual(
+            [job_container.container_pk for job_container in DispatchJobContainer.objects.filter(job=job)],
+            [str(user_container.pk) for user_container in self.user_containers])
+
+    def test_claim_once(self):
+        job = self.enqueue()
+        claimed = DispatchJob.objects.claim('worker1')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, 'running')
+        self.assertIsNone(DispatchJob.objects.claim('worker2'))
+
+    def test_progress(self):
+        job = self.enqueue()
+        job = DispatchJob.objects.claim('worker1')
+        DispatchJobContainer.objects.filter(job=job, sequence=0).update(status='dispatched', object_count=10)
+        DispatchJobContainer.objects.filter(job=job, sequence=1).update(status='failed', error='error')
+        progress = job.progress()
+        self.assertEqual((progress['total'], progress['dispatched'], progress['failed'], progress['remaining']),
+                         (3, 1, 1, 1))
+        self.assertEqual(progress['objects'], 10)
+        self.assertEqual([container['status'] for container in progress['containers']],
+                         ['dispatched', 'failed', 'queued'])
+
+    def test_stale_running_job_is_requeued(self):
+        job = self.enqueue()
+        job = DispatchJob.objects.claim('worker1')
+        DispatchJobContainer.objects.filter(job=job, sequence=0).update(status='dispatched')
+        # worker1 is alive
+        self.assertTrue(DispatchJob.objects.heartbeat(job))
+        self.assertEqual(DispatchJob.objects.requeue_stale(timeout=60), 0)
+        self.assertIsNone(DispatchJob.objects.claim('worker2'))
+        # worker1 died
+        DispatchJob.objects.filter(pk=job.pk).update(heartbeat_datetime=datetime.today() - timedelta(seconds=120))
+        with self.settings(DISPATCH_JOB_TIMEOUT=60):
+            claimed = DispatchJob.objects.claim('worker2')
+        self.assertEqual((claimed.pk, claimed.worker, claimed.status), (job.pk, 'worker2', 'running'))
+        self.assertFalse(DispatchJob.objects.heartbeat(job))
+        self.assertEqual(
+            list(DispatchJobContainer.objects.filter(job=job, status='queued').values_list('sequence', flat=True)),
+            [1, 2])
@@ -0,0 +1,117 @@
+import time
+
+from django.test import TransactionTestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import DispatchScheduler
+from ..exceptions import DispatchError
+from ..models import DispatchContainerRegister
+
+
+class Container(object):
+
+    def __init__(self, identifier):
+        self.pk = identifier
+        self.test_container_identifier = identifier
+
+
+class TestDispatchController(object):
+    """Dispatches a container to its payload without reading any models."""
+
+    def __init__(self, using_source, using_destination, user_container, payload=None, lock_holder=None,
+                 fail=None, delays=None, written=None):
+        self.user_container = user_container
+        self.payload = payload
+        self.fail = fail or []
+        self.delay = (delays or {}).get(user_container.test_container_identifier, 0)
+        self.written = written if written is not None else []
+        self.claimed_container_register = None
+
+    def get_user_container_app_label(self):
+        return 'dispatch'
+
+    def get_user_container_model_name(self):
+        return 'testcontainer'
+
+    def get_user_container_identifier_attrname(self):
+        return 'test_container_identifier'
+
+    def get_user_container_identifier(self):
+        return self.user_container.test_container_identifier
+
+    def get_user_container_instance(self):
+        return self.user_container
+
+    def set_claimed_container_register(self, dispatch_container_register):
+        self.claimed_container_register = dispatch_container_register
+
+    def get_dispatch_url(self):
+        return None
+
+    def dispatch(self, **kwargs):
+        if self.get_user_container_identifier() in self.fail:
+            raise DispatchError('Failed to dispatch {0}.'.format(self.get_user_container_identifier()))
+        time.sleep(self.delay)
+        self.payload.add('[]')
+        return 'Successfully dispatched {0}'.format(self.get_user_container_identifier())
+
+    def write_payload(self):
+        self.written.append(self.get_user_container_identifier())
+        return len(self.payload.chunks)
+
+
+class DispatchSchedulerTests(TransactionTestCase):
+
+    # containers are dispatched in worker threads, so the rows must be committed
+    multi_db = True
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.containers = [Container('C{0}'.format(index)) for index in range(0, 3)]
+
+    def scheduler(self, **controller_kwargs):
+        dispatch_scheduler = DispatchScheduler(
+            TestDispatchController, self.producer, self.containers, max_workers=2,
+            controller_kwargs=controller_kwargs)
+        dispatch_scheduler.has_outgoing_transactions = lambda: False
+        return dispatch_scheduler
+
+    def test_containers_are_claimed_in_one_batch(self):
+        self.scheduler().run()
+        self.assertEqual(DispatchContainerRegister.objects.filter(
+            producer=self.producer, is_dispatched=True).count(), 3)
+
+    def test_failed_containers_are_released(self):
+        results = self.scheduler(fail=['C1']).run()
+        self.assertEqual([error is None for _, _, error in results], [True, False, True])
+        self.assertEqual(
+            sorted(DispatchContainerRegister.objects.filter(is_dispatched=True).values_list(
+                'container_identifier', flat=True)), ['C0', 'C2'])
+        self.assertTrue(DispatchContainerRegister.objects.get(container_identifier='C1').return_datetime)
+
+    def test_containers_are_written_in_order(self):
+        written = []
+        called = []
+        # the first container is collected last
+        results = self.scheduler(delays={'C0': 0.3, 'C1': 0.1}, written=written).run(
+            callback=lambda user_container, msg, error, timing: called.append(user_container.pk))
+        self.assertEqual(written, ['C0', 'C1', 'C2'])
+        self.assertEqual(called, ['C0', 'C1', 'C2'])
+        self.assertEqual([user_container.pk for user_container, _, _ in results], ['C0', 'C1', 'C2'])
+
+    def test_failure_is_reported_to_callback(self):
+        written = []
+        called = []
+
+        def callback(user_container, msg, error, timing):
+            called.append((user_container.pk, msg, error, timing))
+
+        self.scheduler(fail=['C1'], written=written).run(callback=callback)
+        self.assertEqual(written, ['C0', 'C2'])
+        self.assertEqual([pk for pk, _, _, _ in called], ['C0', 'C1', 'C2'])
+        pk, msg, error, timing = called[1]
+        self.assertIsNone(msg)
+        self.assertIsInstance(error, DispatchError)
+        self.assertIsNone(timing)
+        self.assertEqual(called[2][3], ('C2', 1, called[2][3][2]))
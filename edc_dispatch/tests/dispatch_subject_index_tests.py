@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import ReturnController, registered_controllers
+from ..classes.base_dispatch import BaseDispatch
+from ..models import DispatchBatch, DispatchContainerRegister, DispatchItemRegister, DispatchSubjectIndex
+
+
+class DispatchSubjectIndexTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.dispatch_container_register = DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            is_dispatched=True,
+            dispatch_datetime=datetime.today(),
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier='C1',
+            container_pk='C1')
+        self.dispatch_item_registers = [self.create_item_register(index) for index in range(1, 4)]
+        # a controller without a user container, enough to index the subjects
+        self.controller = BaseDispatch.__new__(BaseDispatch)
+        self.controller._subject_index = {}
+        self.controller.get_using_source = lambda: 'default'
+
+    def create_item_register(self, index):
+        DispatchBatch.objects.create(pk=index, batch_id='item{0}'.format(index))
+        return DispatchItemRegister.objects.create(
+            dispatch_container_register=self.dispatch_container_register,
+            producer=self.producer,
+            is_dispatched=True,
+            item_app_label='dispatch',
+            item_model_name='DispatchBatch',
+            item_identifier_attrname='batch_id',
+            item_identifier='item{0}'.format(index),
+            item_pk=str(index))
+
+    def index_subjects(self):
+        self.controller._index_subjects(self.dispatch_item_registers[0], ['S1', 'S1'])
+        self.controller._index_subjects(self.dispatch_item_registers[1], ['S1', 'S2'])
+        self.controller._index_subjects(self.dispatch_item_registers[2], [])
+        self.controller.flush_subject_index()
+
+    def test_index_is_written_on_flush(self):
+        self.controller._index_subjects(self.dispatch_item_registers[0], ['S1'])
+        self.assertEqual(DispatchSubjectIndex.objects.count(), 0)
+        self.controller.flush_subject_index()
+        self.assertEqual(DispatchSubjectIndex.objects.count(), 1)
+        self.assertEqual(self.controller._subject_index, {})
+
+    def test_flush_replaces_index_of_registered_items(self):
+        self.index_subjects()
+        self.assertEqual(DispatchSubjectIndex.objects.count(), 3)
+        self.controller._index_subjects(self.dispatch_item_registers[1], ['S3'])
+        self.controller.flush_subject_index()
+        self.assertEqual(sorted(DispatchSubjectIndex.objects.values_list('subject_identifier', flat=True)),
+                         ['S1', 'S3'])
+
+    def test_is_dispatched_to_producer(self):
+        self.index_subjects()
+        self.assertEqual(DispatchSubjectIndex.objects.is_dispatched_to_producer('S2'), (True, self.producer))
+        self.assertEqual(DispatchSubjectIndex.objects.is_dispatched_to_producer('S9'), (False, None))
+
+    def test_subject_is_not_dispatched_once_returned(self):
+        self.index_subjects()
+        return_controller = ReturnController('default', 'dispatch_destination')
+        return_controller.has_outgoing_transactions = lambda: False
+        return_controller.has_incoming_transactions = lambda: False
+        try:
+            return_controller._return_by_queryset(DispatchBatch.objects.filter(pk=2))
+        finally:
+            registered_controllers.deregister(return_controller)
+        self.assertEqual(DispatchSubjectIndex.objects.is_dispatched_to_producer('S2'), (False, None))
+        # item 1 is still dispatched
+        self.assertEqual(DispatchSubjectIndex.objects.is_dispatched_to_producer('S1'), (True, self.producer))
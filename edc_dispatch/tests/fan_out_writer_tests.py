@@ -0,0 +1,32 @@
+from django.test import TransactionTestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import FanOutWriter
+from ..models import DispatchBatch
+
+
+class FanOutWriterTests(TransactionTestCase):
+
+    # producers are written in worker threads, so the rows must be committed
+    multi_db = True
+
+    def setUp(self):
+        ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        for index in range(1, 4):
+            DispatchBatch.objects.create(pk=index, batch_id='batch{0}'.format(index))
+        self.writer = FanOutWriter(['dispatch_destination'])
+        self.writer.add(list(DispatchBatch.objects.all().order_by('pk')), model_cls=DispatchBatch)
+
+    def test_write(self):
+        status = self.writer.write()
+        self.assertEqual(status['dispatch_destination']['saved'], 3)
+        self.assertEqual(DispatchBatch.objects.using('dispatch_destination').count(), 3)
+
+    def test_integrity_error_rolls_back_the_producer(self):
+        # batch_id is unique, so the last instance fails to save
+        DispatchBatch.objects.using('dispatch_destination').create(pk=100, batch_id='batch3')
+        status = self.writer.write()
+        self.assertIn('error', status['dispatch_destination'])
+        self.assertEqual(list(DispatchBatch.objects.using('dispatch_destination').values_list('pk', flat=True)),
+                         [100])
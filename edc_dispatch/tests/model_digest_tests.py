@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase, TestCase
+
+from ..classes import ModelDigest
+from ..models import DispatchBatch, DispatchItemRegister
+
+
+class ModelDigestTests(SimpleTestCase):
+
+    def digest(self, rows, **kwargs):
+        model_digest = ModelDigest(DispatchItemRegister, 'default', method='python', **kwargs)
+        model_digest._row_digests = dict(
+            (pk, model_digest.hash_values(values)) for pk, values in rows.items())
+        return model_digest
+
+    def test_same_rows_same_root(self):
+        rows = dict(('pk{0}'.format(n), ['pk{0}'.format(n), 'value', n]) for n in range(0, 100))
+        source, destination = self.digest(rows), self.digest(dict(rows))
+        self.assertEqual(source.root, destination.root)
+        self.assertEqual(source.compare(destination), {'diverged': [], 'missing': [], 'extra': []})
+
+    def test_compare_finds_diverged_missing_and_extra(self):
+        rows = dict(('pk{0}'.format(n), ['pk{0}'.format(n), 'value', n]) for n in range(0, 100))
+        other_rows = dict(rows)
+        other_rows['pk1'] = ['pk1', 'changed', 1]
+        del other_rows['pk2']
+        other_rows['pk100'] = ['pk100', 'value', 100]
+        source, destination = self.digest(rows), self.digest(other_rows)
+        self.assertNotEqual(source.root, destination.root)
+        self.assertEqual(source.compare(destination), {'diverged': ['pk1'], 'missing': ['pk2'], 'extra': ['pk100']})
+
+    def test_compare_requires_same_bucket_count(self):
+        self.assertRaises(ValueError, self.digest({}).compare, self.digest({}, bucket_count=16))
+
+
+class DatabaseModelDigestTests(TestCase):
+
+    multi_db = True
+
+    def setUp(self):
+        for using in ['default', 'dispatch_destination']:
+            for index in range(1, 50):
+                DispatchBatch.objects.using(using).create(pk=index, batch_id='batch{0}'.format(index))
+
+    def digest(self, using):
+        return ModelDigest(DispatchBatch, using, bucket_count=16, method='database',
+                           exclude_fields=['applied_datetime'])
+
+    def test_same_rows_same_root(self):
+        self.assertEqual(self.digest('default').root, self.digest('dispatch_destination').root)
+
+    def test_compare_finds_diverged_missing_and_extra(self):
+        DispatchBatch.objects.using('dispatch_destination').filter(pk=1).update(object_count=5)
+        DispatchBatch.objects.using('dispatch_destination').filter(pk=2).delete()
+        DispatchBatch.objects.using('dispatch_destination').create(pk=100, batch_id='batch100')
+        self.assertEqual(self.digest('default').compare(self.digest('dispatch_destination')),
+                         {'diverged': ['1'], 'missing': ['2'], 'extra': ['100']})
+
+    def test_compare_falls_back_to_python_for_different_vendors(self):
+        DispatchBatch.objects.using('dispatch_destination').filter(pk=1).update(object_count=5)
+        destination_digest = self.digest('dispatch_destination')
+        destination_digest.vendor = 'other'
+        # the bucket digests of the database method are not compared
+        destination_digest._bucket_digests = {}
+        self.assertEqual(self.digest('default').compare(destination_digest),
+                         {'diverged': ['1'], 'missing': [], 'extra': []})
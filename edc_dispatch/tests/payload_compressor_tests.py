@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from ..classes import PayloadCompressor
+
+
+class PayloadCompressorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.samples = [
+            ('[{{"pk": "{0}", "model": "bcpp_household.household", "fields": '
+             '{{"household_identifier": "H{0}", "hostname_created": "netbook01"}}}}]').format(n).encode('utf-8')
+            for n in range(0, 20)]
+
+    def test_round_trip_with_dictionary(self):
+        dictionary = PayloadCompressor.train(self.samples)
+        compressor = PayloadCompressor(dictionary)
+        self.assertEqual(compressor.method, PayloadCompressor.PRIMED_METHOD)
+        for sample in self.samples:
+            compressed = compressor.compress(sample)
+            # a new compressor, as on the other end, with the same dictionary
+            self.assertEqual(PayloadCompressor(dictionary).decompress(compressed), sample)
+            self.assertLess(len(compressed), len(PayloadCompressor().compress(sample)))
+
+    def test_round_trip_without_dictionary(self):
+        compressor = PayloadCompressor()
+        self.assertEqual(compressor.method, PayloadCompressor.METHOD)
+        self.assertEqual(compressor.decompress(compressor.compress(self.samples[0])), self.samples[0])
@@ -0,0 +1,41 @@
+from django.test import SimpleTestCase
+
+from ..classes import Pipeline
+
+
+class PipelineTests(SimpleTestCase):
+
+    def test_items_consumed_in_order(self):
+        consumed = []
+        self.assertEqual(Pipeline(depth=2).run(iter(range(0, 10)), consumed.append), 10)
+        self.assertEqual(consumed, list(range(0, 10)))
+
+    def test_reader_is_bounded_by_depth(self):
+        read = []
+
+        def items():
+            for n in range(0, 10):
+                read.append(n)
+                yield n
+
+        def consume(item):
+            # the reader may be at most depth items plus the one it is putting ahead
+            self.assertLessEqual(len(read) - item, 4)
+
+        Pipeline(depth=2).run(items(), consume)
+
+    def test_reader_error_is_raised(self):
+        def items():
+            yield 1
+            raise ValueError('source failed')
+
+        self.assertRaises(ValueError, Pipeline().run, items(), lambda item: None)
+
+    def test_consumer_error_stops_reader(self):
+        def consume(item):
+            raise ValueError('destination failed')
+
+        self.assertRaises(ValueError, Pipeline(depth=1).run, iter(range(0, 1000)), consume)
+
+    def test_empty_items(self):
+        self.assertEqual(Pipeline().run(iter([]), lambda item: None), 0)
@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import BaseController, ProcessPoolEncoder
+from ..models import DispatchBatch
+
+
+class ProcessPoolEncoderTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        for index in range(1, 8):
+            DispatchBatch.objects.create(pk=index, batch_id='batch{0}'.format(index))
+
+    def test_pk_ranges_of_model(self):
+        encoder = ProcessPoolEncoder(DispatchBatch, chunk_size=3)
+        self.assertEqual(encoder.pk_ranges(), [(1, 3, None), (4, 6, None), (7, 7, None)])
+
+    def test_pk_ranges_of_queryset(self):
+        encoder = ProcessPoolEncoder(
+            DispatchBatch, chunk_size=2, queryset=DispatchBatch.objects.filter(pk__in=[2, 3, 6]))
+        self.assertEqual(encoder.pk_ranges(), [(2, 3, [2, 3]), (6, 6, [6])])
+
+    def test_use_process_pool(self):
+        controller = BaseController('default', 'dispatch_destination', process_pool_threshold=5)
+        queryset = DispatchBatch.objects.all()
+        # a test case runs in a transaction
+        self.assertFalse(controller.use_process_pool(queryset))
+        controller.process_pool_threshold = None
+        self.assertFalse(controller.use_process_pool(queryset))
+
+    def test_use_pipeline(self):
+        controller = BaseController('default', 'dispatch_destination', pipeline_depth=2)
+        queryset = DispatchBatch.objects.all()
+        # a test case runs in a transaction, the reader thread would not see its rows
+        self.assertFalse(controller.use_pipeline(queryset))
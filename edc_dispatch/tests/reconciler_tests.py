@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from django.test import TransactionTestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import Reconciler
+from ..models import DispatchBatch, DispatchContainerRegister, DispatchItemRegister
+
+
+class ReconcilerTests(TransactionTestCase):
+
+    # producers are reconciled in worker threads, so the rows must be committed
+    multi_db = True
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        dispatch_container_register = DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier='C1',
+            container_pk='C1')
+        for index in range(1, 6):
+            DispatchBatch.objects.create(pk=index, batch_id='batch{0}'.format(index))
+            DispatchItemRegister.objects.create(
+                dispatch_container_register=dispatch_container_register,
+                producer=self.producer,
+                is_dispatched=index != 4,
+                return_datetime=datetime.today() if index == 4 else None,
+                item_app_label='dispatch',
+                item_model_name='DispatchBatch',
+                item_identifier_attrname='batch_id',
+                item_identifier='batch{0}'.format(index),
+                item_pk=str(index))
+        for index in [1, 2, 5, 6]:
+            DispatchBatch.objects.using('dispatch_destination').create(pk=index, batch_id='batch{0}'.format(index))
+
+    def test_reconcile_dispatched_items_only(self):
+        summary = Reconciler(['dispatch_destination'], max_workers=2, chunk_size=2).reconcile()
+        model_summary = summary['dispatch_destination']['models']['dispatch.DispatchBatch']
+        # item 4 was returned so is neither found nor missing
+        self.assertEqual((model_summary['found'], model_summary['missing']), (3, 1))
+        self.assertEqual(model_summary['missing_pks'], ['3'])
+        self.assertEqual(model_summary['extra'], 0)
+
+    def test_reconcile_extra(self):
+        summary = Reconciler(['dispatch_destination'], extra=True).reconcile()
+        self.assertEqual(summary['dispatch_destination']['models']['dispatch.DispatchBatch']['extra_pks'], ['6'])
+
+    def test_failed_producer_does_not_stop_others(self):
+        summary = Reconciler(['dispatch_destination', 'unknown_producer'], max_workers=2).reconcile()
+        self.assertEqual(summary['dispatch_destination']['found'], 3)
+        self.assertIn('error', summary['unknown_producer'])
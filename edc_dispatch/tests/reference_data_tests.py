@@ -0,0 +1,40 @@
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import ReferenceData
+from ..models import DispatchContainerRegister, ReferenceDataVersion
+
+
+class ReferenceDataTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.reference_data = ReferenceData('default')
+        # treat a dispatch model as reference data for the test
+        self.reference_data.reference_base_models = (DispatchContainerRegister, )
+
+    def create_container_register(self, container_identifier):
+        return DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier=container_identifier,
+            container_pk=container_identifier)
+
+    def test_not_current_until_recorded(self):
+        self.create_container_register('C0')
+        self.assertFalse(self.reference_data.is_current(DispatchContainerRegister, 'default'))
+        self.reference_data.record(DispatchContainerRegister, 'default')
+        self.assertTrue(self.reference_data.is_current(DispatchContainerRegister, 'default'))
+        self.assertEqual(ReferenceDataVersion.objects.get(model_name='DispatchContainerRegister').row_count, 1)
+
+    def test_version_changes_with_content(self):
+        self.create_container_register('C0')
+        version = self.reference_data.version(DispatchContainerRegister)[0]
+        self.create_container_register('C1')
+        self.assertNotEqual(ReferenceData('default').version(DispatchContainerRegister)[0], version)
+
+    def test_other_models_are_never_current(self):
+        self.assertFalse(ReferenceData('default').is_current(DispatchContainerRegister, 'default'))
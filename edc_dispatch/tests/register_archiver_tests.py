@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import RegisterArchiver
+from ..models import (DispatchItemRegister, DispatchContainerRegister,
+                      DispatchItemRegisterArchive, DispatchContainerRegisterArchive)
+
+
+class RegisterArchiverTests(TestCase):
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+
+    def create_registers(self, container_identifier, return_datetime, item_count=3):
+        dispatch_container_register = DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            is_dispatched=False,
+            return_datetime=return_datetime,
+            container_app_label='dispatch',
+            container_model_name='testcontainer',
+            container_identifier_attrname='test_container_identifier',
+            container_identifier=container_identifier,
+            container_pk=container_identifier)
+        for n in range(0, item_count):
+            DispatchItemRegister.objects.create(
+                dispatch_container_register=dispatch_container_register,
+                producer=self.producer,
+                is_dispatched=False,
+                return_datetime=return_datetime,
+                item_app_label='dispatch',
+                item_model_name='TestItem',
+                item_identifier_attrname='id',
+                item_identifier='{0}-{1}'.format(container_identifier, n),
+                item_pk='{0}-{1}'.format(container_identifier, n))
+        return dispatch_container_register
+
+    def test_archives_only_old_returned_rows(self):
+        old = self.create_registers('OLD', datetime.today() - timedelta(days=100))
+        recent = self.create_registers('RECENT', datetime.today() - timedelta(days=1))
+        archived = RegisterArchiver(archive_after_days=90, batch_size=2).archive()
+        self.assertEqual(archived, {'items': 3, 'containers': 1})
+        self.assertFalse(DispatchContainerRegister.objects.filter(pk=old.pk).exists())
+        self.assertTrue(DispatchContainerRegister.objects.filter(pk=recent.pk).exists())
+        self.assertEqual(DispatchItemRegister.objects.filter(dispatch_container_register=recent).count(), 3)
+        self.assertEqual(DispatchItemRegisterArchive.objects.filter(
+            dispatch_container_register_pk=old.pk).count(), 3)
+        self.assertEqual(DispatchContainerRegisterArchive.objects.get(pk=old.pk).container_identifier, 'OLD')
+
+    def test_keeps_container_with_active_items(self):
+        old = self.create_registers('OLD', datetime.today() - timedelta(days=100))
+        item = DispatchItemRegister.objects.filter(dispatch_container_register=old)[0]
+        item.is_dispatched = True
+        item.return_datetime = None
+        item.save()
+        archived = RegisterArchiver(archive_after_days=90).archive()
+        self.assertEqual(archived, {'items': 2, 'containers': 0})
+        self.assertTrue(DispatchContainerRegister.objects.filter(pk=old.pk).exists())
@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import RepairController
+from ..models import DispatchBatch, RepairHistory
+
+
+class RepairControllerTests(TestCase):
+
+    multi_db = True
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        for index in range(1, 4):
+            DispatchBatch.objects.create(pk=index, batch_id='batch{0}'.format(index))
+            DispatchBatch.objects.using('dispatch_destination').create(pk=index, batch_id='batch{0}'.format(index))
+        self.repair_controller = RepairController('default', 'dispatch_destination')
+
+    def summary(self, missing_pks=None, diverged_pks=None):
+        return {'models': {'dispatch.DispatchBatch': {'missing_pks': missing_pks or [],
+                                                      'diverged_pks': diverged_pks or []}}}
+
+    def test_repair_is_not_skipped_by_batch_ledger(self):
+        for _ in range(0, 2):
+            # the same row, hence the same chunk, is deleted and repaired twice
+            DispatchBatch.objects.using('dispatch_destination').filter(pk=2).delete()
+            self.assertEqual(self.repair_controller.repair(self.summary(missing_pks=['2'])),
+                             {'dispatch.DispatchBatch': 1})
+            self.assertEqual(DispatchBatch.objects.using('dispatch_destination').get(pk=2).batch_id, 'batch2')
+
+    def test_repair_restores_missing_and_diverged_rows(self):
+        DispatchBatch.objects.using('dispatch_destination').filter(pk=1).delete()
+        DispatchBatch.objects.using('dispatch_destination').filter(pk=3).update(object_count=99)
+        repaired = self.repair_controller.repair(self.summary(missing_pks=['1'], diverged_pks=['3']))
+        self.assertEqual(repaired, {'dispatch.DispatchBatch': 2})
+        self.assertEqual(DispatchBatch.objects.using('dispatch_destination').get(pk=1).batch_id, 'batch1')
+        self.assertEqual(DispatchBatch.objects.using('dispatch_destination').get(pk=3).object_count, 0)
+        repair_history = RepairHistory.objects.get(producer=self.producer)
+        self.assertEqual((repair_history.item_app_label, repair_history.item_model_name), ('dispatch', 'DispatchBatch'))
+        self.assertEqual((repair_history.missing_pks, repair_history.diverged_pks, repair_history.repaired),
+                         ('1', '3', 2))
+
+    def test_nothing_to_repair(self):
+        self.assertEqual(self.repair_controller.repair(self.summary()), {})
+        self.assertFalse(RepairHistory.objects.exists())
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from edc.device.sync.tests.factories import ProducerFactory
+
+from ..classes import ReturnController, registered_controllers
+from ..exceptions import AlreadyReturned
+from ..models import DispatchBatch, DispatchContainerRegister, DispatchItemRegister
+
+
+class ReturnControllerTests(TestCase):
+    """Tests the set-based returns. DispatchBatch stands in for both the
+    user container and the item models."""
+
+    multi_db = True
+
+    def setUp(self):
+        self.producer = ProducerFactory(name='dispatch_destination', settings_key='dispatch_destination')
+        self.containers = [DispatchBatch.objects.create(pk=index, batch_id='container{0}'.format(index))
+                           for index in range(1, 3)]
+        self.items = [DispatchBatch.objects.create(pk=index, batch_id='item{0}'.format(index))
+                      for index in range(11, 15)]
+        # items 11, 12 in container 1, items 13, 14 in container 2
+        self.dispatch_container_registers = [self.create_registers(container, self.items[n * 2:n * 2 + 2])
+                                             for n, container in enumerate(self.containers)]
+        self.return_controller = ReturnController('default', 'dispatch_destination')
+        self.return_controller.has_outgoing_transactions = lambda: False
+        self.return_controller.has_incoming_transactions = lambda: False
+        # skip locking the containers on the producer
+        self.return_controller._to_json = lambda *args, **kwargs: None
+
+    def tearDown(self):
+        registered_controllers.deregister(self.return_controller)
+
+    def create_registers(self, container, items):
+        dispatch_container_register = DispatchContainerRegister.objects.create(
+            producer=self.producer,
+            is_dispatched=True,
+            dispatch_datetime=datetime.today(),
+            container_app_label='dispatch',
+            container_model_name='dispatchbatch',
+            container_identifier_attrname='batch_id',
+            container_identifier=container.batch_id,
+            container_pk=str(container.pk))
+        for item in items:
+            DispatchItemRegister.objects.create(
+                dispatch_container_register=dispatch_container_register,
+                producer=self.producer,
+                is_dispatched=True,
+                item_app_label='dispatch',
+                item_model_name='DispatchBatch',
+                item_identifier_attrname='batch_id',
+                item_identifier=item.batch_id,
+                item_pk=str(item.pk))
+        return dispatch_container_register
+
+    def dispatched_containers(self):
+        return sorted(DispatchContainerRegister.objects.filter(is_dispatched=True).values_list(
+            'container_identifier', flat=True))
+
+    def test_return_by_queryset_returns_emptied_containers(self):
+        self.return_controller._return_by_queryset(DispatchBatch.objects.filter(pk__in=[11, 12, 13]))
+        self.assertEqual(DispatchItemRegister.objects.filter(is_dispatched=True).count(), 1)
+        self.assertEqual(DispatchItemRegister.objects.filter(
+            is_dispatched=False, return_datetime__isnull=False, dispatched_item_identifier__isnull=True).count(), 3)
+        self.assertEqual(self.dispatched_containers(), ['container2'])
+
+    def test_return_by_queryset_raises_for_items_not_dispatched(self):
+        DispatchItemRegister.objects.filter(item_pk='12').update(is_dispatched=False, return_datetime=datetime.today())
+        self.assertRaises(DispatchItemRegister.DoesNotExist, self.return_controller._return_by_queryset,
+                          DispatchBatch.objects.filter(pk__in=[11, 12]))
+        # nothing is returned
+        self.assertEqual(DispatchItemRegister.objects.filter(item_pk='11', is_dispatched=True).count(), 1)
+        self.assertEqual(self.dispatched_containers(), ['container1', 'container2'])
+
+    def test_return_by_user_containers(self):
+        returned = self.return_controller._return_by_user_containers(self.containers)
+        self.assertEqual(sorted([register.pk for register in returned]),
+                         sorted([register.pk for register in self.dispatch_container_registers]))
+        self.assertEqual(DispatchItemRegister.objects.filter(is_dispatched=True).count(), 0)
+        self.assertEqual(self.dispatched_containers(), [])
+
+    def test_return_by_user_containers_raises_if_already_returned(self):
+        self.return_controller._return_by_user_containers(self.containers[:1])
+        self.assertRaises(AlreadyReturned, self.return_controller._return_by_user_containers, self.containers)
+        self.assertEqual(self.dispatched_containers(), ['container2'])
+
+    def test_user_containers_for_registers(self):
+        user_containers = self.return_controller.get_user_containers_for_registers(
+            self.dispatch_container_registers)
+        self.assertEqual(sorted([user_container.pk for user_container in user_containers]), [1, 2])
@@ -0,0 +1,23 @@
+from django.test import TestCase
+
+from ..classes import UpsertWriter
+from ..models import DispatchBatch
+
+
+class UpsertWriterTests(TestCase):
+
+    def test_inserts_then_updates(self):
+        writer = UpsertWriter('default')
+        batches = [DispatchBatch(pk=index, batch_id='batch{0}'.format(index), object_count=1)
+                   for index in range(1, 4)]
+        writer.write(batches[:2])
+        for batch in batches:
+            batch.object_count = 2
+        writer.write(batches)
+        self.assertEqual(DispatchBatch.objects.count(), 3)
+        self.assertEqual(DispatchBatch.objects.filter(object_count=2).count(), 3)
+
+    def test_one_statement_per_model_run(self):
+        writer = UpsertWriter('default')
+        writer.write([DispatchBatch(pk=index, batch_id='batch{0}'.format(index)) for index in range(1, 50)])
+        self.assertEqual(writer.statement_count, 1)
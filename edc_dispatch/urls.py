@@ -1,9 +1,10 @@
 from django.conf.urls import patterns, url
 
-from .views import return_items
+from .views import return_items, dispatch_job_status
 
 urlpatterns = patterns('',
     url(r'^return/', return_items),
+    url(r'^job/(?P<job_id>[\w-]+)/status/', dispatch_job_status, name='dispatch_job_status'),
     url(r'^return/(?P<identifier>\w+)/', 'return_households', name='return_household'),
     url(r'^return/(?P<identifier>\w+)/', 'return_households', name='return_household'),
     )
@@ -1,2 +1,3 @@
 from .dispatch import dispatch
 from .return_items import return_items
+from .dispatch_job_status import dispatch_job_status
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.db.models import get_model, get_models
@@ -9,10 +11,10 @@ from edc.device.dispatch.exceptions import (AlreadyDispatchedContainer, AlreadyD
 from edc.device.sync.exceptions import PendingTransactionError
 from edc.device.sync.models import Producer
 
-from ..classes import DispatchController
+from ..classes import DispatchController, DispatchScheduler
 from ..exceptions import DispatchAttributeError
 from ..forms import DispatchForm
-from ..models import DispatchItemRegister
+from ..models import DispatchItemRegister, DispatchJob
 
 
 @login_required
@@ -69,13 +71,9 @@ def dispatch(request, dispatch_controller_cls, dispatch_form_cls=None, **kwargs)
                     if plot_list_status == 'not_allocated':
                         if not producer.settings_key:
                             raise DispatchAttributeError('Producer attribute settings_key may not be None.')
-                        for user_container in user_containers:
-                            dispatch_controller = dispatch_controller_cls(
-                                'default', producer.settings_key, user_container, **kwargs)
-                            msg = dispatch_controller.dispatch(survey=survey)
-                            messages.add_message(request, messages.SUCCESS, msg)
-                        if dispatch_controller:
-                            dispatch_url = dispatch_controller.get_dispatch_url()
+                        dispatch_url = dispatch_containers(
+                            request, dispatch_controller_cls, producer, user_containers,
+                            user_container_model_name, survey, **kwargs)
                     else:
                         user_container_ct = request.POST.get('ct1')
                         user_containers = user_container_model_cls.objects.filter(pk__in=pks)
@@ -137,3 +135,30 @@ def dispatch(request, dispatch_controller_cls, dispatch_form_cls=None, **kwargs)
         'app_name': app_name,
         'notebook_plot_list': notebook_plot_list_status
         })
+
+
+def dispatch_containers(request, dispatch_controller_cls, producer, user_containers,
+                        user_container_model_name, survey, **kwargs):
+    """Queues a :class:`DispatchJob` if settings.DISPATCH_JOBS, otherwise dispatches the
+    containers with a :class:`DispatchScheduler`, and returns the dispatch url or ''."""
+    if getattr(settings, 'DISPATCH_JOBS', False):
+        # dispatched by the run_dispatch_worker command
+        job = DispatchJob.objects.enqueue(
+            dispatch_controller_cls, producer, user_containers,
+            controller_kwargs=kwargs, dispatch_kwargs={'survey': survey},
+            user=request.user.username)
+        messages.add_message(request, messages.INFO, (
+            'Queued dispatch of {0} {1} to {2}. Progress at {3}.').format(
+                len(user_containers), user_container_model_name, producer.name,
+                reverse('dispatch_job_status', kwargs={'job_id': job.pk})))
+        return ''
+    # containers are read and serialized concurrently, then written in order
+    dispatch_scheduler = DispatchScheduler(
+        dispatch_controller_cls, producer, user_containers,
+        controller_kwargs=kwargs, dispatch_kwargs={'survey': survey})
+    for user_container, msg, error in dispatch_scheduler.run():
+        if error:
+            messages.add_message(request, messages.ERROR, '{0}: {1}'.format(user_container, str(error)))
+        else:
+            messages.add_message(request, messages.SUCCESS, msg)
+    return dispatch_scheduler.dispatch_url or ''
@@ -0,0 +1,13 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from ..models import DispatchJob
+
+
+@login_required
+def dispatch_job_status(request, job_id, **kwargs):
+    """Returns the progress of a dispatch job as json: per-container status,
+    counts, throughput and ETA. See :func:`DispatchJob.progress`."""
+    job = get_object_or_404(DispatchJob.objects.select_related('producer'), pk=job_id)
+    return JsonResponse(job.progress())
@@ -24,6 +24,7 @@ setup(
     keywords='django bhp-edc',
     install_requires=[
         'edc-base>=0.1',
+        'futures; python_version < "3.0"',
     ],
     classifiers=[
         'Environment :: Web Environment',